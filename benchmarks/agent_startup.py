@@ -0,0 +1,48 @@
+"""Measures the per-trial agent startup overhead that long-lived workers (-workers) save: launching a new agent process per trial (interpreter, imports, OpenAI client, browser) versus dispatching a job to a worker that is already running.
+
+Both arms run no-op jobs, so only startup and dispatch are timed. The default agent needs playwright and openai installed; -module=evaluation.agents.mock.mock measures the interpreter alone.
+
+Usage: python -m benchmarks.agent_startup -trials=10 -module=evaluation.agent
+"""
+
+import sys
+import time
+
+from benchmarks.utils import parse_args, percentile
+from evaluation.utils import AgentWorker
+
+
+def time_trial(worker: AgentWorker) -> float:
+    start = time.perf_counter()
+    worker.run(None, None).wait()
+    return time.perf_counter() - start
+
+
+def report(name: str, durations: list[float]):
+    print(
+        f"  {name:<16} mean {sum(durations) / len(durations) * 1000:>8.1f}ms"
+        + f"   p50 {percentile(durations, 50) * 1000:>8.1f}ms"
+        + f"   max {max(durations) * 1000:>8.1f}ms"
+    )
+
+
+if __name__ == "__main__":
+    args = parse_args(sys.argv[1:], {"trials": 10, "module": "evaluation.agent"})
+    print(f"{args['trials']} trials of {args['module']}")
+
+    # A new process per trial, as without -workers
+    spawned = []
+    for _ in range(args["trials"]):
+        worker = AgentWorker(args["module"])
+        spawned.append(time_trial(worker))
+        worker.close()
+
+    # One worker for all trials; the first trial pays for its startup
+    worker = AgentWorker(args["module"])
+    reused = [time_trial(worker) for _ in range(args["trials"])]
+    worker.close()
+
+    report("new process", spawned)
+    report("worker", reused)
+    saved = (sum(spawned) - sum(reused)) / args["trials"]
+    print(f"  saved per trial  {saved * 1000:.1f}ms")
@@ -0,0 +1,119 @@
+"""Compares evaluating the runs of a large log one by one (evaluate_run, as evaluate_runs does) with evaluating them together over columns (evaluate_blocks, as with -batch; see evaluation/batch.py).
+
+The synthetic log has -runs= runs of the individual tests. Each run's logs are built from its test's evaluators, with some fields changed, logs dropped or extra logs added, so that many of them fail. Both ways are timed on the blocks already read, and reading them from the log as well (evaluate_runs), and must give the same results. Without NumPy, the batch evaluates every run one by one.
+
+Usage: python -m benchmarks.eval_batch -runs=100000
+"""
+
+import os
+import random
+import sys
+import tempfile
+import time
+
+from benchmarks.utils import parse_args
+from evaluation import batch
+from evaluation.evaluators import AllLog, LogEvaluator
+from evaluation.ind import (
+    evaluate_blocks,
+    evaluate_run,
+    evaluate_runs,
+    get_all_tests_and_metadatas,
+    get_test_key,
+)
+from evaluation.utils import parse_test_blocks, read_log_lines
+
+
+def get_fields(evaluator: LogEvaluator, fields: dict[str, str]) -> dict[str, str]:
+    """The fields of a log matching evaluator, on top of fields, if it checks them with exact_match"""
+    for inner in evaluator.evaluators if isinstance(evaluator, AllLog) else []:
+        get_fields(inner, fields)
+    for field in ["component", "label", "newValue", "oldValue"]:
+        if getattr(evaluator, field, None) is not None:
+            fields[field] = getattr(evaluator, field)
+    return fields
+
+
+def generate_events(trace: batch.Trace | None) -> list[str]:
+    if trace is None or not trace.is_vectorizable():
+        return [
+            f"click/slider // label {i} // {random.randint(0, 9)} // {random.randint(0, 9)}"
+            for i in range(random.randint(0, 2))
+        ]
+
+    events = []
+    for evaluator in trace.evaluators:
+        fields = get_fields(
+            evaluator, {"component": "click/button", "label": "label", "newValue": "1"}
+        )
+        if random.random() < 0.1:
+            fields[random.choice(["label", "newValue"])] = "changed"
+        events.append(" // ".join(fields.values()))
+
+    if trace.combinator != "ordered":
+        random.shuffle(events)
+    if random.random() < 0.1:
+        events = events[:-1]
+    if trace.combinator == "at_least_one" or random.random() < 0.3:
+        events += [
+            f"click/button // other {i} // 0" for i in range(random.randint(1, 50))
+        ]
+    return events
+
+
+def write_log(filepath: str, num_runs: int):
+    tests = [
+        (get_test_key(test, metadata), batch.trace_eval(test.eval))
+        for tests, metadata in get_all_tests_and_metadatas()
+        for test in tests
+    ]
+    random.seed(0)
+
+    with open(filepath, "w") as file:
+        for _ in range(num_runs):
+            key, trace = random.choice(tests)
+            file.write(f"TEST BEGIN: {key}\n")
+            for event in generate_events(trace):
+                file.write(f"{event}\n")
+            file.write("SUBMIT // 1\nTEST FINISH\n")
+
+
+def time_run(run):
+    start = time.perf_counter()
+    result = run()
+    return time.perf_counter() - start, result
+
+
+if __name__ == "__main__":
+    args = parse_args(sys.argv[1:], {"runs": 100000})
+    print(f"{args['runs']} runs, {'with' if batch.np is not None else 'without'} NumPy")
+
+    with tempfile.TemporaryDirectory() as folder:
+        filepath = os.path.join(folder, "log.txt")
+        write_log(filepath, args["runs"])
+        # Parsed up front, so neither way decodes the logs for the other
+        blocks = list(parse_test_blocks(read_log_lines(filepath)))
+        for block in blocks:
+            block.logs
+
+        for task, one_by_one, batched in [
+            (
+                "evaluate read blocks",
+                lambda: [evaluate_run(block) for block in blocks],
+                lambda: evaluate_blocks(blocks),
+            ),
+            (
+                "read and evaluate log",
+                lambda: evaluate_runs(filepath),
+                lambda: evaluate_runs(filepath, batched=True),
+            ),
+        ]:
+            print(f"  {task}")
+            results = {}
+            for name, run in [("one by one", one_by_one), ("batch", batched)]:
+                elapsed, results[name] = time_run(run)
+                print(
+                    f"    {name:<10} {elapsed:>7.2f}s   {args['runs'] / elapsed / 1e3:>7.1f}k runs/s"
+                )
+            if results["one by one"] != results["batch"]:
+                print("    ERROR: the results differ")
@@ -0,0 +1,175 @@
+"""Compares the original Eval combinators, which run every evaluator lambda on every log (reproduced here as LambdaEval), with the compiled LogPlans behind Eval.unordered and Eval.at_least_one.
+
+The individual tests' evals run over blocks of 20 logs drawn from the components, labels and values the tests look for, and at_least_one and unordered evals of 50 evaluators run over -logs= logs in trajectories of 500 (best of 5). Both sides must give the same results.
+
+Usage: python -m benchmarks.eval_plan -logs=200000
+"""
+
+import random
+import sys
+import time
+from typing import Callable
+
+from benchmarks.utils import parse_args
+from evaluation import ind
+from evaluation.evaluators import Eval, Log, LogEvaluator, LogListEvaluator
+
+COMPONENTS = ["click/button", "click/link", "type/text", "select/select", "NAVIGATE"]
+BLOCK_SIZE = 20
+TRAJECTORY_SIZE = 500
+NUM_EVALUATORS = 50
+REPEATS = 5
+
+
+class LambdaEval:
+    check_one = Eval.check_one
+    no_logs = Eval.no_logs
+    ordered = Eval.ordered
+
+    @staticmethod
+    def unordered(logs: list[Log], evaluators: list[LogEvaluator]) -> bool:
+        return len(logs) == len(evaluators) and all(
+            any(evaluator(log) for evaluator in evaluators) for log in logs
+        )
+
+    @staticmethod
+    def at_least_one(logs: list[Log], evaluators: list[LogEvaluator]) -> bool:
+        return any(any(evaluator(log) for evaluator in evaluators) for log in logs)
+
+    @staticmethod
+    def all_log(evaluators: list[LogEvaluator]) -> LogEvaluator:
+        return lambda log: all(evaluator(log) for evaluator in evaluators)
+
+    @staticmethod
+    def exact_match(component=None, label=None, newValue=None, oldValue=None):
+        return lambda log: (
+            (component is None or log.component == component)
+            and (label is None or log.label == label)
+            and (newValue is None or log.newValue == newValue)
+            and (oldValue is None or log.oldValue == oldValue)
+        )
+
+    @staticmethod
+    def contains_match(component=None, label=None, newValue=None, oldValue=None):
+        return lambda log: (
+            (component is None or component in log.component)
+            and (label is None or label in log.label)
+            and (newValue is None or newValue in log.newValue)
+            and (oldValue is None or oldValue in log.oldValue)
+        )
+
+    @staticmethod
+    def compare_values(compare: Callable[[str, str], bool]) -> LogEvaluator:
+        return lambda log: compare(log.newValue, log.oldValue)
+
+
+def get_test_evals() -> list[LogListEvaluator]:
+    return [
+        test.eval
+        for tests, _ in ind.get_all_tests_and_metadatas()
+        for test in tests
+        if test.eval is not None
+    ]
+
+
+def get_test_values() -> dict[str, list[str]]:
+    """The fields the tests' exact_match evaluators look for, recorded by running each eval once"""
+    values = {field: set() for field in ["component", "label", "newValue"]}
+    exact_match = Eval.exact_match
+
+    def record(*args, **kwargs) -> LogEvaluator:
+        evaluator = exact_match(*args, **kwargs)
+        for field, found in values.items():
+            if getattr(evaluator, field) is not None:
+                found.add(getattr(evaluator, field))
+        return evaluator
+
+    Eval.exact_match = record
+    for eval in get_test_evals():
+        eval([])
+    Eval.exact_match = exact_match
+
+    return {field: sorted(found) for field, found in values.items()}
+
+
+def generate_logs(count: int, values: dict[str, list[str]]) -> list[Log]:
+    return [
+        Log(
+            f"{random.choice(values['component'])} // {random.choice(values['label'])} // {random.choice(values['newValue'])}"
+        )
+        for _ in range(count)
+    ]
+
+
+def get_scan_evals(eval: type, num_labels: int) -> list[LogListEvaluator]:
+    """at_least_one and unordered evals of evaluators mostly on labels absent from the trajectories, so every log is checked against every evaluator"""
+    evaluators = [
+        eval.exact_match(COMPONENTS[i % len(COMPONENTS)], f"Label {num_labels + i}")
+        for i in range(NUM_EVALUATORS - 2)
+    ] + [
+        eval.all_log(
+            [eval.exact_match("type/text"), eval.contains_match(newValue="value 99")]
+        ),
+        eval.exact_match("click/button", "Label 1", "value 1"),
+    ]
+    return [
+        lambda logs: eval.at_least_one(logs, evaluators),
+        lambda logs: eval.unordered(logs, (evaluators * len(logs))[: len(logs)]),
+    ]
+
+
+def time_evals(evals: list[LogListEvaluator], blocks: list[list[Log]]):
+    timings = []
+    for _ in range(REPEATS):
+        start = time.perf_counter()
+        results = [eval(block) for eval in evals for block in blocks]
+        timings.append(time.perf_counter() - start)
+    return min(timings), results
+
+
+def time_test_evals(eval: type, blocks: list[list[Log]]):
+    """Times the tests' evals with eval as the combinators they call"""
+    ind.eval = eval
+    try:
+        return time_evals(get_test_evals(), blocks)
+    finally:
+        ind.eval = Eval
+
+
+if __name__ == "__main__":
+    args = parse_args(sys.argv[1:], {"logs": 200000})
+    random.seed(0)
+    num_labels = 200
+
+    test_logs = generate_logs(args["logs"], get_test_values())
+    test_blocks = [
+        test_logs[i : i + BLOCK_SIZE] for i in range(0, len(test_logs), BLOCK_SIZE)
+    ]
+    scan_logs = [
+        Log(
+            f"{random.choice(COMPONENTS)} // Label {random.randrange(num_labels)} // value {i % 100}"
+        )
+        for i in range(args["logs"])
+    ]
+    trajectories = [
+        scan_logs[i : i + TRAJECTORY_SIZE]
+        for i in range(0, len(scan_logs), TRAJECTORY_SIZE)
+    ]
+    print(f"{args['logs']} logs")
+
+    for task, run in [
+        ("test evals", lambda eval: time_test_evals(eval, test_blocks)),
+        (
+            "scan evals",
+            lambda eval: time_evals(get_scan_evals(eval, num_labels), trajectories),
+        ),
+    ]:
+        print(f"  {task}")
+        results = {}
+        for name, eval in [("lambdas", LambdaEval), ("plans", Eval)]:
+            elapsed, results[name] = run(eval)
+            print(
+                f"    {name:<8} {elapsed:>7.2f}s   {args['logs'] / elapsed / 1e6:>6.2f}M logs/s"
+            )
+        if results["lambdas"] != results["plans"]:
+            print("    ERROR: the results differ")
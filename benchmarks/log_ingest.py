@@ -0,0 +1,83 @@
+"""Compares log ingest on the log server before and after group commit: the original open/append/close per /log request, the shared LogWriter behind /log, and the LogWriter behind /log/batch.
+
+Usage: python -m benchmarks.log_ingest -clients=16 -events=500 -batch=20
+"""
+
+import logging
+import os
+import sys
+import tempfile
+import threading
+
+from werkzeug.serving import make_server
+
+from benchmarks.utils import drive_log_clients, load_app_module, parse_args
+
+
+class AppendPerRequestWriter:
+    """The pre-LogWriter behavior: every request opens the file, appends and closes it"""
+
+    def write(self, filepath: str, events: list):
+        with open(filepath, "a") as file:
+            for event in events:
+                file.write(event.log + "\n")
+
+
+def count_lines(filepath: str) -> int:
+    with open(filepath, "r") as file:
+        return sum(1 for _ in file)
+
+
+if __name__ == "__main__":
+    args = parse_args(sys.argv[1:], {"clients": 16, "events": 500, "batch": 20})
+    app_module = load_app_module()
+    logging.getLogger("werkzeug").setLevel(logging.ERROR)
+
+    server = make_server("127.0.0.1", 0, app_module.app, threaded=True)
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+
+    with tempfile.TemporaryDirectory() as folder:
+        arms = [
+            ("append per request, /log", AppendPerRequestWriter, 1),
+            (
+                "group commit, /log",
+                lambda: app_module.LogWriter(
+                    app_module.LOG_FLUSH_INTERVAL,
+                    app_module.LOG_FSYNC,
+                    format=app_module.LOG_FORMAT,
+                ),
+                1,
+            ),
+            (
+                f"group commit, /log/batch x{args['batch']}",
+                lambda: app_module.LogWriter(
+                    app_module.LOG_FLUSH_INTERVAL,
+                    app_module.LOG_FSYNC,
+                    format=app_module.LOG_FORMAT,
+                ),
+                args["batch"],
+            ),
+        ]
+
+        print(
+            f"{args['clients']} clients x {args['events']} events (flush interval {app_module.LOG_FLUSH_INTERVAL}s, fsync {app_module.LOG_FSYNC})"
+        )
+        for index, (name, make_writer, batch_size) in enumerate(arms):
+            filepath = os.path.join(folder, f"arm_{index}.txt")
+            app_module.LOG_FILEPATH = filepath
+            app_module.log_writer = make_writer()
+
+            result = drive_log_clients(
+                "127.0.0.1",
+                server.server_port,
+                args["clients"],
+                args["events"],
+                batch_size,
+            )
+
+            written = count_lines(filepath)
+            if written != result.events:
+                raise Exception(f"ERROR: {name} wrote {written}/{result.events} events")
+            print(f"  {name:<32} {result}")
+
+    server.shutdown()
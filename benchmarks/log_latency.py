@@ -0,0 +1,73 @@
+"""Compares per-event latency of the frontend logger's two paths to the log server: through the Next.js rewrite (browser -> Next.js -> Flask) and posting directly (LOG_DIRECT=1), with and without keep-alive.
+
+The rewrite arm needs the frontend running (`npm run dev` or ./start.sh) on -next=<port>; it is skipped otherwise. The log server is started in -mode= (dev or prod) on a free port, or an already running one is used with -port=.
+
+Usage: python -m benchmarks.log_latency -events=500 -next=3000 -mode=prod
+"""
+
+import os
+import signal
+import sys
+import urllib.request
+import uuid
+
+from benchmarks.log_load import get_free_port, start_server
+from benchmarks.utils import drive_log_clients, parse_args
+from evaluation.utils import begin_run_log, get_run_log_filepath
+
+
+def is_reachable(port: int) -> bool:
+    try:
+        urllib.request.urlopen(f"http://localhost:{port}/", timeout=2)
+        return True
+    except OSError:
+        return False
+
+
+def run_arm(name: str, host: str, port: int, events: int, headers: dict[str, str]):
+    run_id = f"latency-{uuid.uuid4().hex[:8]}"
+    begin_run_log(run_id, [])
+    result = drive_log_clients(
+        host, port, 1, events, headers={**headers, "X-Run-Id": run_id}
+    )
+    print(f"  {name:<24} {result}")
+
+    if os.path.exists(get_run_log_filepath(run_id)):
+        os.remove(get_run_log_filepath(run_id))
+
+
+def run_arms(log_port: int, args: dict):
+    # Browsers send an Origin header on direct (cross-origin) posts
+    origin = {"Origin": f"http://localhost:{args['next']}"}
+
+    if is_reachable(args["next"]):
+        run_arm("rewrite", "localhost", args["next"], args["events"], {})
+    else:
+        print(f"  {'rewrite':<24} skipped, no frontend on port {args['next']}")
+
+    run_arm("direct", "127.0.0.1", log_port, args["events"], origin)
+    run_arm(
+        "direct, no keep-alive",
+        "127.0.0.1",
+        log_port,
+        args["events"],
+        {**origin, "Connection": "close"},
+    )
+
+
+if __name__ == "__main__":
+    args = parse_args(
+        sys.argv[1:], {"events": 500, "next": 3000, "mode": "prod", "port": 0}
+    )
+    print(f"{args['events']} sequential events, one per request")
+
+    if args["port"]:
+        run_arms(args["port"], args)
+    else:
+        port = get_free_port()
+        server = start_server(args["mode"], port)
+        try:
+            run_arms(port, args)
+        finally:
+            os.killpg(server.pid, signal.SIGTERM)
+            server.wait()
@@ -0,0 +1,101 @@
+"""Load test for the log server: drives N simulated clients at /log, each logging to its own run, then checks that every run file holds exactly its client's events in order.
+
+Starts the server in each mode given with -mode= (dev is `python app.py`, prod is `python app.py -prod`) on a free port, or targets an already running server with -port=.
+
+Usage: python -m benchmarks.log_load -clients=32 -events=200 -mode=dev,prod
+"""
+
+import os
+import signal
+import socket
+import subprocess
+import sys
+import time
+import urllib.request
+import uuid
+
+from benchmarks.utils import (
+    ENVIRONMENT_FOLDER,
+    client_event,
+    drive_log_clients,
+    parse_args,
+)
+from evaluation.utils import begin_run_log, get_run_log_filepath
+
+
+def get_free_port() -> int:
+    with socket.socket() as sock:
+        sock.bind(("127.0.0.1", 0))
+        return sock.getsockname()[1]
+
+
+def start_server(mode: str, port: int) -> subprocess.Popen:
+    process = subprocess.Popen(
+        [sys.executable, "app.py"] + (["-prod"] if mode == "prod" else []),
+        cwd=ENVIRONMENT_FOLDER,
+        env={**os.environ, "FLASK_RUN_PORT": str(port)},
+        stdout=subprocess.DEVNULL,
+        stderr=subprocess.DEVNULL,
+        start_new_session=True,  # so the dev server's reloader child is stopped too
+    )
+
+    deadline = time.time() + 30
+    while time.time() < deadline:
+        try:
+            urllib.request.urlopen(f"http://127.0.0.1:{port}/", timeout=1)
+            return process
+        except OSError:
+            time.sleep(0.2)
+
+    os.killpg(process.pid, signal.SIGTERM)
+    raise Exception(f"ERROR: {mode} server did not start on port {port}")
+
+
+def verify_runs(run_prefix: str, num_clients: int, events_per_client: int) -> int:
+    """Checks each client's run file and removes it. Returns the number of bad runs."""
+    bad_runs = 0
+    for index in range(num_clients):
+        filepath = get_run_log_filepath(f"{run_prefix}-{index}")
+        with open(filepath, "r") as file:
+            lines = file.read().splitlines()
+        os.remove(filepath)
+
+        if lines != [client_event(index, i) for i in range(events_per_client)]:
+            bad_runs += 1
+    return bad_runs
+
+
+def run_load(name: str, port: int, args: dict):
+    run_prefix = f"load-{uuid.uuid4().hex[:8]}"
+    # The server only writes to runs the harness has begun
+    for index in range(args["clients"]):
+        begin_run_log(f"{run_prefix}-{index}", [])
+    result = drive_log_clients(
+        "127.0.0.1",
+        port,
+        args["clients"],
+        args["events"],
+        run_prefix=run_prefix,
+    )
+
+    bad_runs = verify_runs(run_prefix, args["clients"], args["events"])
+    print(f"  {name:<8} {result}   corrupted runs {bad_runs}/{args['clients']}")
+
+
+if __name__ == "__main__":
+    args = parse_args(
+        sys.argv[1:], {"clients": 32, "events": 200, "mode": "dev,prod", "port": 0}
+    )
+    print(f"{args['clients']} clients x {args['events']} events to /log")
+
+    if args["port"]:
+        run_load(f":{args['port']}", args["port"], args)
+    else:
+        for mode in args["mode"].split(","):
+            port = get_free_port()
+            server = start_server(mode, port)
+            try:
+                run_load(mode, port, args)
+            finally:
+                os.killpg(server.pid, signal.SIGTERM)
+                server.wait()
@@ -0,0 +1,100 @@
+"""Compares the memory and evaluation speed of the original Log, which has a per-instance __dict__ and its own copy of every string (reproduced here as DictLog), with the slotted Log and its interned components and labels.
+
+-logs= logs are parsed from synthetic lines whose components and labels repeat, as in real trajectories. The memory is what the list of logs holds, per million logs. The evaluation runs the individual tests' evals, and evals that read every log, over consecutive blocks of 20 logs (best of 5).
+
+Usage: python -m benchmarks.log_memory -logs=1000000
+"""
+
+import gc
+import random
+import sys
+import time
+import tracemalloc
+
+from benchmarks.utils import parse_args
+from evaluation.evaluators import Eval, Log, LogListEvaluator
+from evaluation.ind import get_all_tests_and_metadatas
+
+COMPONENTS = ["click/button", "click/link", "type/text", "select/select", "NAVIGATE"]
+BLOCK_SIZE = 20
+REPEATS = 5
+
+
+class DictLog:
+    def __init__(self, log: str):
+        log_parts: list[str] = [part.strip() for part in log.split("//")]
+
+        self.component = log_parts[0]
+        self.label = log_parts[1]
+        self.newValue = log_parts[2] if len(log_parts) > 2 else None
+        self.oldValue = log_parts[3] if len(log_parts) > 3 else None
+
+
+def generate_lines(count: int) -> list[str]:
+    random.seed(0)
+    labels = [f"Label {i}" for i in range(200)]
+    return [
+        f"{random.choice(COMPONENTS)} // {random.choice(labels)}"
+        + (f" // value {i % 1000}" if i % 3 else "")
+        for i in range(count)
+    ]
+
+
+def measure_memory(log_class: type, lines: list[str]) -> float:
+    """Returns the MB held by the parsed logs, per million logs"""
+    gc.collect()
+    tracemalloc.start()
+    logs = [log_class(line) for line in lines]
+    held = tracemalloc.get_traced_memory()[0]
+    tracemalloc.stop()
+
+    return held / len(logs) * 1e6 / 1024 / 1024
+
+
+def get_test_evals() -> list[LogListEvaluator]:
+    return [
+        test.eval
+        for tests, _ in get_all_tests_and_metadatas()
+        for test in tests
+        if test.eval is not None
+    ]
+
+
+def get_scan_evals() -> list[LogListEvaluator]:
+    """Evals that read every log, unlike the tests' ordered evals, which mostly stop at the number of logs"""
+    return [
+        lambda logs: Eval.at_least_one(
+            logs, [Eval.exact_match("type/text", "Label 7", "value 7")]
+        ),
+        lambda logs: Eval.at_least_one(logs, [Eval.contains_match(label="Label 19")]),
+    ]
+
+
+def time_evaluation(
+    log_class: type, lines: list[str], evals: list[LogListEvaluator]
+) -> float:
+    logs = [log_class(line) for line in lines]
+    blocks = [logs[i : i + BLOCK_SIZE] for i in range(0, len(logs), BLOCK_SIZE)]
+
+    timings = []
+    for _ in range(REPEATS):
+        start = time.perf_counter()
+        for eval in evals:
+            for block in blocks:
+                eval(block)
+        timings.append(time.perf_counter() - start)
+    return min(timings)
+
+
+if __name__ == "__main__":
+    args = parse_args(sys.argv[1:], {"logs": 1000000})
+    lines = generate_lines(args["logs"])
+    print(f"{args['logs']} logs")
+
+    for name, log_class in [("dict", DictLog), ("slotted", Log)]:
+        memory = measure_memory(log_class, lines)
+        tests = time_evaluation(log_class, lines, get_test_evals())
+        scan = time_evaluation(log_class, lines, get_scan_evals())
+        print(
+            f"  {name:<8} {memory:>7.1f}MB per million logs   test evals {tests:>6.2f}s   scan evals {scan:>6.2f}s"
+        )
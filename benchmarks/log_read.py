@@ -0,0 +1,90 @@
+"""Compares reading a large legacy log for -evalonly line by line (parse_test_blocks over the file, as get_evals_dict did) versus memory-mapping it and scanning for its blocks (MappedLog).
+
+The synthetic log has -lines= lines in blocks of 5 to 40 events for the individual tests. Each reader is timed evaluating every run (evaluate_run, as evaluate_runs does without a cache), and reading every field of every Log, which is the most an evaluator can decode.
+
+Usage: python -m benchmarks.log_read -lines=10000000
+"""
+
+import os
+import random
+import sys
+import tempfile
+import time
+from typing import Callable, Iterator
+
+from benchmarks.utils import parse_args
+from evaluation.bulk import LOG_FIELDS, MappedLog
+from evaluation.ind import evaluate_run, get_all_tests_and_metadatas, get_test_key
+from evaluation.trajectory import TestBlock
+from evaluation.utils import parse_test_blocks, read_log_lines
+
+COMPONENTS = ["click/button", "click/link", "type/text", "select/checkbox", "NAVIGATE"]
+
+
+def write_log(filepath: str, num_lines: int):
+    keys = [
+        get_test_key(test, metadata)
+        for tests, metadata in get_all_tests_and_metadatas()
+        for test in tests
+    ]
+    random.seed(0)
+
+    with open(filepath, "w") as file:
+        written = 0
+        while written < num_lines:
+            num_events = random.randint(5, 40)
+            file.write(f"TEST BEGIN: {random.choice(keys)}\n")
+            for i in range(num_events - 1):
+                file.write(
+                    f"{random.choice(COMPONENTS)} // label {i} // new {i} // old {i}\n"
+                )
+            file.write('SUBMIT // {"answer": 42}\nTEST FINISH\n')
+            written += num_events + 2
+
+
+def read_lines(filepath: str) -> Iterator[TestBlock]:
+    yield from parse_test_blocks(read_log_lines(filepath))
+
+
+def read_mapped(filepath: str) -> Iterator[TestBlock]:
+    with MappedLog(filepath) as log:
+        yield from log.blocks()
+
+
+def evaluate(blocks: Iterator[TestBlock]) -> int:
+    return sum(evaluate_run(block)[0] for block in blocks)
+
+
+def read_fields(blocks: Iterator[TestBlock]) -> int:
+    return sum(
+        len(str(getattr(log, field)))
+        for block in blocks
+        for log in block.logs
+        for field in LOG_FIELDS
+    )
+
+
+def time_run(run: Callable[[Iterator[TestBlock]], int], blocks: Iterator[TestBlock]):
+    start = time.perf_counter()
+    result = run(blocks)
+    return time.perf_counter() - start, result
+
+
+if __name__ == "__main__":
+    args = parse_args(sys.argv[1:], {"lines": 10000000})
+
+    with tempfile.TemporaryDirectory() as folder:
+        filepath = os.path.join(folder, "log.txt")
+        write_log(filepath, args["lines"])
+        print(f"{args['lines']} lines, {os.path.getsize(filepath) / 1024 / 1024:.0f}MB")
+
+        for task, run in [("evaluate", evaluate), ("read all fields", read_fields)]:
+            print(f"  {task}")
+            results = {}
+            for name, reader in [("lines", read_lines), ("mapped", read_mapped)]:
+                elapsed, results[name] = time_run(run, reader(filepath))
+                print(
+                    f"    {name:<8} {elapsed:>8.2f}s   {args['lines'] / elapsed / 1e6:>6.2f}M lines/s"
+                )
+            if results["lines"] != results["mapped"]:
+                print("    ERROR: the readers' results differ")
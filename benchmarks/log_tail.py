@@ -0,0 +1,73 @@
+"""Compares the cost of following a large log during a trial: rereading the whole file with readlines() every tick (the original check_limits) versus the TailFollower, which only reads appended bytes.
+
+The log starts with -lines= existing lines; each of -ticks= ticks appends -append= lines and then checks a SUBMIT break, as check_limits does. The follower's total includes reading past the existing lines once.
+
+Usage: python -m benchmarks.log_tail -lines=1000000 -ticks=100 -append=5
+"""
+
+import os
+import sys
+import tempfile
+import time
+
+from benchmarks.utils import parse_args
+from evaluation.utils import TailFollower
+
+
+def submit_break(lines: list[str]) -> bool:
+    return any("SUBMIT" in line for line in lines)
+
+
+def append_lines(filepath: str, tick: int, count: int):
+    with open(filepath, "a") as file:
+        for i in range(count):
+            file.write(f"click/button // tick {tick} event {i}\n")
+
+
+def run_readlines(filepath: str, existing_lines: int, args: dict) -> float:
+    elapsed = 0
+    for tick in range(args["ticks"]):
+        append_lines(filepath, tick, args["append"])
+
+        start = time.perf_counter()
+        with open(filepath, "r") as file:
+            lines = file.readlines()
+        submit_break(lines[existing_lines:])
+        elapsed += time.perf_counter() - start
+    return elapsed
+
+
+def run_follower(filepath: str, existing_lines: int, args: dict) -> float:
+    start = time.perf_counter()
+    follower = TailFollower(filepath)
+    follower.skip_lines(existing_lines)
+    elapsed = time.perf_counter() - start
+
+    new_lines = []
+    for tick in range(args["ticks"]):
+        append_lines(filepath, tick, args["append"])
+
+        start = time.perf_counter()
+        new_lines.extend(follower.read_new_lines())
+        submit_break(new_lines)
+        elapsed += time.perf_counter() - start
+    return elapsed
+
+
+if __name__ == "__main__":
+    args = parse_args(sys.argv[1:], {"lines": 1000000, "ticks": 100, "append": 5})
+    print(
+        f"{args['lines']} existing lines, {args['ticks']} ticks of {args['append']} appended lines"
+    )
+
+    with tempfile.TemporaryDirectory() as folder:
+        for name, run in [("readlines", run_readlines), ("follower", run_follower)]:
+            filepath = os.path.join(folder, f"{name}.txt")
+            with open(filepath, "w") as file:
+                for i in range(args["lines"]):
+                    file.write(f"click/button // existing {i}\n")
+
+            elapsed = run(filepath, args["lines"], args)
+            print(
+                f"  {name:<10} total {elapsed:>8.3f}s   per tick {elapsed / args['ticks'] * 1000:>8.2f}ms"
+            )
@@ -0,0 +1,114 @@
+import http.client
+import importlib.util
+import json
+import os
+import threading
+import time
+from typing import Any
+
+ENVIRONMENT_FOLDER = os.path.join(os.path.dirname(__file__), "../environment/")
+
+
+def load_app_module():
+    """Imports environment/app.py, which is a script rather than part of a package"""
+    spec = importlib.util.spec_from_file_location("app", ENVIRONMENT_FOLDER + "app.py")
+    module = importlib.util.module_from_spec(spec)
+    spec.loader.exec_module(module)
+    return module
+
+
+def parse_args(argv: list[str], defaults: dict[str, Any]) -> dict[str, Any]:
+    """Parses `-name=value` args for the given names, converting to the type of the default"""
+    args = dict(defaults)
+    for arg in argv:
+        name, _, value = arg.lstrip("-").partition("=")
+        if name in args:
+            args[name] = type(defaults[name])(value)
+    return args
+
+
+def percentile(values: list[float], pct: float) -> float:
+    ordered = sorted(values)
+    index = min(len(ordered) - 1, round(pct / 100 * (len(ordered) - 1)))
+    return ordered[index]
+
+
+class LoadResult:
+    def __init__(self, events: int, elapsed: float, latencies: list[float]):
+        self.events = events
+        self.elapsed = elapsed
+        self.latencies = latencies
+
+    def __str__(self):
+        return (
+            f"{self.events / self.elapsed:>10.0f} events/s"
+            + f"   p50 {percentile(self.latencies, 50) * 1000:>7.2f}ms"
+            + f"   p99 {percentile(self.latencies, 99) * 1000:>7.2f}ms"
+        )
+
+
+def client_event(client_index: int, event_index: int) -> str:
+    return f"click/button // client {client_index} event {event_index}"
+
+
+def drive_log_clients(
+    host: str,
+    port: int,
+    num_clients: int,
+    events_per_client: int,
+    batch_size: int = 1,
+    path_prefix: str = "",
+    headers: dict[str, str] | None = None,
+    run_prefix: str | None = None,
+) -> LoadResult:
+    """Runs num_clients threads that each POST events_per_client events over a keep-alive connection, either one per /log request or batch_size per /log/batch request. With a run_prefix, client i logs to run <run_prefix>-<i>. Latencies are per request."""
+    latencies: list[list[float]] = [[] for _ in range(num_clients)]
+    barrier = threading.Barrier(num_clients + 1)
+
+    def client(index: int):
+        connection = http.client.HTTPConnection(host, port)
+        request_headers = {"Content-Type": "application/json", **(headers or {})}
+        if run_prefix is not None:
+            request_headers["X-Run-Id"] = f"{run_prefix}-{index}"
+        barrier.wait()
+
+        for start in range(0, events_per_client, batch_size):
+            logs = [
+                client_event(index, i)
+                for i in range(start, min(start + batch_size, events_per_client))
+            ]
+            if batch_size == 1:
+                path, body = "/log", {"log": logs[0]}
+            else:
+                path, body = "/log/batch", {"logs": logs}
+
+            request_start = time.perf_counter()
+            connection.request(
+                "POST", path_prefix + path, json.dumps(body), request_headers
+            )
+            response = connection.getresponse()
+            response.read()
+            latencies[index].append(time.perf_counter() - request_start)
+
+            if response.status != 200:
+                raise Exception(f"ERROR: {path} returned {response.status}")
+
+        connection.close()
+
+    threads = [
+        threading.Thread(target=client, args=(index,)) for index in range(num_clients)
+    ]
+    for thread in threads:
+        thread.start()
+
+    barrier.wait()
+    start = time.perf_counter()
+    for thread in threads:
+        thread.join()
+    elapsed = time.perf_counter() - start
+
+    return LoadResult(
+        num_clients * events_per_client,
+        elapsed,
+        [latency for client_latencies in latencies for latency in client_latencies],
+    )
@@ -1,14 +1,387 @@
-from flask import Flask, jsonify, request
+from flask import Flask, abort, jsonify, request
+import json
 import os
+import queue
+import re
+import sys
+import threading
+import time
+from collections import deque
+from typing import Any, Callable, TextIO
 from dotenv import load_dotenv
 
 
 parent_folder = os.path.join(os.path.dirname(__file__), "../")
 load_dotenv(dotenv_path=os.path.join(parent_folder, ".env"))
 
+LOG_FILEPATH = parent_folder + "trajectories/log.txt"
+# Events tagged with a run id go to their own file so several agents can share the server
+RUNS_FOLDER = parent_folder + "trajectories/runs/"
+RUN_ID_PATTERN = re.compile(r"[A-Za-z0-9_.-]{1,128}")
+MAX_OPEN_LOG_FILES = 64
+# Seconds the writer keeps gathering events after the first one arrives before it
+# commits them together. 0 commits whatever is already queued without waiting.
+LOG_FLUSH_INTERVAL = float(os.getenv("LOG_FLUSH_INTERVAL", "0"))
+LOG_FSYNC = os.getenv("LOG_FSYNC", "0") == "1"
+# "text" writes the legacy `component // label // new // old` lines, "jsonl" writes one
+# JSON record per event with its sequence number, receive time, run id and fields
+LOG_FORMAT = os.getenv("LOG_FORMAT", "text")
+# Committed events are also kept in memory for /log/stream subscribers and /stats
+MAX_STREAMS = 256
+MAX_STREAM_EVENTS = 10000
+MAX_STREAM_TIMEOUT = 30
+# Seconds a batch waits for the batch its tab sent before it (see BatchOrder)
+MAX_ORDER_WAIT = 2
+# Request threads in production mode (python app.py -prod). Each /log/stream long-poll
+# holds one, so this should stay well above the number of concurrent agents.
+LOG_SERVER_THREADS = int(os.getenv("LOG_SERVER_THREADS", "32"))
+# Origins allowed to post to the server directly (comma-separated) rather than through
+# the Next.js rewrites. Defaults to the frontend the harness opens (LOCALHOST_PORT in
+# evaluation/utils.py); set it to * to allow any page, which lets any site open in a
+# browser on this machine write to the trajectories.
+LOG_CORS_ORIGINS = os.getenv("LOG_CORS_ORIGINS", "http://localhost:3000").split(",")
+# Seconds browsers may cache a CORS preflight, so direct posts don't pay for one each time
+LOG_CORS_MAX_AGE = 600
+
 app = Flask(__name__)
 
 
+class LogEvent:
+    """One logged event. log is the legacy line; the fields are sent separately by the frontend so that labels containing // survive."""
+
+    def __init__(self, body: dict, run_id: str | None):
+        self.log: str = body["log"]
+        self.run_id = run_id
+        self.received = time.time()
+        self.seq: int | None = None  # assigned in commit order by the LogWriter
+
+        if body.get("component") is not None:
+            self.component = body["component"]
+            self.label = body.get("label")
+            self.newValue = body.get("newVal")
+            self.oldValue = body.get("oldVal")
+        else:
+            parts = [part.strip() for part in self.log.split("//")]
+            self.component = parts[0]
+            self.label = parts[1] if len(parts) > 1 else None
+            self.newValue = parts[2] if len(parts) > 2 else None
+            self.oldValue = parts[3] if len(parts) > 3 else None
+
+    def to_line(self, format: str) -> str:
+        if format == "jsonl":
+            return json.dumps(
+                {
+                    "seq": self.seq,
+                    "ts": self.received,
+                    "run": self.run_id,
+                    "component": self.component,
+                    "label": self.label,
+                    "new": self.newValue,
+                    "old": self.oldValue,
+                }
+            )
+        return self.log
+
+
+def read_last_seq(filepath: str) -> int:
+    """The last sequence number recorded in a JSONL log, so numbering continues across server restarts"""
+    try:
+        with open(filepath, "rb") as file:
+            file.seek(max(0, os.fstat(file.fileno()).st_size - 65536))
+            lines = file.read().splitlines()
+    except FileNotFoundError:
+        return 0
+
+    for line in reversed(lines):
+        if line.startswith(b"{"):
+            try:
+                seq = json.loads(line).get("seq")
+            except ValueError:
+                continue
+            if seq is not None:
+                return seq
+    return 0
+
+
+class PendingWrite:
+    def __init__(self, filepath: str, events: list[LogEvent], create: bool):
+        self.filepath = filepath
+        self.events = events
+        self.create = create
+        self.done = threading.Event()
+        self.error: Exception | None = None
+
+
+class LogWriter:
+    """Single long-lived writer for the trajectory files. Request threads queue their events and block until a background thread has committed them; everything queued while a commit is in progress goes out in the next write to each file (group commit). Events are numbered per file in commit order. The sequence numbers, like the LogStreams and RunStats, live in this process, so the server must run as a single process (the -prod server is one process with several threads)."""
+
+    def __init__(
+        self,
+        flush_interval: float = 0,
+        fsync: bool = False,
+        on_commit: Callable[[str, list[LogEvent]], None] | None = None,
+        format: str = "text",
+    ):
+        self.flush_interval = flush_interval
+        self.fsync = fsync
+        self.on_commit = on_commit
+        self.format = format
+        self.queue: queue.Queue[PendingWrite] = queue.Queue()
+        self.files: dict[str, TextIO] = {}  # ordered from least to most recently used
+        self.last_seqs: dict[str, int] = {}
+        self.thread = threading.Thread(target=self.run, daemon=True)
+        self.thread.start()
+
+    def write(self, filepath: str, events: list[LogEvent], create: bool = True):
+        """Commits the events to the file. Without create, they are dropped if the file doesn't exist."""
+        pending = PendingWrite(filepath, events, create)
+        self.queue.put(pending)
+        pending.done.wait()
+        if pending.error is not None:
+            raise pending.error
+
+    def next_batch(self) -> list[PendingWrite]:
+        batch = [self.queue.get()]
+
+        deadline = time.monotonic() + self.flush_interval
+        while (remaining := deadline - time.monotonic()) > 0:
+            try:
+                batch.append(self.queue.get(timeout=remaining))
+            except queue.Empty:
+                break
+
+        while True:
+            try:
+                batch.append(self.queue.get_nowait())
+            except queue.Empty:
+                return batch
+
+    def open_file(self, filepath: str, create: bool) -> TextIO | None:
+        """Reopens the file if it was removed or replaced since the last commit (truncation is fine since the handle is in append mode). Without create, returns None if the file doesn't exist."""
+        file = self.files.pop(filepath, None)
+        if file is not None:
+            try:
+                if os.stat(filepath).st_ino == os.fstat(file.fileno()).st_ino:
+                    self.files[filepath] = file
+                    return file
+            except FileNotFoundError:
+                pass
+            file.close()
+
+        if len(self.files) >= MAX_OPEN_LOG_FILES:
+            self.files.pop(next(iter(self.files))).close()
+
+        if create:
+            os.makedirs(os.path.dirname(filepath), exist_ok=True)
+            file = open(filepath, "a")
+        else:
+            try:
+                file = os.fdopen(os.open(filepath, os.O_WRONLY | os.O_APPEND), "a")
+            except FileNotFoundError:
+                return None
+        self.files[filepath] = file
+        return file
+
+    def commit(self, filepath: str, batch: list[PendingWrite]):
+        events = [event for pending in batch for event in pending.events]
+        file = self.open_file(filepath, batch[0].create)
+        if file is None:
+            return
+
+        if filepath not in self.last_seqs:
+            self.last_seqs[filepath] = (
+                read_last_seq(filepath) if self.format == "jsonl" else 0
+            )
+        for event in events:
+            self.last_seqs[filepath] += 1
+            event.seq = self.last_seqs[filepath]
+
+        file.write("".join(event.to_line(self.format) + "\n" for event in events))
+        file.flush()
+        if self.fsync:
+            os.fsync(file.fileno())
+
+        if self.on_commit is not None:
+            self.on_commit(filepath, events)
+
+    def run(self):
+        while True:
+            batches: dict[str, list[PendingWrite]] = {}
+            for pending in self.next_batch():
+                batches.setdefault(pending.filepath, []).append(pending)
+
+            for filepath, batch in batches.items():
+                try:
+                    self.commit(filepath, batch)
+                except Exception as e:
+                    for pending in batch:
+                        pending.error = e
+                for pending in batch:
+                    pending.done.set()
+
+
+class RunStats:
+    """Running aggregates over a log file's events, so limits can be checked without reparsing the trajectory"""
+
+    def __init__(self):
+        self.event_count = 0
+        self.component_counts: dict[str, int] = {}
+        self.first_event_time: float | None = None
+        self.last_event_time: float | None = None
+        self.first_submit: str | None = None
+        self.first_submit_seq: int | None = None
+        self.first_submit_time: float | None = None
+        self.last_navigate: str | None = None
+        self.last_navigate_time: float | None = None
+        # Every page navigated to, so a check that polls the stats sees each one, not only the latest
+        self.navigates: list[str] = []
+
+    def update(self, event: LogEvent):
+        component = event.component
+        now = event.received
+
+        self.event_count += 1
+        self.component_counts[component] = self.component_counts.get(component, 0) + 1
+        if self.first_event_time is None:
+            self.first_event_time = now
+        self.last_event_time = now
+
+        if component == "SUBMIT" and self.first_submit_time is None:
+            self.first_submit = event.label
+            self.first_submit_seq = event.seq
+            self.first_submit_time = now
+        elif component == "NAVIGATE":
+            self.last_navigate = event.label
+            self.last_navigate_time = now
+            if event.label is not None:
+                self.navigates.append(event.label)
+
+    def to_dict(self) -> dict:
+        return {
+            **vars(self),
+            "component_counts": dict(self.component_counts),
+            "navigates": list(self.navigates),
+        }
+
+
+class LogStream:
+    def __init__(self):
+        self.events: deque[tuple[int, str]] = deque(maxlen=MAX_STREAM_EVENTS)
+        self.last_seq = 0
+        self.stats = RunStats()
+
+
+class LogStreams:
+    """The most recently committed events of each log file, numbered in commit order, so that clients can long-poll for new events instead of rereading the file. Also keeps each file's RunStats."""
+
+    def __init__(self):
+        # ordered from least to most recently used
+        self.streams: dict[str, LogStream] = {}
+        self.condition = threading.Condition()
+
+    def get_stream(self, key: str) -> LogStream:
+        stream = self.streams.pop(key, None)
+        if stream is None:
+            stream = LogStream()
+            if len(self.streams) >= MAX_STREAMS:
+                self.streams.pop(next(iter(self.streams)))
+        self.streams[key] = stream
+        return stream
+
+    def publish(self, key: str, events: list[LogEvent]):
+        with self.condition:
+            stream = self.get_stream(key)
+            for event in events:
+                stream.last_seq = event.seq
+                stream.events.append((event.seq, event.log))
+                stream.stats.update(event)
+            self.condition.notify_all()
+
+    def read(
+        self, key: str, since: int, timeout: float
+    ) -> tuple[list[tuple[int, str]], int]:
+        """Waits up to timeout seconds for events after since and returns them with the last sequence number seen"""
+        with self.condition:
+            stream = self.get_stream(key)
+            if stream.last_seq < since:
+                since = 0  # the stream was evicted or the server restarted
+            self.condition.wait_for(lambda: stream.last_seq > since, timeout)
+            events = [(seq, log) for seq, log in stream.events if seq > since]
+            return events, max(since, stream.last_seq)
+
+    def read_stats(self, key: str) -> dict:
+        with self.condition:
+            stream = self.get_stream(key)
+            return {"last_seq": stream.last_seq, **stream.stats.to_dict()}
+
+
+class BatchOrder:
+    """Writes the batches of each log file in the order the frontend sent them. Each batch carries prev, the seq of the last event its tab sent for the run before it, so a batch that arrives first (e.g. a pagehide beacon overtaking a keepalive fetch still in flight) waits until the events up to prev are written, or for MAX_ORDER_WAIT seconds in case they were lost."""
+
+    def __init__(self):
+        # ordered from least to most recently used
+        self.last_seqs: dict[str, int] = {}
+        self.condition = threading.Condition()
+
+    def write(
+        self, filepath: str, prev: int | None, last: int, commit: Callable[[], None]
+    ):
+        """Runs commit once the events up to prev are written, then records last (the seq of the batch's last event) as written"""
+        if prev is not None:
+            with self.condition:
+                self.condition.wait_for(
+                    lambda: self.last_seqs.get(filepath, 0) >= prev, MAX_ORDER_WAIT
+                )
+        try:
+            commit()
+        finally:
+            with self.condition:
+                last = max(self.last_seqs.pop(filepath, 0), last)
+                if len(self.last_seqs) >= MAX_STREAMS:
+                    self.last_seqs.pop(next(iter(self.last_seqs)))
+                self.last_seqs[filepath] = last
+                self.condition.notify_all()
+
+
+def get_run_id() -> str | None:
+    """Reads the run a request belongs to from the X-Run-Id header, the run query param or the run_id cookie"""
+    run_id = (
+        request.headers.get("X-Run-Id")
+        or request.args.get("run")
+        or request.cookies.get("run_id")
+    )
+    if run_id is not None and not RUN_ID_PATTERN.fullmatch(run_id):
+        abort(400, f"Invalid run id: {run_id}")
+    return run_id
+
+
+def get_log_filepath(run_id: str | None) -> str:
+    return LOG_FILEPATH if run_id is None else RUNS_FOLDER + run_id + ".txt"
+
+
+def write_events(run_id: str | None, events: list[LogEvent]):
+    """A run's file is created by the harness when the run begins and removed when it ends, so events for a run without one (e.g. from a page left open after its run) are dropped rather than starting an orphan file"""
+    log_writer.write(get_log_filepath(run_id), events, create=run_id is None)
+
+
+log_streams = LogStreams()
+batch_order = BatchOrder()
+log_writer = LogWriter(LOG_FLUSH_INTERVAL, LOG_FSYNC, log_streams.publish, LOG_FORMAT)
+
+
+@app.after_request
+def add_cors_headers(response):
+    """Lets the frontend logger post to the server directly (see LOG_DIRECT in next.config.mjs)"""
+    origin = request.headers.get("Origin")
+    if origin is not None and ("*" in LOG_CORS_ORIGINS or origin in LOG_CORS_ORIGINS):
+        response.headers["Access-Control-Allow-Origin"] = origin
+        response.headers["Access-Control-Allow-Methods"] = "GET, POST, OPTIONS"
+        response.headers["Access-Control-Allow-Headers"] = "Content-Type, X-Run-Id"
+        response.headers["Access-Control-Max-Age"] = str(LOG_CORS_MAX_AGE)
+        response.headers["Vary"] = "Origin"
+    return response
+
+
 @app.route("/", methods=["GET"])
 def get_data():
     data = {"message": "Hello from Flask!"}
@@ -17,14 +390,97 @@ def get_data():
 
 @app.route("/log", methods=["POST"])
 def log_individual():
-    json = request.get_json()
-    log = json.get("log")
+    body = request.get_json()
+    run_id = get_run_id()
+
+    write_events(run_id, [LogEvent(body, run_id)])
+
+    return jsonify({"log": body.get("log")})
+
+
+def read_batch_events(body: Any) -> list[dict]:
+    """The events of a /log/batch body (see log_batch), with legacy lines turned into events. Aborts with 400 if the body isn't shaped like one, rather than failing halfway through writing it."""
+    if not isinstance(body, dict):
+        abort(400, "Expected a JSON object with events or logs")
+    if body.get("prev") is not None and not isinstance(body["prev"], int):
+        abort(400, "Expected prev to be an integer")
+
+    if body.get("events"):
+        events = body["events"]
+        if not isinstance(events, list) or not all(
+            isinstance(event, dict)
+            and isinstance(event.get("log"), str)
+            and isinstance(event.get("component"), str | None)
+            and isinstance(event.get("seq", 0), int)
+            for event in events
+        ):
+            abort(
+                400,
+                "Expected events to be a list of objects with a log line and an integer seq",
+            )
+        return events
+
+    logs = body.get("logs", [])
+    if not isinstance(logs, list) or not all(isinstance(log, str) for log in logs):
+        abort(400, "Expected logs to be a list of lines")
+    return [{"log": log} for log in logs]
 
-    with open(parent_folder + "trajectories/log.txt", "a") as file:
-        file.write(log + "\n")
 
-    return jsonify({"log": log})
+@app.route("/log/batch", methods=["POST"])
+def log_batch():
+    """Takes {"events": [...]} with the same fields as /log (plus an optional seq), or {"logs": [...]} with legacy lines. The frontend also sends prev, the seq of the last event it sent before the batch (see BatchOrder). The run may be given as ?run= since sendBeacon can't set headers."""
+    # force: direct posts from the frontend are text/plain so they need no CORS preflight
+    body = request.get_json(force=True)
+    run_id = get_run_id()
+    events = read_batch_events(body)
+    # The frontend numbers events in the order they were logged
+    events.sort(key=lambda event: event.get("seq", 0))
+    log_events = [LogEvent(event, run_id) for event in events]
+
+    if events and events[-1].get("seq") is not None:
+        batch_order.write(
+            get_log_filepath(run_id),
+            body.get("prev"),
+            events[-1]["seq"],
+            lambda: write_events(run_id, log_events),
+        )
+    else:
+        write_events(run_id, log_events)
+
+    return jsonify({"count": len(events)})
+
+
+@app.route("/log/stream", methods=["GET"])
+def log_stream():
+    """Long-poll for a run's events: returns the events committed after ?since=<seq> as soon as there are any, or an empty list after ?timeout=<s>"""
+    since = request.args.get("since", 0, type=int)
+    timeout = min(request.args.get("timeout", 10, type=float), MAX_STREAM_TIMEOUT)
+
+    events, last_seq = log_streams.read(get_log_filepath(get_run_id()), since, timeout)
+
+    return jsonify(
+        {"events": [{"seq": seq, "log": log} for seq, log in events], "next": last_seq}
+    )
+
+
+@app.route("/stats", methods=["GET"])
+def stats():
+    """A run's event count, counts per component, first SUBMIT, last NAVIGATE url, every NAVIGATE url and event timestamps"""
+    return jsonify(log_streams.read_stats(get_log_filepath(get_run_id())))
 
 
 if __name__ == "__main__":
-    app.run(debug=True, port=os.getenv("FLASK_RUN_PORT"))
+    if "-prod" in sys.argv[1:]:
+        # Multi-threaded server without the debugger and reloader. All threads share
+        # log_writer, so concurrent requests never interleave partial lines. Unlike the
+        # dev server, it keeps connections alive between requests.
+        from waitress import serve
+
+        serve(
+            app,
+            host="127.0.0.1",
+            port=int(os.getenv("FLASK_RUN_PORT")),
+            threads=LOG_SERVER_THREADS,
+        )
+    else:
+        app.run(debug=True, port=os.getenv("FLASK_RUN_PORT"))
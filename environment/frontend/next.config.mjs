@@ -7,12 +7,21 @@ const projectDir = process.cwd();
 loadEnvConfig(projectDir);
 
 const nextConfig = {
+    // With LOG_DIRECT=1 the frontend logger posts straight to the log server, skipping
+    // the rewrites below (the log server allows this through CORS)
+    env: {
+        LOG_SERVER_URL: process.env.LOG_DIRECT === '1' ? `http://127.0.0.1:${process.env.FLASK_RUN_PORT}` : '',
+    },
     async rewrites() {
         return [
           {
             source: '/log',
             destination: `http://127.0.0.1:${process.env.FLASK_RUN_PORT}/log`,
           },
+          {
+            source: '/log/batch',
+            destination: `http://127.0.0.1:${process.env.FLASK_RUN_PORT}/log/batch`,
+          },
         ]
     },
 };
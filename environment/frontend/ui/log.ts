@@ -1,37 +1,156 @@
-export async function log({
-  component,
-  label,
-  newVal,
-  oldVal,
-}: {
+// The harness opens each page with ?run=<id> so that several agents can share one
+// log server. The id is kept for the tab so it survives client-side navigation.
+function getRunId(): string | null {
+  if (typeof window === "undefined") return null;
+
+  const runId = new URLSearchParams(window.location.search).get("run");
+  if (runId !== null) {
+    window.sessionStorage.setItem("run", runId);
+    return runId;
+  }
+
+  return window.sessionStorage.getItem("run");
+}
+
+type LogFields = {
   component: string;
   label: string;
   newVal?: string;
   oldVal?: string;
-}) {
-  await fetch("/log", {
-    method: "POST",
-    headers: {
-      "Content-Type": "application/json",
-    },
-    body: JSON.stringify({
-      log: `${component} // ${label}${
-        newVal !== undefined ? " // " + newVal : ""
-      }${oldVal !== undefined ? " // " + oldVal : ""}`,
-    }),
+};
+
+type QueuedEvent = LogFields & { log: string; seq: number };
+
+// Events are queued and sent together to /log/batch, so the page doesn't wait on a
+// round trip to the log server for every interaction
+const FLUSH_DELAY_MS = 50;
+const MAX_BATCH_SIZE = 50;
+
+// Set by next.config.mjs when LOG_DIRECT=1, so events go straight to the log server
+// instead of through the Next.js rewrites
+const LOG_SERVER_URL = process.env.LOG_SERVER_URL ?? "";
+
+let queue: QueuedEvent[] = [];
+let flushTimer: ReturnType<typeof setTimeout> | null = null;
+// Batches are sent one after another so the server receives events in order
+let lastFlush: Promise<void> = Promise.resolve();
+
+// Numbers events in the order they were logged. Kept for the tab so numbering
+// continues across full page loads.
+function nextSeq(): number {
+  const seq = Number(window.sessionStorage.getItem("logSeq") ?? "0") + 1;
+  window.sessionStorage.setItem("logSeq", String(seq));
+  return seq;
+}
+
+// Records the batch as the last one the tab sent and returns the seq of the last event
+// sent for the same run before it. The server uses it to write a batch that arrives
+// early (a pagehide beacon overtaking a fetch still in flight) after the one before it.
+function markSent(runId: string | null, events: QueuedEvent[]): number | null {
+  const sent = JSON.parse(window.sessionStorage.getItem("logSent") ?? "null");
+  window.sessionStorage.setItem(
+    "logSent",
+    JSON.stringify({ run: runId, seq: events[events.length - 1].seq })
+  );
+  return sent !== null && sent.run === runId ? sent.seq : null;
+}
+
+function batchUrl(runId: string | null): string {
+  return (
+    LOG_SERVER_URL +
+    (runId !== null
+      ? `/log/batch?run=${encodeURIComponent(runId)}`
+      : "/log/batch")
+  );
+}
+
+// Direct posts are sent as a CORS simple request (text/plain, run id in the url) so
+// the browser doesn't need a preflight first
+function batchHeaders(runId: string | null): Record<string, string> {
+  if (LOG_SERVER_URL !== "") return { "Content-Type": "text/plain" };
+  return {
+    "Content-Type": "application/json",
+    ...(runId !== null ? { "X-Run-Id": runId } : {}),
+  };
+}
+
+function flush(): Promise<void> {
+  if (flushTimer !== null) {
+    clearTimeout(flushTimer);
+    flushTimer = null;
+  }
+  if (queue.length === 0) return lastFlush;
+
+  const events = queue;
+  queue = [];
+  const runId = getRunId();
+  const prev = markSent(runId, events);
+
+  // keepalive lets the request finish even if the page is unloaded meanwhile
+  lastFlush = lastFlush.then(() =>
+    fetch(batchUrl(runId), {
+      method: "POST",
+      headers: batchHeaders(runId),
+      body: JSON.stringify({ events, prev }),
+      keepalive: true,
+    }).then(
+      () => undefined,
+      () => undefined
+    )
+  );
+  return lastFlush;
+}
+
+// Whatever is still queued when the page goes away is handed to the browser to send.
+// It can't wait for earlier batches to be delivered, so the server orders it by prev.
+function flushOnPageHide() {
+  if (queue.length === 0) return;
+
+  const events = queue;
+  queue = [];
+  const runId = getRunId();
+  const prev = markSent(runId, events);
+  navigator.sendBeacon(
+    batchUrl(runId),
+    new Blob([JSON.stringify({ events, prev })], {
+      type: LOG_SERVER_URL !== "" ? "text/plain" : "application/json",
+    })
+  );
+}
+
+if (typeof window !== "undefined") {
+  window.addEventListener("pagehide", flushOnPageHide);
+  document.addEventListener("visibilitychange", () => {
+    if (document.visibilityState === "hidden") flushOnPageHide();
   });
 }
 
-export async function submit({ input }: { input: string }) {
-  await fetch("/log", {
-    method: "POST",
-    headers: {
-      "Content-Type": "application/json",
-    },
-    body: JSON.stringify({
-      log: `SUBMIT // ${input}`,
-    }),
+// Queues the legacy `component // label // new // old` line along with the separate
+// fields, which the log server uses for its structured (JSONL) format. Resolves right
+// away; use flushLogs() to wait until queued events have been delivered.
+export async function log(fields: LogFields) {
+  if (typeof window === "undefined") return;
+
+  const { component, label, newVal, oldVal } = fields;
+  queue.push({
+    log: `${component} // ${label}${newVal !== undefined ? " // " + newVal : ""}${
+      oldVal !== undefined ? " // " + oldVal : ""
+    }`,
+    ...fields,
+    seq: nextSeq(),
   });
+
+  if (queue.length >= MAX_BATCH_SIZE) flush();
+  else if (flushTimer === null) flushTimer = setTimeout(flush, FLUSH_DELAY_MS);
+}
+
+export async function flushLogs() {
+  await flush();
+}
+
+export async function submit({ input }: { input: string }) {
+  await log({ component: "SUBMIT", label: input });
+  await flushLogs();
 }
 
 function deepSortObject(obj: any) {
@@ -52,14 +171,9 @@ export function stringifyJsonSortKeys(obj: any) {
   return JSON.stringify(sorted_obj);
 }
 
+// NAVIGATE events split trajectories into checkpoints, so they (and everything before
+// them) are delivered before the caller moves on to the new page
 export async function navigate({ url }: { url: string }) {
-  await fetch("/log", {
-    method: "POST",
-    headers: {
-      "Content-Type": "application/json",
-    },
-    body: JSON.stringify({
-      log: `NAVIGATE // ${url}`,
-    }),
-  });
+  await log({ component: "NAVIGATE", label: url });
+  await flushLogs();
 }
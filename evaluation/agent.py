@@ -1,10 +1,22 @@
 import sys
 
-from evaluation.agents.natbot.natbot import run_natbot
+from evaluation.agents.natbot.natbot import Crawler, run_natbot
+from evaluation.worker import serve
 
 # from evaluation.agents.seeact.script import run_seeact
 
 if __name__ == "__main__":
+    # Long-lived mode used by AgentWorker: one browser is reused across jobs
+    if sys.argv[1].startswith("-worker="):
+        serve(
+            sys.argv[1].split("=", 1)[1],
+            Crawler,
+            lambda crawler, goal, url, should_stop: run_natbot(
+                goal, url, auto=True, crawler=crawler, should_stop=should_stop
+            ),
+        )
+        sys.exit()
+
     goal = sys.argv[1]
     url = sys.argv[2]
 
@@ -0,0 +1,42 @@
+"""A stand-in agent for checking the harness without a browser or model. It appends a fixed set of events, derived from the goal, to the run's log after a random delay, so that concurrent runs finish in varying order.
+
+Use it with AGENT_MODULE=evaluation.agents.mock.mock.
+"""
+
+import hashlib
+import random
+import sys
+import time
+from typing import Callable
+from urllib.parse import parse_qs, urlparse
+
+from evaluation.utils import get_run_log_filepath
+from evaluation.worker import serve
+
+MAX_DELAY = 0.5
+
+
+def run_mock(goal: str, url: str, should_stop: Callable[[], bool] | None = None):
+    run_id = parse_qs(urlparse("http://" + url).query)["run"][0]
+    digest = hashlib.sha256(goal.encode()).digest()
+
+    time.sleep(random.uniform(0, MAX_DELAY))
+    if should_stop is not None and should_stop():
+        return
+
+    with open(get_run_log_filepath(run_id), "a") as file:
+        for i in range(digest[0] % 4):
+            file.write(f"click/button // mock {digest[i + 1]}\n")
+        if digest[5] % 2 == 0:
+            file.write("SUBMIT // {}\n")
+
+
+if __name__ == "__main__":
+    if sys.argv[1].startswith("-worker="):
+        serve(
+            sys.argv[1].split("=", 1)[1],
+            lambda: None,
+            lambda _, goal, url, should_stop: run_mock(goal, url, should_stop),
+        )
+    else:
+        run_mock(sys.argv[1], sys.argv[2])
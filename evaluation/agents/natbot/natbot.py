@@ -9,6 +9,7 @@ import os
 from playwright.sync_api import sync_playwright
 import time
 from sys import argv, exit, platform
+from typing import Callable
 from openai import OpenAI
 
 client = OpenAI(api_key=os.environ.get("OPENAI_API_KEY"))
@@ -186,6 +187,15 @@ class Crawler:
             headless=False,
         )
 
+        self.page = None
+        self.new_page()
+
+    def new_page(self):
+        # A page from browser.new_page has its own context, so no cookies or storage
+        # carry over from the previous page
+        if self.page is not None:
+            self.page.close()
+
         self.page = self.browser.new_page()
         self.page.set_viewport_size({"width": 1280, "height": 1080})
 
@@ -574,8 +584,17 @@ class Crawler:
         return elements_of_interest
 
 
-def run_natbot(goal: str, url: str, auto: bool = False):
-    _crawler = Crawler()
+def run_natbot(
+    goal: str,
+    url: str,
+    auto: bool = False,
+    crawler: Crawler | None = None,
+    should_stop: Callable[[], bool] | None = None,
+):
+    # A crawler passed in (by a long-lived worker) is reused with a fresh page and left open
+    if crawler is not None:
+        crawler.new_page()
+    _crawler = crawler if crawler is not None else Crawler()
 
     def print_help():
         print(
@@ -627,6 +646,10 @@ def run_natbot(goal: str, url: str, auto: bool = False):
 
     try:
         while True:
+            if should_stop is not None and should_stop():
+                print("Cancelled.")
+                break
+
             browser_content = "\n".join(_crawler.crawl())
             prev_cmd = gpt_cmd
             gpt_cmd = get_gpt_command(
@@ -679,5 +702,6 @@ def run_natbot(goal: str, url: str, auto: bool = False):
     except KeyboardInterrupt:
         print("\n[!] Ctrl+C detected, exiting gracefully.")
 
-    _crawler.browser.close()
-    _crawler.playwright.stop()
+    if crawler is None:
+        _crawler.browser.close()
+        _crawler.playwright.stop()
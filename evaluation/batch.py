@@ -0,0 +1,248 @@
+"""Evaluating many runs at once, for reprocessing large runs with -evalonly -batch.
+
+The logs of all the runs are loaded into integer columns, one row per log in run order: the component, label, new and old values, each dictionary-encoded (the index of the value, which may be None, in its column's dictionary), plus the offset of each run's first row, from which a row's run and position follow. A column is only encoded once an evaluator checks its field, the logs of runs that an eval fails on their number alone aren't loaded, and lines repeated across the runs of a memory-mapped log are only decoded once. Each test's eval is traced into the combinator it returns (ordered, unordered, at_least_one or no_logs) and its evaluators. When these only use exact_match and all_log, all the runs of the test are evaluated together with NumPy masks over the columns and counts per run. Other evals, e.g. those using compare_values or contains_match or doing more than returning a combinator, run on each run's logs as usual, as do all evals when NumPy isn't installed.
+"""
+
+from collections.abc import Sequence
+from itertools import chain
+from operator import attrgetter
+from types import FunctionType
+
+from evaluation.bulk import LOG_FIELDS, LazyLog, LazyLogs
+from evaluation.evaluators import (
+    AllLog,
+    Eval,
+    ExactMatch,
+    Log,
+    LogEvaluator,
+    LogListEvaluator,
+)
+
+try:
+    import numpy as np
+except ImportError:  # optional, only needed to evaluate in batches
+    np = None
+
+# Large enough for the masks to cover many runs of each test, while the pending blocks stay few
+# enough to hold in memory (and for the garbage collector to scan)
+BATCH_SIZE = 10000
+
+
+class Trace:
+    """The combinator and evaluators a traced eval returns. Using it as a bool (e.g. `and`-ing two combinators) raises, so such evals aren't traced."""
+
+    def __init__(self, combinator: str, evaluators: list[LogEvaluator]):
+        self.combinator = combinator
+        self.evaluators = evaluators
+
+    def __bool__(self):
+        raise TypeError("a traced combinator has no truth value")
+
+    def is_vectorizable(self) -> bool:
+        return all(is_vectorizable(evaluator) for evaluator in self.evaluators)
+
+    def get_needed_logs(self, runs: list[Sequence[Log]]) -> list[Sequence[Log]]:
+        """The logs of runs the combinator reads, with those of runs it fails or passes on their number of logs alone left empty"""
+        if self.combinator == "no_logs":
+            return [()] * len(runs)
+        if self.combinator == "at_least_one":
+            return runs
+        return [logs if len(logs) == len(self.evaluators) else () for logs in runs]
+
+
+class TracedLogs:
+    """Stands in for the logs while tracing an eval. Doing anything with them but passing them to a combinator raises, as the eval's result would then depend on them."""
+
+
+class TracedEval(Eval):
+    """Stands in for Eval while tracing an eval: its combinators return a Trace instead of running"""
+
+    @staticmethod
+    def no_logs(logs: TracedLogs) -> Trace | None:
+        return Trace("no_logs", []) if isinstance(logs, TracedLogs) else None
+
+    @staticmethod
+    def ordered(logs: TracedLogs, evaluators: list[LogEvaluator]) -> Trace | None:
+        return Trace("ordered", evaluators) if isinstance(logs, TracedLogs) else None
+
+    @staticmethod
+    def unordered(logs: TracedLogs, evaluators: list[LogEvaluator]) -> Trace | None:
+        return Trace("unordered", evaluators) if isinstance(logs, TracedLogs) else None
+
+    @staticmethod
+    def at_least_one(logs: TracedLogs, evaluators: list[LogEvaluator]) -> Trace | None:
+        return (
+            Trace("at_least_one", evaluators) if isinstance(logs, TracedLogs) else None
+        )
+
+
+def trace_eval(eval: LogListEvaluator) -> Trace | None:
+    """The combinator and evaluators eval returns, found by running a copy of it with TracedEval as its `eval`, or None if it can't be traced"""
+    if not isinstance(eval, FunctionType) or "eval" not in eval.__code__.co_names:
+        return None
+
+    traced = FunctionType(
+        eval.__code__,
+        {**eval.__globals__, "eval": TracedEval},
+        eval.__name__,
+        eval.__defaults__,
+        eval.__closure__,
+    )
+    try:
+        trace = traced(TracedLogs())
+    except Exception:
+        return None
+    return trace if isinstance(trace, Trace) else None
+
+
+def is_vectorizable(evaluator: LogEvaluator) -> bool:
+    if isinstance(evaluator, AllLog):
+        return all(is_vectorizable(inner) for inner in evaluator.evaluators)
+    return isinstance(evaluator, ExactMatch)
+
+
+def get_all_logs(runs: list[Sequence[Log]]) -> list[Log]:
+    """The logs of runs in order. For runs from a memory-mapped log, one Log is created per distinct line and shared by the runs repeating it."""
+    # type() rather than isinstance(), which is slow for a Sequence
+    lines = chain.from_iterable(logs.lines for logs in runs if type(logs) is LazyLogs)
+    shared = {line: LazyLog(line) for line in dict.fromkeys(lines)}
+
+    return list(
+        chain.from_iterable(
+            map(shared.__getitem__, logs.lines) if type(logs) is LazyLogs else logs
+            for logs in runs
+        )
+    )
+
+
+class LogColumns:
+    """The logs of many runs as dictionary-encoded NumPy columns, one row per log"""
+
+    def __init__(self, runs: list[Sequence[Log]], lengths: list[int]):
+        """Loads the logs of runs, whose lengths are given. Runs whose logs aren't needed can be given as empty, and are only evaluated by their number of logs."""
+        self.lengths = np.array(lengths, dtype=np.int64)
+        self.starts = np.zeros(len(runs) + 1, dtype=np.int64)
+        np.cumsum([len(logs) for logs in runs], out=self.starts[1:])
+
+        self.logs = get_all_logs(runs)
+        self.dictionaries: dict[str, dict[str | None, int]] = {}
+        self.columns: "dict[str, np.ndarray]" = {}
+
+    def get_column(self, field: str) -> "np.ndarray":
+        """The codes of field in each row, encoded the first time an evaluator checks it. Every step over the logs runs in C, and only collects references to their existing values."""
+        if field not in self.columns:
+            values = list(map(attrgetter(field), self.logs))
+            codes = self.dictionaries[field] = {
+                value: code for code, value in enumerate(dict.fromkeys(values))
+            }
+            self.columns[field] = np.fromiter(
+                map(codes.__getitem__, values), dtype=np.int32, count=len(values)
+            )
+        return self.columns[field]
+
+    def get_mask(self, evaluator: LogEvaluator, rows: "np.ndarray") -> "np.ndarray":
+        """Whether evaluator matches the log of each row"""
+        mask = np.ones(len(rows), dtype=bool)
+
+        if isinstance(evaluator, AllLog):
+            for inner in evaluator.evaluators:
+                mask &= self.get_mask(inner, rows)
+            return mask
+
+        for field in LOG_FIELDS:
+            value = getattr(evaluator, field)
+            if value is None:
+                continue
+            column = self.get_column(field)
+            code = self.dictionaries[field].get(value)
+            if code is None:
+                return np.zeros(len(rows), dtype=bool)
+            mask &= column[rows] == code
+
+        return mask
+
+    def get_any_mask(
+        self, evaluators: list[LogEvaluator], rows: "np.ndarray"
+    ) -> "np.ndarray":
+        """Whether any of evaluators matches the log of each row"""
+        mask = np.zeros(len(rows), dtype=bool)
+        for evaluator in evaluators:
+            mask |= self.get_mask(evaluator, rows)
+        return mask
+
+    def get_rows(self, runs: "np.ndarray") -> "tuple[np.ndarray, np.ndarray]":
+        """The rows of the given runs, and the index in runs of each row's run"""
+        lengths = self.starts[runs + 1] - self.starts[runs]
+        owners = np.repeat(np.arange(len(runs)), lengths)
+        first_rows = np.repeat(
+            self.starts[runs] - np.cumsum(lengths) + lengths, lengths
+        )
+        return first_rows + np.arange(len(owners)), owners
+
+    def evaluate(self, trace: Trace, runs: "np.ndarray") -> "np.ndarray":
+        """Whether each of the given runs passes the traced eval, as its combinator would return"""
+        lengths = self.lengths[runs]
+
+        if trace.combinator == "no_logs":
+            return lengths == 0
+
+        if trace.combinator == "at_least_one":
+            rows, owners = self.get_rows(runs)
+            matched = owners[self.get_any_mask(trace.evaluators, rows)]
+            return np.bincount(matched, minlength=len(runs)) > 0
+
+        passed = lengths == len(trace.evaluators)
+        candidates = runs[passed]
+
+        if trace.combinator == "ordered":
+            for position, evaluator in enumerate(trace.evaluators):
+                matched = self.get_mask(evaluator, self.starts[candidates] + position)
+                passed[passed] = matched
+                candidates = candidates[matched]
+        else:
+            rows, owners = self.get_rows(candidates)
+            unmatched = owners[~self.get_any_mask(trace.evaluators, rows)]
+            passed[passed] = np.bincount(unmatched, minlength=len(candidates)) == 0
+
+        return passed
+
+
+def evaluate_logs(
+    runs: list[Sequence[Log]], evals: list[LogListEvaluator]
+) -> list[bool]:
+    """Whether the logs of each run pass its eval. The runs of each vectorizable eval are evaluated together over LogColumns, and the others one by one."""
+    results = [False] * len(runs)
+    runs_by_eval: dict[LogListEvaluator, list[int]] = {}
+    for index, eval in enumerate(evals):
+        runs_by_eval.setdefault(eval, []).append(index)
+
+    traces = {}
+    if np is not None:
+        for eval in runs_by_eval:
+            trace = trace_eval(eval)
+            if trace is not None and trace.is_vectorizable():
+                traces[eval] = trace
+
+    # Only the runs evaluated together are loaded into columns, in their own order
+    batched_runs = []
+    batched_lengths = []
+    for eval, trace in traces.items():
+        eval_runs = [runs[index] for index in runs_by_eval[eval]]
+        batched_runs += trace.get_needed_logs(eval_runs)
+        batched_lengths += map(len, eval_runs)
+    columns = LogColumns(batched_runs, batched_lengths) if traces else None
+    offset = 0
+
+    for eval, indices in runs_by_eval.items():
+        if eval in traces:
+            passed = columns.evaluate(
+                traces[eval], np.arange(offset, offset + len(indices))
+            )
+            offset += len(indices)
+            for index, result in zip(indices, passed.tolist()):
+                results[index] = result
+        else:
+            for index in indices:
+                results[index] = bool(eval(runs[index]))
+
+    return results
@@ -0,0 +1,216 @@
+"""Reading very large legacy logs in bulk, e.g. to reevaluate archived runs with -evalonly.
+
+The log is memory-mapped and its TEST blocks are found by searching the bytes for the markers, so no line is read in Python outside of the selected blocks. Within a block, the SUBMIT and NAVIGATE lines are found the same way, and the other events are only sliced at their newlines. Each Log is created when the evaluator first gets it, and only split at its `//` separators and decoded once one of its fields is read, so events the evaluator never looks at are never decoded. Logs holding JSONL records are left to the line-by-line parser (see parse_test_blocks in evaluation/utils.py).
+"""
+
+import mmap
+import os
+import re
+from collections.abc import Sequence
+from functools import cached_property
+from typing import Iterator
+
+from evaluation.evaluators import Log
+from evaluation.store import key_matches
+from evaluation.trajectory import TestBlock
+
+LOG_FIELDS = ("component", "label", "newValue", "oldValue")
+MARKER_PATTERN = re.compile(rb"TEST (BEGIN|FINISH)")
+# A blank or whitespace-only line, searched for in "\n" + the text
+BLANK_LINE_PATTERN = re.compile(rb"\n[^\S\n]*\n")
+
+
+def find_lines(
+    data: bytes | mmap.mmap,
+    marker: bytes,
+    component: bool = False,
+) -> Iterator[int]:
+    """Yields the offsets of the lines of data that begin with marker, after any whitespace, since lines are stripped before they are parsed. With component, the marker must be the line's whole component, i.e. followed by `//` or the end of the line."""
+    index = data.find(marker)
+
+    while index != -1:
+        line_start = data.rfind(b"\n", 0, index) + 1
+        if not data[line_start:index].strip():
+            line_end = data.find(b"\n", index)
+            rest = data[index + len(marker) : line_end if line_end != -1 else None]
+            if not component or not rest.strip() or rest.lstrip().startswith(b"//"):
+                yield line_start
+        index = data.find(marker, index + len(marker))
+
+
+def line_indices(data: bytes, offsets: Iterator[int]) -> list[int]:
+    """Turns the offsets of lines in data into their indices, counting newlines in bulk between them"""
+    indices = []
+    line = 0
+    position = 0
+
+    for offset in offsets:
+        line += data.count(b"\n", position, offset)
+        position = offset
+        indices.append(line)
+
+    return indices
+
+
+class LazyLog(Log):
+    """A Log over one legacy event line, which is only split and decoded once one of its fields is read"""
+
+    __slots__ = ("line",)
+
+    def __init__(self, line: bytes):
+        self.line = line
+
+    def __getattr__(self, name: str):
+        # Only called while the fields haven't been set
+        if name not in LOG_FIELDS:
+            raise AttributeError(name)
+        super().__init__(self.line.decode())
+        return getattr(self, name)
+
+
+class LazyLogs(Sequence):
+    """The Logs of a block's event lines. A Log is created when the evaluator first gets it by index, so e.g. an ordered eval whose length doesn't match creates none. Iterating, as at_least_one and unordered do, reads every Log anyway, so it creates the rest at once."""
+
+    def __init__(self, lines: list[bytes]):
+        self.lines = lines
+        self.logs: list[Log | None] = [None] * len(lines)
+
+    def __len__(self) -> int:
+        return len(self.lines)
+
+    def __getitem__(self, index):
+        if isinstance(index, slice):
+            return [self[i] for i in range(*index.indices(len(self)))]
+
+        log = self.logs[index]
+        if log is None:
+            log = self.logs[index] = LazyLog(self.lines[index])
+        return log
+
+    def __iter__(self):
+        if None in self.logs:
+            self.logs = [
+                Log(line.decode()) if log is None else log
+                for line, log in zip(self.lines, self.logs)
+            ]
+        return iter(self.logs)
+
+
+class MappedBlock(TestBlock):
+    """A TestBlock sliced out of a MappedLog, with its SUBMIT and NAVIGATE lines found by scanning its bytes. Its lines and events are only decoded if asked for (e.g. for cache keys)."""
+
+    def __init__(self, key: str, data: bytes, body_start: int, body_end: int):
+        self.key = key
+        self.data = data
+        self.body = data[body_start:body_end]
+        self.body_lines = self.body.split(b"\n")[:-1]
+
+        self.blank = (
+            {index for index, line in enumerate(self.body_lines) if not line.strip()}
+            if BLANK_LINE_PATTERN.search(b"\n" + self.body)
+            else set()
+        )
+        self.submits = line_indices(
+            self.body, find_lines(self.body, b"SUBMIT", component=True)
+        )
+
+    def without(self, excluded: set[int]) -> list[bytes]:
+        """The body's lines but the excluded ones, joining the slices between them"""
+        lines = []
+        position = 0
+        for index in sorted(excluded):
+            lines += self.body_lines[position:index]
+            position = index + 1
+        return lines + self.body_lines[position:]
+
+    @cached_property
+    def lines(self) -> list[str]:
+        return self.data.decode().splitlines(keepends=True)
+
+    @cached_property
+    def events(self) -> list[str]:
+        return [line.decode().strip() for line in self.without(self.blank)]
+
+    @cached_property
+    def logs(self) -> Sequence[Log]:
+        return LazyLogs(self.without(self.blank | set(self.submits)))
+
+    @cached_property
+    def submit(self) -> Log | None:
+        return LazyLog(self.body_lines[self.submits[-1]]) if self.submits else None
+
+    @cached_property
+    def checkpoints(self) -> list[dict]:
+        navigates = line_indices(
+            self.body, find_lines(self.body, b"NAVIGATE", component=True)
+        )
+        checkpoints = []
+
+        for navigate, end in zip(navigates, navigates[1:] + [len(self.body_lines)]):
+            checkpoints.append(
+                {
+                    "url": LazyLog(self.body_lines[navigate]).label,
+                    "logs": [
+                        LazyLog(self.body_lines[index])
+                        for index in range(navigate + 1, end)
+                        if index not in self.blank
+                    ],
+                }
+            )
+
+        return checkpoints
+
+
+class MappedLog:
+    """A log file memory-mapped for reading; use as a context manager"""
+
+    def __init__(self, filepath: str):
+        self.file = open(filepath, "rb")
+        self.map = (
+            mmap.mmap(self.file.fileno(), 0, access=mmap.ACCESS_READ)
+            if os.path.getsize(filepath) > 0
+            else b""
+        )
+
+    def __enter__(self) -> "MappedLog":
+        return self
+
+    def __exit__(self, *_):
+        self.close()
+
+    def close(self):
+        if isinstance(self.map, mmap.mmap):
+            self.map.close()
+        self.file.close()
+
+    def has_records(self) -> bool:
+        """Whether any line is a JSONL record, which this reader leaves to the line parser"""
+        return next(find_lines(self.map, b"{"), None) is not None
+
+    def blocks(self, selectors: list[str] | None = None) -> Iterator[MappedBlock]:
+        """Yields each complete, selected block in order, as parse_test_blocks does: blocks cut off by another TEST BEGIN or the end of the file are skipped"""
+        begin = None
+
+        for match in MARKER_PATTERN.finditer(self.map):
+            line_start = self.map.rfind(b"\n", 0, match.start()) + 1
+            if self.map[line_start : match.start()].strip():
+                # e.g. a label mentioning the marker
+                continue
+
+            if match[1] == b"BEGIN":
+                begin = line_start
+                header_end = self.map.find(b"\n", begin)
+                if header_end == -1:
+                    return
+            elif begin is not None:
+                end = self.map.find(b"\n", line_start)
+                end = len(self.map) if end == -1 else end + 1
+                key = self.map[begin:header_end].decode().split(":")[1].strip()
+                if key_matches(key, selectors):
+                    yield MappedBlock(
+                        key,
+                        self.map[begin:end],
+                        header_end + 1 - begin,
+                        line_start - begin,
+                    )
+                begin = None
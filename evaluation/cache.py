@@ -0,0 +1,102 @@
+"""On-disk cache of per-block evaluation results, so re-evaluating an append-only log only pays for the blocks that are new.
+
+Results are keyed by a hash of the TEST block's text and a fingerprint of the code that parses and evaluates it (see fingerprint_files), so editing a test or evaluator invalidates them. The cache is a SQLite file; once it grows past max_bytes, the least recently used results are evicted.
+"""
+
+import hashlib
+import os
+import pickle
+import sqlite3
+import time
+from typing import Any
+
+CACHE_FILEPATH = os.path.join(
+    os.path.dirname(__file__), "../trajectories/eval_cache.sqlite"
+)
+MAX_CACHE_BYTES = int(os.getenv("EVAL_CACHE_MAX_BYTES", str(256 * 1024 * 1024)))
+
+
+def fingerprint_files(*filepaths: str) -> str:
+    digest = hashlib.sha256()
+    for filepath in filepaths:
+        with open(filepath, "rb") as file:
+            digest.update(file.read())
+    return digest.hexdigest()
+
+
+class EvalCache:
+    def __init__(
+        self,
+        fingerprint: str,
+        filepath: str = CACHE_FILEPATH,
+        max_bytes: int = MAX_CACHE_BYTES,
+    ):
+        self.fingerprint = fingerprint
+        self.filepath = filepath
+        self.max_bytes = max_bytes
+        self.hits = 0
+        self.misses = 0
+
+        os.makedirs(os.path.dirname(filepath), exist_ok=True)
+        self.connection = sqlite3.connect(filepath)
+        self.connection.execute(
+            "CREATE TABLE IF NOT EXISTS results (key TEXT PRIMARY KEY, value BLOB, size INTEGER, last_used REAL)"
+        )
+        self.connection.execute(
+            "CREATE INDEX IF NOT EXISTS results_last_used ON results (last_used)"
+        )
+
+    def key(self, block: list[str]) -> str:
+        digest = hashlib.sha256(self.fingerprint.encode())
+        for line in block:
+            digest.update(line.encode())
+        return digest.hexdigest()
+
+    def get(self, key: str) -> Any | None:
+        row = self.connection.execute(
+            "SELECT value FROM results WHERE key = ?", (key,)
+        ).fetchone()
+        if row is None:
+            self.misses += 1
+            return None
+
+        self.hits += 1
+        self.connection.execute(
+            "UPDATE results SET last_used = ? WHERE key = ?", (time.time(), key)
+        )
+        return pickle.loads(row[0])
+
+    def put(self, key: str, value: Any):
+        data = pickle.dumps(value)
+        self.connection.execute(
+            "INSERT OR REPLACE INTO results VALUES (?, ?, ?, ?)",
+            (key, data, len(data), time.time()),
+        )
+
+    def describe_hits(self) -> str | None:
+        """Says how many of the blocks looked up took their result from the cache, if any did, since those weren't evaluated again"""
+        if self.hits == 0:
+            return None
+        return f"{self.hits} of {self.hits + self.misses} blocks took their result from the eval cache ({os.path.normpath(self.filepath)}); pass -nocache to evaluate them again"
+
+    def evict(self):
+        """Drops the least recently used results until the cache fits in max_bytes"""
+        total = self.connection.execute(
+            "SELECT COALESCE(SUM(size), 0) FROM results"
+        ).fetchone()[0]
+        rows = self.connection.execute(
+            "SELECT key, size FROM results ORDER BY last_used"
+        )
+
+        evicted = []
+        for key, size in rows:
+            if total <= self.max_bytes:
+                break
+            evicted.append((key,))
+            total -= size
+        self.connection.executemany("DELETE FROM results WHERE key = ?", evicted)
+
+    def close(self):
+        self.evict()
+        self.connection.commit()
+        self.connection.close()
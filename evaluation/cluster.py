@@ -0,0 +1,380 @@
+"""Runs a suite's trials across several hosts, each with its own environment (`./start.sh`) and agents, when one host can't hold enough browsers.
+
+The coordinator is `python -m evaluation.ind` (or `e2e`) run with -coordinate=<host:port>. It listens there and hands shards of trials, longest expected first, to the hosts that connect with `python -m evaluation.cluster <host:port> [-j=N] [-workers] [-noprewarm]`. Each host waits for its environment to be warm, then runs trials on up to N agents at once, asking for more as soon as an agent is free, and streams every finished block back. The coordinator appends each block to its log (or store) and records it in its RunJournal as soon as it arrives, and the evaluation lists the tests in suite order, so the suite is evaluated as if it had run on one host. If a trial raises or its host disconnects, it goes to the next host that asks, up to MAX_TRIAL_ATTEMPTS tries in all. The run fails if a trial runs out of tries, or if no host is connected for NO_HOSTS_TIMEOUT seconds while trials are left. Both sides authenticate with the same CLUSTER_KEY from their environment.
+
+Hosts send {"type": "hello", "name", "capacity"}, {"type": "request", "count"} (when count agents are free and no request is outstanding), {"type": "result", "index", "block", "trial"} and {"type": "error", "index", "error"}. The coordinator answers each request, once trials are pending, with {"type": "shard", "suite", "limits_from", "trials": [{"index", "key", "repetition", "test"}]} of up to count trials, or with {"type": "done"} once the suite has finished.
+"""
+
+import os
+import queue
+import re
+import socket
+import sys
+import threading
+import time
+from collections import deque
+from concurrent.futures import Future, ThreadPoolExecutor
+from multiprocessing.connection import Client, Listener
+from typing import Any, Generator, Literal
+
+from evaluation.durations import schedule
+from evaluation.utils import (
+    AgentWorker,
+    close_run_log,
+    kill_running_agents,
+    wait_until_warm,
+)
+
+HOST_NAME = f"{socket.gethostname()}-{os.getpid()}"
+# Tries a trial gets across the hosts before the run fails: one that raises, or whose host disconnects, goes to the next host that asks
+MAX_TRIAL_ATTEMPTS = 3
+# Seconds the coordinator waits for a host to connect while trials are left, before the run fails
+NO_HOSTS_TIMEOUT = 600
+
+
+def get_cluster_key() -> bytes:
+    key = os.getenv("CLUSTER_KEY")
+    if not key:
+        raise Exception("ERROR: set CLUSTER_KEY to the same secret on every host")
+    return key.encode()
+
+
+def parse_address(address: str) -> tuple[str, int]:
+    host, port = address.rsplit(":", 1)
+    return host, int(port)
+
+
+class HostConnection:
+    """A connected host: the trials it was sent and hasn't returned, and how many more it has asked for"""
+
+    def __init__(self, connection, name: str, capacity: int):
+        self.connection = connection
+        self.name = name
+        self.capacity = capacity
+        self.assigned: dict[int, dict[str, Any]] = {}
+        self.requested = 0
+        self.connected = True
+
+
+class Coordinator:
+    """Listens for hosts on address and runs trials on them (see run) until closed"""
+
+    def __init__(
+        self,
+        address: tuple[str, int],
+        suite: Literal["ind", "e2e"],
+        limits_from: Literal["stream", "stats"],
+    ):
+        self.suite = suite
+        self.limits_from = limits_from
+        self.listener = Listener(address, authkey=get_cluster_key())
+        self.condition = threading.Condition()
+        self.pending: deque[dict[str, Any]] = deque()
+        self.results: dict[int, tuple[str, dict[str, Any]]] = {}
+        self.attempts: dict[int, int] = {}
+        # Why each trial that ran out of tries failed
+        self.failures: list[str] = []
+        self.next_index = 0
+        self.num_hosts = 0
+        self.no_hosts_since: float | None = time.time()
+        self.closed = False
+
+        print(f"Waiting for hosts on {address[0]}:{address[1]}")
+        threading.Thread(target=self.accept, daemon=True).start()
+
+    def accept(self):
+        while not self.closed:
+            try:
+                connection = self.listener.accept()
+            except Exception:
+                # e.g. a host with the wrong CLUSTER_KEY, or the listener was closed
+                continue
+            threading.Thread(target=self.serve, args=(connection,), daemon=True).start()
+
+    def retry(self, trial: dict[str, Any], error: str):
+        """Puts a trial that raised or whose host disconnected back at the front of the queue, or fails it once it has had MAX_TRIAL_ATTEMPTS tries. Called with the condition held."""
+        if self.attempts[trial["index"]] >= MAX_TRIAL_ATTEMPTS:
+            self.failures.append(
+                f"{trial['key']} (repetition {trial['repetition']}) failed {MAX_TRIAL_ATTEMPTS} times, last {error}"
+            )
+        else:
+            self.pending.appendleft(trial)
+
+    def send_shards(self, host: HostConnection):
+        """Answers each of the host's requests with a shard once trials are pending, or with done once closed"""
+        while True:
+            with self.condition:
+                self.condition.wait_for(
+                    lambda: self.closed
+                    or not host.connected
+                    or (host.requested > 0 and len(self.pending) > 0)
+                )
+                if not host.connected:
+                    return
+                if self.closed:
+                    message = {"type": "done"}
+                else:
+                    shard = [
+                        self.pending.popleft()
+                        for _ in range(min(host.requested, len(self.pending)))
+                    ]
+                    host.requested = 0
+                    for trial in shard:
+                        host.assigned[trial["index"]] = trial
+                        self.attempts[trial["index"]] = (
+                            self.attempts.get(trial["index"], 0) + 1
+                        )
+                    message = {
+                        "type": "shard",
+                        "suite": self.suite,
+                        "limits_from": self.limits_from,
+                        "trials": shard,
+                    }
+
+            try:
+                host.connection.send(message)
+            except OSError:
+                return
+            if message["type"] == "done":
+                return
+
+    def serve(self, connection):
+        host = None
+
+        try:
+            hello = connection.recv()
+            host = HostConnection(connection, hello["name"], hello["capacity"])
+            with self.condition:
+                self.num_hosts += 1
+                self.no_hosts_since = None
+            print(f"Host {host.name} connected with {host.capacity} agents")
+            threading.Thread(target=self.send_shards, args=(host,), daemon=True).start()
+
+            while True:
+                message = connection.recv()
+                with self.condition:
+                    if message["type"] == "request":
+                        host.requested = min(message["count"], host.capacity)
+                    elif message["type"] == "result":
+                        host.assigned.pop(message["index"], None)
+                        self.results[message["index"]] = (
+                            message["block"],
+                            message["trial"],
+                        )
+                    elif message["type"] == "error":
+                        trial = host.assigned.pop(message["index"])
+                        print(
+                            f"Trial {trial['key']} failed on host {host.name}: {message['error']}"
+                        )
+                        self.retry(trial, f"on host {host.name}: {message['error']}")
+                    self.condition.notify_all()
+        except (EOFError, OSError):
+            if host is not None:
+                # Hand the host's unfinished trials to the other hosts
+                with self.condition:
+                    host.connected = False
+                    self.num_hosts -= 1
+                    if self.num_hosts == 0:
+                        self.no_hosts_since = time.time()
+                    for trial in reversed(list(host.assigned.values())):
+                        self.retry(trial, f"host {host.name} disconnected")
+                    self.condition.notify_all()
+                if not self.closed:
+                    print(
+                        f"Host {host.name} disconnected, requeued {len(host.assigned)} trials"
+                    )
+        finally:
+            connection.close()
+
+    def wait_for_result(self, indices: set[int]) -> tuple[int, str, dict[str, Any]]:
+        """Waits for the block of any of the trials and what the RunJournal records about it, and returns them with the trial's index. Raises if any trial has failed MAX_TRIAL_ATTEMPTS times, or no host has been connected for NO_HOSTS_TIMEOUT seconds."""
+        with self.condition:
+            while indices.isdisjoint(self.results):
+                if self.failures:
+                    raise Exception(f"ERROR: trial {self.failures[0]}")
+
+                timeout = None
+                if self.no_hosts_since is not None:
+                    timeout = self.no_hosts_since + NO_HOSTS_TIMEOUT - time.time()
+                    if timeout <= 0:
+                        raise Exception(
+                            f"ERROR: no hosts connected for {NO_HOSTS_TIMEOUT}s with trials left"
+                        )
+                self.condition.wait(timeout)
+            index = next(index for index in indices if index in self.results)
+            return index, *self.results.pop(index)
+
+    def run(
+        self, trials: list[dict[str, Any]], expected_durations: list[float]
+    ) -> Generator[tuple[int, str, dict[str, Any]], None, None]:
+        """Queues the trials ({"key", "repetition", "test"}, where test is the e2e test dictionary) for the hosts, longest expected first, and yields each one's index in trials, block and what the RunJournal records about it as soon as it comes back (see record_trials)"""
+        with self.condition:
+            first_index = self.next_index
+            self.next_index += len(trials)
+            self.pending.extend(
+                {"index": first_index + index, **trials[index]}
+                for index in schedule(expected_durations)
+            )
+            self.condition.notify_all()
+
+        remaining = set(range(first_index, first_index + len(trials)))
+        while remaining:
+            index, block, trial = self.wait_for_result(remaining)
+            remaining.remove(index)
+            yield index - first_index, block, trial
+
+    def close(self):
+        with self.condition:
+            self.closed = True
+            self.condition.notify_all()
+        self.listener.close()
+
+
+# HOSTS
+
+
+def run_shard_trial(
+    suite: Literal["ind", "e2e"],
+    limits_from: Literal["stream", "stats"],
+    trial: dict[str, Any],
+    workers: queue.Queue | None = None,
+) -> tuple[str, dict[str, Any]]:
+    """Runs one trial of a shard on this host's environment and returns its block and what the coordinator's RunJournal records about it"""
+    # Imported here, as both suites import the coordinator
+    from evaluation import e2e, ind
+
+    if suite == "ind":
+        test, metadata = ind.get_specific_test_and_metadata(
+            *re.split(r"[ /]", trial["key"])
+        )
+        run_id, info = ind.run_trial(test, metadata, limits_from, workers)
+    else:
+        run_id, info = e2e.run_trial(
+            trial["test"], trial["test"]["checkpoint_only"], limits_from, workers
+        )
+
+    return close_run_log(run_id), {**info, "host": HOST_NAME}
+
+
+def receive_messages(connection, messages: queue.Queue):
+    """Puts each message from the coordinator on messages, then None once the connection closes"""
+    try:
+        while True:
+            messages.put(connection.recv())
+    except (EOFError, OSError):
+        messages.put(None)
+
+
+def run_host(
+    address: tuple[str, int],
+    num_agents: int,
+    use_workers: bool = False,
+    prewarm: bool = True,
+):
+    """Runs trials from the coordinator at address on up to num_agents agents at once (long-lived AgentWorkers with use_workers), asking for more whenever agents are free and sending back each block, or the error it raised, as soon as it finishes, until the coordinator is done. With prewarm, waits for this host's environment to be warm first."""
+    if prewarm:
+        # Imported here, as both suites import the coordinator
+        from evaluation.prewarm import get_all_urls
+
+        wait_until_warm(get_all_urls())
+
+    connection = Client(address, authkey=get_cluster_key())
+    connection.send({"type": "hello", "name": HOST_NAME, "capacity": num_agents})
+
+    workers = None
+    if use_workers:
+        workers = queue.Queue()
+        for _ in range(num_agents):
+            workers.put(AgentWorker())
+
+    # Messages from the coordinator (dicts) and finished trials (futures), in the order they arrive
+    events: queue.Queue[dict[str, Any] | Future | None] = queue.Queue()
+    threading.Thread(
+        target=receive_messages, args=(connection, events), daemon=True
+    ).start()
+    running: dict[Future, dict[str, Any]] = {}
+    requested = False
+    done = False
+
+    try:
+        with ThreadPoolExecutor(max_workers=num_agents) as executor:
+            try:
+                while not done or running:
+                    if not done and not requested and len(running) < num_agents:
+                        connection.send(
+                            {"type": "request", "count": num_agents - len(running)}
+                        )
+                        requested = True
+
+                    event = events.get()
+                    if event is None:
+                        raise Exception("ERROR: the coordinator closed the connection")
+
+                    if isinstance(event, Future):
+                        trial = running.pop(event)
+                        try:
+                            block, info = event.result()
+                        except Exception as e:
+                            print(f"Trial {trial['key']} failed: {e!r}")
+                            connection.send(
+                                {
+                                    "type": "error",
+                                    "index": trial["index"],
+                                    "error": repr(e),
+                                }
+                            )
+                        else:
+                            connection.send(
+                                {
+                                    "type": "result",
+                                    "index": trial["index"],
+                                    "block": block,
+                                    "trial": info,
+                                }
+                            )
+                        continue
+
+                    requested = False
+                    if event["type"] == "done":
+                        done = True
+                        continue
+                    for trial in event["trials"]:
+                        future = executor.submit(
+                            run_shard_trial,
+                            event["suite"],
+                            event["limits_from"],
+                            trial,
+                            workers,
+                        )
+                        running[future] = trial
+                        future.add_done_callback(events.put)
+            except BaseException:
+                # e.g. Ctrl-C, which the agents don't get as they run in their own sessions
+                executor.shutdown(wait=False, cancel_futures=True)
+                kill_running_agents()
+                raise
+    finally:
+        connection.close()
+        while workers is not None and not workers.empty():
+            workers.get().close()
+
+
+if __name__ == "__main__":
+    if len(sys.argv) < 2:
+        print(
+            "Usage: python -m evaluation.cluster <host:port> [-j=N] [-workers] [-noprewarm]"
+        )
+        sys.exit(1)
+
+    num_agents = 1
+    use_workers = False
+    prewarm = True
+    for arg in sys.argv[2:]:
+        if arg.startswith("-j="):
+            num_agents = int(arg.split("=")[1])
+        elif arg == "-workers":
+            use_workers = True
+        elif arg == "-noprewarm":
+            prewarm = False
+
+    run_host(parse_address(sys.argv[1]), num_agents, use_workers, prewarm)
@@ -0,0 +1,75 @@
+"""Per-test wall-clock history from previous runs, used to start the longest trials first when running agents in parallel and to plan a run with -plan.
+
+Each test key keeps its last DURATION_HISTORY_SIZE trial durations in a JSON file next to the log. A test's expected duration is their median, or its time limit if it hasn't run yet.
+"""
+
+import heapq
+import json
+import os
+import statistics
+
+DURATIONS_FILEPATH = os.path.join(
+    os.path.dirname(__file__), "../trajectories/durations.json"
+)
+DURATION_HISTORY_SIZE = 20
+
+
+class DurationHistory:
+    def __init__(self, filepath: str = DURATIONS_FILEPATH):
+        self.filepath = filepath
+        self.durations: dict[str, list[float]] = {}
+
+        if os.path.exists(filepath):
+            with open(filepath, "r") as file:
+                self.durations = json.load(file)
+
+    def expected(self, key: str, default: float) -> float:
+        """Returns the median of the test's recent durations, or default if it has none"""
+        if not self.durations.get(key):
+            return default
+        return statistics.median(self.durations[key])
+
+    def record(self, key: str, seconds: float):
+        """Adds a trial's duration to the test's history and saves it, replacing the file in one step so an interrupted run never leaves it half written"""
+        self.durations[key] = (self.durations.get(key, []) + [round(seconds, 3)])[
+            -DURATION_HISTORY_SIZE:
+        ]
+
+        os.makedirs(os.path.dirname(self.filepath), exist_ok=True)
+        with open(self.filepath + ".tmp", "w") as file:
+            json.dump(self.durations, file)
+        os.replace(self.filepath + ".tmp", self.filepath)
+
+
+def schedule(expected_durations: list[float]) -> list[int]:
+    """Returns the order to start the trials in: longest expected first (ties keep their order), so a long trial doesn't start last and leave the other agents idle while it finishes"""
+    return sorted(
+        range(len(expected_durations)), key=lambda index: -expected_durations[index]
+    )
+
+
+def plan(expected_durations: list[float], num_workers: int) -> list[list[float]]:
+    """Simulates starting the trials in schedule order on num_workers agents, each taking the next trial once it is free, and returns the expected durations of the trials each agent runs"""
+    loads = [(0.0, worker) for worker in range(num_workers)]
+    assignments = [[] for _ in range(num_workers)]
+
+    for index in schedule(expected_durations):
+        load, worker = heapq.heappop(loads)
+        assignments[worker].append(expected_durations[index])
+        heapq.heappush(loads, (load + expected_durations[index], worker))
+
+    return assignments
+
+
+def print_plan(expected_durations: list[float], num_workers: int):
+    assignments = plan(expected_durations, num_workers)
+    makespan = max((sum(durations) for durations in assignments), default=0)
+
+    print(
+        f"{len(expected_durations)} trials, {sum(expected_durations):.0f}s of agent time"
+    )
+    print(
+        f"Expected total time on {num_workers} agent{'s' if num_workers > 1 else ''}: {makespan:.0f}s"
+    )
+    for worker, durations in enumerate(assignments):
+        print(f"    agent {worker}: {sum(durations):.0f}s ({len(durations)} trials)")
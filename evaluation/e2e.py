@@ -1,19 +1,42 @@
 import csv
 import os
-from typing import Literal
+import queue
+from typing import Any, Literal
 import sys
+import time
 from urllib.parse import urlparse, parse_qs, urlencode, quote
 import json
 
 from evaluation.utils import (
+    ADAPTIVE_MAX_REPETITIONS,
+    ADAPTIVE_TARGET_WIDTH,
     LOCALHOST_PORT,
     TASK_TO_CATEGORY_MAP,
+    AgentWorker,
     PassStats,
+    RunJournal,
+    add_run_to_url,
+    begin_run_log,
     display_pass_stats,
-    generate_checkpoints_from_logs,
+    finish_run_log,
+    get_run_log_filepath,
+    get_stop_reason,
+    TestBlock,
+    iter_finished_trials,
+    in_suite_order,
+    iter_test_blocks,
+    new_run_id,
+    parse_block,
+    record_trials,
     run_agent_with_limits,
+    wait_until_warm,
 )
+from evaluation import bulk, evaluators, trajectory, utils
+from evaluation.cache import EvalCache, fingerprint_files
+from evaluation.cluster import Coordinator, parse_address
+from evaluation.durations import DurationHistory, print_plan
 from evaluation.evaluators import Log
+from evaluation.store import STORE_FOLDER, TrajectoryStore
 
 # HELPER CONSTANTS AND CLASSES
 
@@ -26,11 +49,14 @@ LOG_FILEPATH = (
 OUTPUT_FILEPATH = PARENT_FOLDER + "output/e2e_output.csv"
 TASK_OUTPUT_FILEPATH = PARENT_FOLDER + "output/e2e_task_output.csv"
 SUMMARY_FILEPATH = PARENT_FOLDER + "output/e2e_summary.txt"
+TRIALS_OUTPUT_FILEPATH = PARENT_FOLDER + "output/e2e_trials.csv"
 
 INCLUDE_MISSING_CHECKPOINTS_IN_TASK_SUMMARY = False
 
 
 class GoldenLog(Log):
+    __slots__ = ("untracked_component",)
+
     def __init__(self, log: str, untracked_component: str | None = None):
         super().__init__(log)
         self.untracked_component = untracked_component
@@ -129,9 +155,11 @@ class EvaluatedTest:
         self,
         test_name: str,
         ind_evaluated_tests: list[IndEvaluatedTest],
+        stop_reason: str | None = None,
     ):
         self.test_name = test_name
         self.ind_evaluated_tests = ind_evaluated_tests
+        self.stop_reason = stop_reason
 
 
 class CorrectMissingData:
@@ -570,84 +598,126 @@ def evaluate_e2e(e2e: e2eTest, log: CheckpointFromLogs) -> bool:
     return False
 
 
-def evaluate_logs():
-    """Pulls the logs from LOG_FILEPATH and then evaluates them against the golden checkpoints. Returns a list of EvaluatedTest objects."""
-    evaluated_tests = []
-    logs = generate_checkpoints_from_logs(LOG_FILEPATH)
-    for test, items in logs.items():
-        ind_evaluated_tests = []
+def evaluate_trajectory(
+    test: str, checkpoints: list[dict[str, Any]]
+) -> IndEvaluatedTest | None:
+    """Evaluates one trajectory of a test (its key, e.g. `playground/order 1_search_for_item -checkpointonly`) against the golden checkpoints. Returns None for tests that aren't in PLAYGROUND_TESTS."""
+    test_and_checkpoint = test.split("/")[1].strip().split(" ")
+    curr_test_name = test_and_checkpoint[0]
 
-        test_and_checkpoint = test.split("/")[1].strip().split(" ")
-        curr_test_name = test_and_checkpoint[0]
+    curr_starting_checkpoint = (
+        test_and_checkpoint[1] if len(test_and_checkpoint) > 1 else None
+    )
+    curr_test_checkpoint_only = (
+        test_and_checkpoint[2] == "-checkpointonly"
+        if len(test_and_checkpoint) > 2
+        else False
+    )
 
-        curr_starting_checkpoint = (
-            test_and_checkpoint[1] if len(test_and_checkpoint) > 1 else None
-        )
-        curr_test_checkpoint_only = (
-            test_and_checkpoint[2] == "-checkpointonly"
-            if len(test_and_checkpoint) > 2
-            else False
+    if curr_test_name not in PLAYGROUND_TESTS:
+        return None
+
+    processed_checkpoints: list[CheckpointFromLogs] = []
+    for checkpoint in checkpoints:
+        processed_checkpoints.append(
+            CheckpointFromLogs(checkpoint["url"], checkpoint["logs"])
         )
 
-        for checkpoints in items:
-            if curr_test_name in PLAYGROUND_TESTS:
-                processed_checkpoints: list[CheckpointFromLogs] = []
-                for checkpoint in checkpoints:
-                    processed_checkpoints.append(
-                        CheckpointFromLogs(
-                            checkpoint["url"],
-                            [Log(log) for log in checkpoint["logs"]],
-                        )
-                    )
+    golden_checkpoints = PLAYGROUND_TESTS[curr_test_name].checkpoints
+    if curr_starting_checkpoint is not None:
+        indices = [
+            index
+            for index, checkpoint in enumerate(golden_checkpoints)
+            if checkpoint.name == curr_starting_checkpoint
+        ]
+        golden_checkpoints = golden_checkpoints[indices[0] :]
 
-                golden_checkpoints = PLAYGROUND_TESTS[curr_test_name].checkpoints
-                if curr_starting_checkpoint is not None:
-                    indices = [
-                        index
-                        for index, checkpoint in enumerate(golden_checkpoints)
-                        if checkpoint.name == curr_starting_checkpoint
-                    ]
-                    golden_checkpoints = golden_checkpoints[indices[0] :]
+    if curr_test_checkpoint_only:
+        golden_checkpoints = golden_checkpoints[:1]
+        processed_checkpoints = processed_checkpoints
 
-                if curr_test_checkpoint_only:
-                    golden_checkpoints = golden_checkpoints[:1]
-                    processed_checkpoints = processed_checkpoints
+    evaluated_checkpoints, extra_checkpoints = compare_processed_and_golden_checkpoints(
+        golden_checkpoints, processed_checkpoints
+    )
 
-                evaluated_checkpoints, extra_checkpoints = (
-                    compare_processed_and_golden_checkpoints(
-                        golden_checkpoints, processed_checkpoints
-                    )
-                )
+    all_correct_logs: list[GoldenLog] = []
+    all_missing_logs: list[GoldenLog] = []
 
-                all_correct_logs: list[GoldenLog] = []
-                all_missing_logs: list[GoldenLog] = []
+    for evaluated_checkpoint in evaluated_checkpoints:
+        all_correct_logs.extend(evaluated_checkpoint.correct_golden_logs)
+        all_missing_logs.extend(evaluated_checkpoint.missing_golden_logs)
 
-                for evaluated_checkpoint in evaluated_checkpoints:
-                    all_correct_logs.extend(evaluated_checkpoint.correct_golden_logs)
-                    all_missing_logs.extend(evaluated_checkpoint.missing_golden_logs)
+    # print_evaluated_checkpoints(evaluated_logs)
+    # print_extra_checkpoints(extra_logs)
 
-                # print_evaluated_checkpoints(evaluated_logs)
-                # print_extra_checkpoints(extra_logs)
+    e2e_result = None
+    if not curr_test_checkpoint_only:
+        e2e_result = any(
+            evaluate_e2e(PLAYGROUND_TESTS[curr_test_name].e2e, extra)
+            for extra in extra_checkpoints
+        )
 
-                e2e_result = None
-                if not curr_test_checkpoint_only:
-                    e2e_result = any(
-                        evaluate_e2e(PLAYGROUND_TESTS[curr_test_name].e2e, extra)
-                        for extra in extra_checkpoints
-                    )
+    return IndEvaluatedTest(
+        checkpoints=evaluated_checkpoints,
+        correct_logs=all_correct_logs,
+        missing_logs=all_missing_logs,
+        extra_checkpoints_processed=extra_checkpoints,
+        e2e_result=e2e_result,
+    )
 
-                ind_evaluated_tests.append(
-                    IndEvaluatedTest(
-                        checkpoints=evaluated_checkpoints,
-                        correct_logs=all_correct_logs,
-                        missing_logs=all_missing_logs,
-                        extra_checkpoints_processed=extra_checkpoints,
-                        e2e_result=e2e_result,
-                    )
-                )
 
-        evaluated_tests.append(EvaluatedTest(curr_test_name, ind_evaluated_tests))
-    return evaluated_tests
+def trajectory_passed(ind_evaluated_test: IndEvaluatedTest | None) -> bool:
+    """Whether a trajectory passed its test, for -adaptive: it reached the e2e goal, or for -checkpointonly tests, it fully matched the checkpoint"""
+    if ind_evaluated_test is None:
+        return False
+    if ind_evaluated_test.e2e_result is not None:
+        return ind_evaluated_test.e2e_result
+    return all(
+        evaluated_checkpoint.checkpoint_status == "full_match"
+        for evaluated_checkpoint in ind_evaluated_test.checkpoints
+    )
+
+
+def evaluate_block(block: TestBlock) -> IndEvaluatedTest | None:
+    """Evaluates the trajectory in one TEST block (see evaluate_trajectory)"""
+    return evaluate_trajectory(block.key, block.checkpoints)
+
+
+def evaluate_logs(
+    log_filepaths: str | list[str] = LOG_FILEPATH,
+    selectors: list[str] | None = None,
+    cache: EvalCache | None = None,
+    stop_reasons: dict[str, str] | None = None,
+):
+    """Reads the logs from LOG_FILEPATH (or the given log files or trajectory store, merged in order) one block at a time and evaluates the selected tests against the golden checkpoints. With a cache, trajectories whose block was evaluated before aren't split into checkpoints or evaluated again. Returns a list of EvaluatedTest objects, with each test's stopping reason from stop_reasons (for runs with -adaptive)."""
+    ind_evaluated_tests: dict[str, list[IndEvaluatedTest]] = {}
+
+    for block in iter_test_blocks(log_filepaths, selectors):
+        test = block.key
+        cache_key = cache.key(block.lines) if cache is not None else None
+        cached = cache.get(cache_key) if cache is not None else None
+
+        if cached is not None:
+            # Cached as a list, so that a None result can be cached too
+            ind_evaluated_test = cached[0]
+        else:
+            ind_evaluated_test = evaluate_block(block)
+            if cache is not None:
+                cache.put(cache_key, [ind_evaluated_test])
+
+        ind_evaluated_tests.setdefault(test, [])
+        if ind_evaluated_test is not None:
+            ind_evaluated_tests[test].append(ind_evaluated_test)
+
+    return [
+        EvaluatedTest(
+            test.split("/")[1].strip().split(" ")[0],
+            ind_evaluated_tests[test],
+            (stop_reasons or {}).get(test),
+        )
+        # Trajectories finish out of order with -j or -coordinate, so the tests are listed in suite order
+        for test in in_suite_order(ind_evaluated_tests, get_suite_keys())
+    ]
 
 
 # GENERATING SUMMARY AND EXPORTING RESULTS
@@ -692,6 +762,13 @@ def export_results(evaluated_tests: list[EvaluatedTest]):
     ]
     task_output_csv_rows = [["Category", "Task", "Test", "Correct", "Total"]]
 
+    # Runs with -adaptive record why each test stopped being repeated
+    include_stop_reasons = any(
+        evaluated_test.stop_reason is not None for evaluated_test in evaluated_tests
+    )
+    if include_stop_reasons:
+        output_csv_rows[0].append("Stop Reason")
+
     total_correct: list[GoldenLog] = []
     total_missing: list[GoldenLog] = []
 
@@ -751,6 +828,11 @@ def export_results(evaluated_tests: list[EvaluatedTest]):
                     )
                 )
             )
+            + (
+                ""
+                if evaluated_test.stop_reason is None
+                else " (stopped: " + evaluated_test.stop_reason + ")"
+            )
             + "\n"
         )
 
@@ -770,6 +852,8 @@ def export_results(evaluated_tests: list[EvaluatedTest]):
                 ),
             ]
         )
+        if include_stop_reasons:
+            output_csv_rows[-1].extend([""] * 5 + [evaluated_test.stop_reason or ""])
 
         for checkpoint_name, stats in evaluated_checkpoints_to_print.items():
             output_csv_rows.append(
@@ -895,6 +979,174 @@ def encode_url_query_params(url: str):
     return quote(url, safe="/=?&")
 
 
+def get_test_url(path: str) -> str:
+    return f"localhost:{LOCALHOST_PORT}" + encode_url_query_params(path)
+
+
+def get_test_key(test: dict[str, Any], checkpoint_only: bool) -> str:
+    """The key a test's trajectories are logged under, e.g. `playground/order 1_search_for_item -checkpointonly`"""
+    starting_checkpoint_str = (
+        test["starting_checkpoint"] if test["starting_checkpoint"] is not None else ""
+    )
+    if checkpoint_only:
+        starting_checkpoint_str += " -checkpointonly"
+
+    return f"playground/{test['test']} {starting_checkpoint_str}"
+
+
+def get_suite_keys() -> list[str]:
+    """The keys of every test as they are read back from the logs, in the order the suite runs them"""
+    return [
+        get_test_key(
+            {"test": name, "starting_checkpoint": starting_checkpoint},
+            checkpoint_only,
+        ).strip()
+        for checkpoint_only in [False, True]
+        for name, test in PLAYGROUND_TESTS.items()
+        for starting_checkpoint in [None]
+        + [checkpoint.name for checkpoint in test.checkpoints]
+    ]
+
+
+def get_all_test_paths() -> list[str]:
+    """The paths an e2e run can start from: the playground itself and every checkpoint"""
+    return ["/playground"] + [
+        remove_placeholders_from_url_query_params(checkpoint.url)
+        for test in PLAYGROUND_TESTS.values()
+        for checkpoint in test.checkpoints
+    ]
+
+
+# RUNNING THE AGENT
+
+
+def run_trial(
+    test: dict[str, Any],
+    checkpoint_only: bool,
+    limits_from: Literal["stream", "stats"],
+    workers: queue.Queue | None = None,
+) -> tuple[str, dict[str, Any]]:
+    """Runs the agent once on a test (on a free worker from workers, if given) and returns its run id and what the RunJournal records about the trial: the run id, duration and resources (see run_agent_with_limits). The agent's events go to their own run log, which is later appended to LOG_FILEPATH (or the store)."""
+    run_id = new_run_id("e2e")
+    existing_lines = begin_run_log(
+        run_id,
+        [
+            f"TEST BEGIN: {get_test_key(test, checkpoint_only)}",
+            f"NAVIGATE // {test['path']}",
+        ],
+    )
+
+    worker = workers.get() if workers is not None else None
+    start_time = time.time()
+
+    try:
+        resources = run_agent_with_limits(
+            goal=PLAYGROUND_TESTS[test["test"]].goal,
+            url=add_run_to_url(get_test_url(test["path"]), run_id),
+            existing_lines=existing_lines,
+            log_file=get_run_log_filepath(run_id),
+            timeout=CHECKPOINT_AGENT_TIME if checkpoint_only else FULL_AGENT_TIME,
+            addl_lines=100,
+            custom_log_break=(
+                (lambda lines: len([line for line in lines if "NAVIGATE" in line]) >= 1)
+                if (test["starting_checkpoint"] is not None and checkpoint_only)
+                else (
+                    lambda lines: any(
+                        PLAYGROUND_TESTS[test["test"]].e2e.path in line
+                        for line in lines
+                        if "NAVIGATE" in line
+                    )
+                )
+            ),
+            custom_log_break_str=(
+                "only running for single checkpoint"
+                if (test["starting_checkpoint"] is not None and checkpoint_only)
+                else "only running until reach e2e goal path"
+            ),
+            run_id=run_id,
+            custom_stats_break=(
+                (lambda stats: stats["component_counts"].get("NAVIGATE", 0) >= 1)
+                if (test["starting_checkpoint"] is not None and checkpoint_only)
+                else (
+                    lambda stats: any(
+                        PLAYGROUND_TESTS[test["test"]].e2e.path in label
+                        for label in stats["navigates"]
+                    )
+                )
+            ),
+            limits_from=limits_from,
+            worker=worker,
+        )
+    finally:
+        if workers is not None:
+            workers.put(worker)
+
+    return run_id, {
+        "run": run_id,
+        "seconds": round(time.time() - start_time, 3),
+        **resources,
+    }
+
+
+def get_expected_durations(
+    trials: list[tuple[dict[str, Any], int]],
+    checkpoint_only: bool,
+    durations: DurationHistory,
+) -> list[float]:
+    """Returns how many seconds each (test, repetition) trial is expected to take: the median of its test's previous durations, or the agent's time limit"""
+    agent_time = CHECKPOINT_AGENT_TIME if checkpoint_only else FULL_AGENT_TIME
+    return [
+        durations.expected(get_test_key(test, checkpoint_only).strip(), agent_time)
+        for test, _ in trials
+    ]
+
+
+def run_trials(
+    trials: list[tuple[dict[str, Any], int]],
+    checkpoint_only: bool,
+    num_workers: int,
+    destination: str | TrajectoryStore,
+    limits_from: Literal["stream", "stats"],
+    use_workers: bool,
+    durations: DurationHistory,
+    coordinator: Coordinator | None = None,
+):
+    """Runs the (test, repetition) trials on up to num_workers agents at once, each with its own browser and run, or on the hosts connected to the coordinator. With use_workers, each agent is a long-lived AgentWorker reused across trials. Trials start longest expected first (from durations, or the agent's time limit), and each finished run is appended and recorded in the destination's RunJournal and durations as soon as it finishes (see record_trials)."""
+    expected_durations = get_expected_durations(trials, checkpoint_only, durations)
+
+    if coordinator is not None:
+        finished = coordinator.run(
+            [
+                {
+                    "key": get_test_key(test, checkpoint_only),
+                    "repetition": repetition,
+                    "test": {**test, "checkpoint_only": checkpoint_only},
+                }
+                for test, repetition in trials
+            ],
+            expected_durations,
+        )
+    else:
+        finished = iter_finished_trials(
+            lambda index, workers: run_trial(
+                trials[index][0], checkpoint_only, limits_from, workers
+            ),
+            expected_durations,
+            num_workers,
+            use_workers,
+        )
+
+    record_trials(
+        [
+            (get_test_key(test, checkpoint_only), repetition)
+            for test, repetition in trials
+        ],
+        finished,
+        destination,
+        durations,
+    )
+
+
 # E2E test scaffolding
 
 
@@ -902,12 +1154,76 @@ if __name__ == "__main__":
     tests = []
     skip_to_evaluate = False
     checkpoint_only = False
-    num_times = 1
+    num_times = None
+    target_width = None
+    log_filepaths = []
+    limits_from = "stream"
+    store = None
+    selectors = []
+    num_workers = 1
+    use_workers = False
+    resume = False
+    use_cache = True
+    prewarm = True
+    plan = False
+    coordinate_address = None
 
     for i, arg in enumerate(sys.argv[1:]):
         if arg == "-evalonly":
             skip_to_evaluate = True
-            break
+            continue
+
+        if arg == "-store" or arg.startswith("-store="):
+            if arg not in ["-store", "-store=gzip"]:
+                raise Exception(f"ERROR: unknown {arg}, expected -store or -store=gzip")
+            store = TrajectoryStore(STORE_FOLDER, compress=arg == "-store=gzip")
+            continue
+
+        if arg.startswith("-log="):
+            log_filepaths.append(arg.split("=", 1)[1])
+            continue
+
+        if arg.startswith("-limits="):
+            limits_from = arg.split("=")[1]
+            if limits_from not in ["stream", "stats"]:
+                raise Exception(
+                    f"ERROR: unknown -limits={limits_from}, expected stream or stats"
+                )
+            continue
+
+        if arg.startswith("-j="):
+            num_workers = int(arg.split("=")[1])
+            continue
+
+        if arg == "-workers":
+            use_workers = True
+            continue
+
+        if arg == "-resume":
+            resume = True
+            continue
+
+        if arg == "-nocache":
+            use_cache = False
+            continue
+
+        if arg == "-adaptive" or arg.startswith("-adaptive="):
+            target_width = (
+                float(arg.split("=")[1]) if "=" in arg else ADAPTIVE_TARGET_WIDTH
+            )
+            continue
+
+        if arg == "-noprewarm":
+            prewarm = False
+            continue
+
+        if arg == "-plan":
+            plan = True
+            continue
+
+        if arg.startswith("-coordinate="):
+            coordinate_address = parse_address(arg.split("=", 1)[1])
+            continue
 
         if arg == "-checkpointonly":
             checkpoint_only = True
@@ -917,6 +1233,8 @@ if __name__ == "__main__":
             num_times = int(arg.split("=")[1])
             continue
 
+        # Keys look like `playground/<test> <starting checkpoint>`
+        selectors.append("playground/" + arg.replace("/", " ", 1))
         parts = arg.split("/", 1)
 
         if parts[0] in PLAYGROUND_TESTS:
@@ -968,66 +1286,182 @@ if __name__ == "__main__":
             ]
 
     # Run the agent
+    destination = store if store is not None else LOG_FILEPATH
+    journal = RunJournal(destination)
+    durations = DurationHistory()
+
+    # Print the expected total time and per-agent load of running the selected tests -n times on -j agents, without running them
+    if plan:
+        print_plan(
+            get_expected_durations(
+                [
+                    (test, repetition)
+                    for test in tests
+                    for repetition in range(num_times if num_times is not None else 1)
+                ],
+                checkpoint_only,
+                durations,
+            ),
+            num_workers,
+        )
+        sys.exit(0)
+
+    coordinator = (
+        Coordinator(coordinate_address, "e2e", limits_from)
+        if coordinate_address is not None and not skip_to_evaluate
+        else None
+    )
+
     if not skip_to_evaluate:
-        with open(LOG_FILEPATH, "w") as file:
-            pass
-
-        for test in tests:
-            for _ in range(num_times):
-                with open(LOG_FILEPATH, "a") as file:
-                    starting_checkpoint_str = (
-                        test["starting_checkpoint"]
-                        if test["starting_checkpoint"] is not None
-                        else ""
-                    )
-                    if checkpoint_only:
-                        starting_checkpoint_str += " -checkpointonly"
+        # The hosts of a -coordinate run have their own environments
+        if prewarm and coordinator is None:
+            wait_until_warm([get_test_url(test["path"]) for test in tests])
 
-                    file.write(
-                        f"TEST BEGIN: playground/{test['test']} {starting_checkpoint_str}\n"
-                    )
-                    file.write(f"NAVIGATE // {test['path']}\n")
-
-                existing_lines = 0
-                with open(LOG_FILEPATH, "r") as file:
-                    existing_lines = len(file.readlines())
-
-                run_agent_with_limits(
-                    goal=PLAYGROUND_TESTS[test["test"]].goal,
-                    url=f"localhost:{LOCALHOST_PORT}"
-                    + encode_url_query_params(test["path"]),
-                    existing_lines=existing_lines,
-                    log_file=LOG_FILEPATH,
-                    timeout=(
-                        CHECKPOINT_AGENT_TIME if checkpoint_only else FULL_AGENT_TIME
-                    ),
-                    addl_lines=100,
-                    custom_log_break=(
-                        (
-                            lambda lines: len(
-                                [line for line in lines if "NAVIGATE" in line]
-                            )
-                            >= 1
-                        )
-                        if (test["starting_checkpoint"] is not None and checkpoint_only)
-                        else (
-                            lambda lines: any(
-                                PLAYGROUND_TESTS[test["test"]].e2e.path in line
-                                for line in lines
-                                if "NAVIGATE" in line
+        # Pick up after the trials already finished, or clear the log file (or the trajectory store)
+        if resume:
+            finished = journal.resume("e2e")
+        else:
+            finished = set()
+            journal.clear()
+            if store is not None:
+                store.clear()
+            else:
+                with open(LOG_FILEPATH, "w") as file:
+                    pass
+
+        stop_reasons = journal.read_stop_reasons()
+
+        if coordinator is not None:
+            if target_width is not None:
+                raise Exception("ERROR: -adaptive can't be combined with -coordinate")
+
+            # Run the trials on the hosts connected to the coordinator, appending each block as it arrives
+            run_trials(
+                [
+                    (test, repetition)
+                    for test in tests
+                    for repetition in range(num_times if num_times is not None else 1)
+                    if (get_test_key(test, checkpoint_only), repetition) not in finished
+                ],
+                checkpoint_only,
+                num_workers,
+                destination,
+                limits_from,
+                use_workers,
+                durations,
+                coordinator,
+            )
+            coordinator.close()
+        elif target_width is None:
+            # Run the trials on up to -j agents at once, longest expected first, appending each block as it finishes
+            run_trials(
+                [
+                    (test, repetition)
+                    for test in tests
+                    for repetition in range(num_times if num_times is not None else 1)
+                    if (get_test_key(test, checkpoint_only), repetition) not in finished
+                ],
+                checkpoint_only,
+                num_workers,
+                destination,
+                limits_from,
+                use_workers,
+                durations,
+            )
+        else:
+            if num_workers > 1:
+                raise Exception("ERROR: -adaptive can't be combined with -j for e2e")
+            workers = queue.Queue() if use_workers else None
+            if workers is not None:
+                workers.put(AgentWorker())
+
+            try:
+                for test in tests:
+                    key = get_test_key(test, checkpoint_only)
+                    # The key as it is read back from the logs
+                    test_key = key.strip()
+
+                    # Repeat the test until get_stop_reason says its pass rate is known well enough, counting the trajectories already finished when resuming
+                    passes = (
+                        [
+                            trajectory_passed(evaluate_block(block))
+                            for block in iter_test_blocks(
+                                STORE_FOLDER if store is not None else LOG_FILEPATH,
+                                [test_key],
                             )
+                            if block.key == test_key
+                        ]
+                        if resume
+                        else []
+                    )
+
+                    repetition = 0
+                    while True:
+                        stop_reason = stop_reasons.get(test_key) or get_stop_reason(
+                            sum(passes),
+                            len(passes),
+                            target_width,
+                            (
+                                num_times
+                                if num_times is not None
+                                else ADAPTIVE_MAX_REPETITIONS
+                            ),
                         )
-                    ),
-                    custom_log_break_str=(
-                        "only running for single checkpoint"
-                        if (test["starting_checkpoint"] is not None and checkpoint_only)
-                        else "only running until reach e2e goal path"
-                    ),
-                )
+                        if stop_reason is not None:
+                            if test_key not in stop_reasons:
+                                journal.record_stop(test_key, stop_reason)
+                            break
 
-                with open(LOG_FILEPATH, "a") as file:
-                    file.write("TEST FINISH\n")
+                        if (key, repetition) in finished:
+                            repetition += 1
+                            continue
 
-    # Evaluate the logs that exist
-    evaluated_tests = evaluate_logs()
+                        run_id, trial = run_trial(
+                            test, checkpoint_only, limits_from, workers
+                        )
+                        block, location = finish_run_log(run_id, destination)
+                        journal.record(key, repetition, location, trial)
+                        durations.record(test_key, trial["seconds"])
+                        passes.append(
+                            trajectory_passed(evaluate_block(parse_block(block)))
+                        )
+                        repetition += 1
+            finally:
+                while workers is not None and not workers.empty():
+                    workers.get().close()
+
+    # Evaluate the selected tests from the logs that exist (or the store), or from the logs passed with -log= merged in order
+    # Results are pickled, so their classes' module (__main__ here) is part of the fingerprint
+    cache = (
+        EvalCache(
+            fingerprint_files(
+                __file__,
+                evaluators.__file__,
+                trajectory.__file__,
+                bulk.__file__,
+                utils.__file__,
+            )
+            + __name__
+        )
+        if use_cache
+        else None
+    )
+    evaluated_tests = evaluate_logs(
+        (
+            log_filepaths
+            if log_filepaths
+            else STORE_FOLDER if store is not None else LOG_FILEPATH
+        ),
+        selectors,
+        cache,
+        journal.read_stop_reasons() if not log_filepaths else None,
+    )
+    if cache is not None:
+        cache.close()
+        if cache.describe_hits() is not None:
+            print(cache.describe_hits())
     export_results(evaluated_tests)
+
+    # One row per trial of the run in the log file (or store), with its resources
+    if not log_filepaths:
+        journal.export_trials(TRIALS_OUTPUT_FILEPATH)
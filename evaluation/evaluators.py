@@ -1,15 +1,41 @@
+import sys
+from functools import lru_cache
 from typing import Callable, TypeAlias
 
 
+def intern(value: str | None) -> str | None:
+    """Interns a component or label, as they repeat across logs (`click/button`, `First name`, ...), so that equal ones share one string"""
+    return None if value is None else sys.intern(value)
+
+
 class Log:
+    # One Log is created per trajectory line, so it has slots rather than a __dict__
+    __slots__ = ("component", "label", "newValue", "oldValue")
+
     def __init__(self, log: str):
         log_parts: list[str] = [part.strip() for part in log.split("//")]
 
-        self.component = log_parts[0]
-        self.label = log_parts[1]
+        self.component = intern(log_parts[0])
+        self.label = intern(log_parts[1])
         self.newValue = log_parts[2] if len(log_parts) > 2 else None
         self.oldValue = log_parts[3] if len(log_parts) > 3 else None
 
+    @classmethod
+    def from_fields(
+        cls,
+        component: str,
+        label: str,
+        newValue: str | None = None,
+        oldValue: str | None = None,
+    ) -> "Log":
+        """Builds a Log from already split fields (e.g. a JSONL record) without parsing a line"""
+        log = cls.__new__(cls)
+        log.component = intern(component)
+        log.label = intern(label)
+        log.newValue = newValue
+        log.oldValue = oldValue
+        return log
+
     def __str__(self):
         return (
             f"{self.component} // {self.label}"
@@ -22,6 +48,167 @@ LogListEvaluator: TypeAlias = Callable[[list[Log]], bool]
 LogEvaluator: TypeAlias = Callable[[Log], bool]
 
 
+# Eval's log evaluators are callable objects rather than lambdas, so that a list of them can be
+# compiled into a LogPlan, and equal lists (rebuilt by every call of a test's eval) share one plan
+
+
+class FieldMatch:
+    """Base for evaluators comparing a log's fields to the given ones, where None matches anything"""
+
+    __slots__ = ("component", "label", "newValue", "oldValue", "key", "hash")
+
+    def __init__(
+        self,
+        component: str | None = None,
+        label: str | None = None,
+        newValue: str | None = None,
+        oldValue: str | None = None,
+    ):
+        self.component = component
+        self.label = label
+        self.newValue = newValue
+        self.oldValue = oldValue
+        self.key = (type(self), component, label, newValue, oldValue)
+        self.hash = hash(self.key)
+
+    def __eq__(self, other) -> bool:
+        return isinstance(other, FieldMatch) and self.key == other.key
+
+    def __hash__(self) -> int:
+        return self.hash
+
+
+class ExactMatch(FieldMatch):
+    __slots__ = ()
+
+    def __call__(self, log: Log) -> bool:
+        return (
+            (self.component is None or log.component == self.component)
+            and (self.label is None or log.label == self.label)
+            and (self.newValue is None or log.newValue == self.newValue)
+            and (self.oldValue is None or log.oldValue == self.oldValue)
+        )
+
+
+class ContainsMatch(FieldMatch):
+    __slots__ = ()
+
+    def __call__(self, log: Log) -> bool:
+        return (
+            (self.component is None or self.component in log.component)
+            and (self.label is None or self.label in log.label)
+            and (self.newValue is None or self.newValue in log.newValue)
+            and (self.oldValue is None or self.oldValue in log.oldValue)
+        )
+
+
+class AllLog:
+    __slots__ = ("evaluators", "hash")
+
+    def __init__(self, evaluators: list[LogEvaluator]):
+        self.evaluators = tuple(evaluators)
+        self.hash = hash(self.evaluators)
+
+    def __call__(self, log: Log) -> bool:
+        return all(evaluator(log) for evaluator in self.evaluators)
+
+    def __eq__(self, other) -> bool:
+        return isinstance(other, AllLog) and self.evaluators == other.evaluators
+
+    def __hash__(self) -> int:
+        return self.hash
+
+
+class CompareValues:
+    __slots__ = ("compare",)
+
+    def __init__(self, compare: Callable[[str, str], bool]):
+        self.compare = compare
+
+    def __call__(self, log: Log) -> bool:
+        return self.compare(log.newValue, log.oldValue)
+
+
+def get_index_key(evaluator: LogEvaluator) -> tuple[str, str | None] | None:
+    """The component and label (or None) a log must have for evaluator to match it, if evaluator checks them before anything else, or None. Logs without them can be skipped, as evaluator would return False for them without running any other check."""
+    if isinstance(evaluator, ExactMatch) and evaluator.component is not None:
+        return evaluator.component, evaluator.label
+    if isinstance(evaluator, AllLog) and evaluator.evaluators:
+        return get_index_key(evaluator.evaluators[0])
+    return None
+
+
+def get_residual(evaluator: LogEvaluator) -> LogEvaluator | None:
+    """What is left of an indexed evaluator to run on a log that has its index key, or None if nothing is"""
+    if isinstance(evaluator, ExactMatch):
+        if evaluator.newValue is None and evaluator.oldValue is None:
+            return None
+        return ExactMatch(newValue=evaluator.newValue, oldValue=evaluator.oldValue)
+    return evaluator
+
+
+class LogPlan:
+    """A list of evaluators compiled for checking whether a log matches any of them, as unordered and at_least_one do. Evaluators that first check a component (and label) with exact_match are found by dict lookup on the log's, and only what's left of them runs. The others run on every log. The candidates run in the list's order, and the evaluators skipped would have returned False without running anything else, so a plan gives the same results (and errors) as running every evaluator."""
+
+    def __init__(self, evaluators: tuple[LogEvaluator, ...]):
+        # Each candidate is (position in the list, residual or None if the index key is all it checks)
+        by_label: dict[tuple[str, str], list[tuple[int, LogEvaluator | None]]] = {}
+        by_component: dict[str, list[tuple[int, LogEvaluator | None]]] = {}
+        self.residual: list[tuple[int, LogEvaluator | None]] = []
+
+        for index, evaluator in enumerate(evaluators):
+            key = get_index_key(evaluator)
+            if key is None:
+                self.residual.append((index, evaluator))
+            elif key[1] is None:
+                by_component.setdefault(key[0], []).append(
+                    (index, get_residual(evaluator))
+                )
+            else:
+                by_label.setdefault(key, []).append((index, get_residual(evaluator)))
+
+        # Merge the evaluators that also apply to a log with the key, keeping the list's order
+        self.by_component = {
+            component: get_residuals(candidates + self.residual)
+            for component, candidates in by_component.items()
+        }
+        self.by_label = {
+            key: get_residuals(
+                candidates + by_component.get(key[0], []) + self.residual
+            )
+            for key, candidates in by_label.items()
+        }
+        self.others = get_residuals(self.residual)
+
+    def matches(self, log: Log) -> bool:
+        candidates = (
+            self.by_label.get((log.component, log.label))
+            or self.by_component.get(log.component)
+            or self.others
+        )
+        for residual in candidates:
+            if residual is None or residual(log):
+                return True
+        return False
+
+
+def get_residuals(
+    candidates: list[tuple[int, LogEvaluator | None]],
+) -> list[LogEvaluator | None]:
+    """The candidates' residuals, in the order of their evaluators in the list"""
+    return [residual for _, residual in sorted(candidates, key=lambda c: c[0])]
+
+
+# The tests rebuild their evaluators on every call, so equal ones are created once and reused
+get_exact_match = lru_cache(maxsize=4096)(ExactMatch)
+get_contains_match = lru_cache(maxsize=4096)(ContainsMatch)
+
+
+@lru_cache(maxsize=1024)
+def compile_plan(evaluators: tuple[LogEvaluator, ...]) -> LogPlan:
+    return LogPlan(evaluators)
+
+
 class Eval:
     @staticmethod
     def check_one(log: Log, evaluators: list[LogEvaluator]) -> bool:
@@ -39,17 +226,19 @@ class Eval:
 
     @staticmethod
     def unordered(logs: list[Log], evaluators: list[LogEvaluator]) -> bool:
-        return len(logs) == len(evaluators) and all(
-            any(evaluator(log) for evaluator in evaluators) for log in logs
-        )
+        if len(logs) != len(evaluators):
+            return False
+        plan = compile_plan(tuple(evaluators))
+        return all(map(plan.matches, logs))
 
     @staticmethod
     def at_least_one(logs: list[Log], evaluators: list[LogEvaluator]) -> bool:
-        return any(any(evaluator(log) for evaluator in evaluators) for log in logs)
+        plan = compile_plan(tuple(evaluators))
+        return any(map(plan.matches, logs))
 
     @staticmethod
     def all_log(evaluators: list[LogEvaluator]) -> LogEvaluator:
-        return lambda log: all(evaluator(log) for evaluator in evaluators)
+        return AllLog(evaluators)
 
     @staticmethod
     def exact_match(
@@ -58,12 +247,7 @@ class Eval:
         newValue: str | None = None,
         oldValue: str | None = None,
     ) -> LogEvaluator:
-        return (
-            lambda log: (component is None or log.component == component)
-            and (label is None or log.label == label)
-            and (newValue is None or log.newValue == newValue)
-            and (oldValue is None or log.oldValue == oldValue)
-        )
+        return get_exact_match(component, label, newValue, oldValue)
 
     @staticmethod
     def contains_match(
@@ -72,13 +256,8 @@ class Eval:
         newValue: str | None = None,
         oldValue: str | None = None,
     ) -> LogEvaluator:
-        return (
-            lambda log: (component is None or component in log.component)
-            and (label is None or label in log.label)
-            and (newValue is None or newValue in log.newValue)
-            and (oldValue is None or oldValue in log.oldValue)
-        )
+        return get_contains_match(component, label, newValue, oldValue)
 
     @staticmethod
     def compare_values(compare: Callable[[str, str], bool]) -> LogEvaluator:
-        return lambda log: compare(log.newValue, log.oldValue)
+        return CompareValues(compare)
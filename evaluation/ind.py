@@ -1,18 +1,39 @@
 import csv
-from typing import Any, Callable, Dict, TypeAlias
+import queue
+from typing import Any, Callable, Dict, Literal, TypeAlias
 import sys
 import os
 import re
-from evaluation.evaluators import Eval as eval, Log
+import time
+from evaluation import batch, bulk, evaluators, trajectory, utils
+from evaluation.cache import EvalCache, fingerprint_files
+from evaluation.cluster import Coordinator, parse_address
+from evaluation.durations import DurationHistory, print_plan
+from evaluation.evaluators import Eval as eval
+from evaluation.store import STORE_FOLDER, TrajectoryStore
 from evaluation.utils import (
+    ADAPTIVE_MAX_REPETITIONS,
+    ADAPTIVE_MIN_REPETITIONS,
+    ADAPTIVE_TARGET_WIDTH,
     LOCALHOST_PORT,
     TASK_TO_CATEGORY_MAP,
     PassStats,
+    RunJournal,
+    TestBlock,
     display_pass_stats,
+    begin_run_log,
     flatten,
-    get_evals_dict,
+    get_run_log_filepath,
+    get_stop_reason,
     get_url,
+    iter_finished_trials,
+    in_suite_order,
+    iter_test_blocks,
+    new_run_id,
+    parse_block,
+    record_trials,
     run_agent_with_limits,
+    wait_until_warm,
 )
 
 
@@ -26,6 +47,7 @@ LOG_FILEPATH = (
 )  # needs to be in sync with environment/app.py
 OUTPUT_FILEPATH = PARENT_FOLDER + "output/ind_output.csv"
 SUMMARY_FILEPATH = PARENT_FOLDER + "output/ind_summary.txt"
+TRIALS_OUTPUT_FILEPATH = PARENT_FOLDER + "output/ind_trials.csv"
 
 
 class Test:
@@ -39,6 +61,7 @@ class Test:
         submit_eval: Callable[[str], bool] | None = None,
         custom_log_break: Callable[[list[str]], bool] | None = None,
         custom_log_break_str: str | None = None,
+        custom_stats_break: Callable[[dict], bool] | None = None,
     ):
         self.goal = goal
         self.eval = eval
@@ -48,6 +71,7 @@ class Test:
         self.submit_eval = submit_eval
         self.custom_log_break = custom_log_break
         self.custom_log_break_str = custom_log_break_str
+        self.custom_stats_break = custom_stats_break
 
     def eval(self, response: list[str]) -> bool:
         return self.eval(response)
@@ -483,6 +507,7 @@ ind_tests: Dict[str, Dict[str, list[Test]]] = {
                 )
                 > 0,
                 custom_log_break_str="only running until form submitted",
+                custom_stats_break=lambda stats: stats["first_submit_time"] is not None,
             )
         ],
         "complexform": [
@@ -545,6 +570,7 @@ ind_tests: Dict[str, Dict[str, list[Test]]] = {
                 )
                 > 0,
                 custom_log_break_str="only running until form submitted",
+                custom_stats_break=lambda stats: stats["first_submit_time"] is not None,
             )
         ],
     },
@@ -602,6 +628,10 @@ def get_all_tests_and_metadatas() -> list[TestsAndMetadata] | None:
     )
 
 
+def get_prewarm_urls(tests_and_metadatas: list[TestsAndMetadata]) -> list[str]:
+    return [get_url(LOCALHOST_PORT, *metadata) for _, metadata in tests_and_metadatas]
+
+
 def bool_to_pass_fail(b: bool) -> str:
     return "pass" if b else "fail"
 
@@ -613,6 +643,254 @@ def calc_pass_stats(pass_count: int, total_count: int) -> str:
 ## RUNNING THE EVALUATION
 
 
+def get_test_key(test: Test, metadata: tuple[str, str]) -> str:
+    return f"{metadata[0]}/{metadata[1]} {test.name}"
+
+
+def get_expected_durations(
+    trials: list[tuple[Test, tuple[str, str], int]],
+    durations: DurationHistory | None = None,
+) -> list[float]:
+    """Returns how many seconds each trial is expected to take: the median of its test's previous durations, or the test's time limit"""
+    return [
+        (
+            durations.expected(get_test_key(test, metadata), test.max_time)
+            if durations is not None
+            else test.max_time
+        )
+        for test, metadata, _ in trials
+    ]
+
+
+def run_trial(
+    test: Test,
+    metadata: tuple[str, str],
+    limits_from: Literal["stream", "stats"],
+    workers: queue.Queue | None = None,
+) -> tuple[str, dict[str, Any]]:
+    """Runs the agent once on a test (on a free worker from workers, if given) and returns its run id and what the RunJournal records about the trial: the run id, duration and resources (see run_agent_with_limits). The agent's events go to their own run log, which run_trials later closes and appends to LOG_FILEPATH (or the store)."""
+    run_id = new_run_id("ind")
+    existing_lines = begin_run_log(
+        run_id, [f"TEST BEGIN: {get_test_key(test, metadata)}"]
+    )
+    worker = workers.get() if workers is not None else None
+    start_time = time.time()
+
+    try:
+        resources = run_agent_with_limits(
+            goal=test.goal,
+            url=get_url(LOCALHOST_PORT, *metadata, run_id),
+            existing_lines=existing_lines,
+            log_file=get_run_log_filepath(run_id),
+            timeout=test.max_time,
+            addl_lines=test.max_lines,
+            custom_log_break=test.custom_log_break,
+            custom_log_break_str=test.custom_log_break_str,
+            run_id=run_id,
+            custom_stats_break=test.custom_stats_break,
+            limits_from=limits_from,
+            worker=worker,
+        )
+    finally:
+        if workers is not None:
+            workers.put(worker)
+
+    return run_id, {
+        "run": run_id,
+        "seconds": round(time.time() - start_time, 3),
+        **resources,
+    }
+
+
+def run_trials(
+    trials: list[tuple[Test, tuple[str, str], int]],
+    num_workers: int,
+    destination: str | TrajectoryStore,
+    limits_from: Literal["stream", "stats"],
+    use_workers: bool = False,
+    durations: DurationHistory | None = None,
+    coordinator: Coordinator | None = None,
+) -> list[str]:
+    """Runs the (test, metadata, repetition) trials on up to num_workers agents at once, each with its own browser and run, or on the hosts connected to the coordinator. With use_workers, each agent is a long-lived AgentWorker reused across trials. Trials start longest expected first (from durations, or their time limits), and each finished run is appended and recorded in the destination's RunJournal and durations as soon as it finishes (see record_trials). Returns the finished blocks in trial order."""
+    expected_durations = get_expected_durations(trials, durations)
+
+    if coordinator is not None:
+        finished = coordinator.run(
+            [
+                {
+                    "key": get_test_key(test, metadata),
+                    "repetition": repetition,
+                    "test": None,
+                }
+                for test, metadata, repetition in trials
+            ],
+            expected_durations,
+        )
+    else:
+        finished = iter_finished_trials(
+            lambda index, workers: run_trial(
+                trials[index][0], trials[index][1], limits_from, workers
+            ),
+            expected_durations,
+            num_workers,
+            use_workers,
+        )
+
+    return record_trials(
+        [
+            (get_test_key(test, metadata), repetition)
+            for test, metadata, repetition in trials
+        ],
+        finished,
+        destination,
+        durations,
+    )
+
+
+def run_adaptive_trials(
+    tests_and_metadatas: list[TestsAndMetadata],
+    target_width: float,
+    max_repetitions: int,
+    num_workers: int,
+    destination: str | TrajectoryStore,
+    limits_from: Literal["stream", "stats"],
+    use_workers: bool = False,
+    durations: DurationHistory | None = None,
+    coordinator: Coordinator | None = None,
+    evaluated_runs: dict[str, list[tuple[bool, bool | None]]] | None = None,
+):
+    """Repeats each test until get_stop_reason says its pass rate is known well enough (or it hit max_repetitions), starting from the runs in evaluated_runs when resuming. Each round runs the next repetition of every test that hasn't stopped (the first round runs ADAPTIVE_MIN_REPETITIONS of them) through run_trials, and the stopping reasons are recorded in the destination's RunJournal."""
+    journal = RunJournal(destination)
+    stop_reasons = journal.read_stop_reasons()
+    passes = {
+        get_test_key(test, metadata): [
+            run_passed(result)
+            for result in (evaluated_runs or {}).get(get_test_key(test, metadata), [])
+        ]
+        for tests, metadata in tests_and_metadatas
+        for test in tests
+    }
+
+    while True:
+        trials = []
+        for tests, metadata in tests_and_metadatas:
+            for test in tests:
+                key = get_test_key(test, metadata)
+                if key in stop_reasons:
+                    continue
+
+                stop_reason = get_stop_reason(
+                    sum(passes[key]), len(passes[key]), target_width, max_repetitions
+                )
+                if stop_reason is not None:
+                    stop_reasons[key] = stop_reason
+                    journal.record_stop(key, stop_reason)
+                    continue
+
+                num_repetitions = max(1, ADAPTIVE_MIN_REPETITIONS - len(passes[key]))
+                trials.extend(
+                    (test, metadata, len(passes[key]) + offset)
+                    for offset in range(num_repetitions)
+                )
+
+        if len(trials) == 0:
+            return
+
+        blocks = run_trials(
+            trials,
+            num_workers,
+            destination,
+            limits_from,
+            use_workers,
+            durations,
+            coordinator,
+        )
+        for (test, metadata, _), block in zip(trials, blocks):
+            key = get_test_key(test, metadata)
+            passes[key].append(run_passed(evaluate_run(parse_block(block))))
+
+
+def get_key_test(key: str) -> Test:
+    test, _ = get_specific_test_and_metadata(*re.split(r"[ /]", key))
+    return test
+
+
+def evaluate_run(block: TestBlock) -> tuple[bool, bool | None]:
+    """Evaluates one run of a test: whether its logs pass the test's eval, and whether its submit passes the submit_eval (None if the test has none)"""
+    test = get_key_test(block.key)
+    return get_run_result(test, block, bool(test.eval(block.logs)))
+
+
+def evaluate_blocks(blocks: list[TestBlock]) -> list[tuple[bool, bool | None]]:
+    """Evaluates many runs as evaluate_run does, with their logs evaluated together (see evaluation/batch.py)"""
+    tests_by_key = {key: get_key_test(key) for key in {block.key for block in blocks}}
+    tests = [tests_by_key[block.key] for block in blocks]
+    eval_results = batch.evaluate_logs(
+        [block.logs for block in blocks], [test.eval for test in tests]
+    )
+    return [
+        get_run_result(test, block, eval_result)
+        for test, block, eval_result in zip(tests, blocks, eval_results)
+    ]
+
+
+def get_run_result(
+    test: Test, block: TestBlock, eval_result: bool
+) -> tuple[bool, bool | None]:
+    if test.submit_eval is None:
+        return eval_result, None
+    return eval_result, (
+        bool(test.submit_eval(block.submit)) if block.submit is not None else False
+    )
+
+
+def run_passed(result: tuple[bool, bool | None]) -> bool:
+    """Whether a run passed its test: its submit passed the submit_eval, or its logs passed the eval for tests without one"""
+    eval_result, submit_eval_result = result
+    return eval_result if submit_eval_result is None else submit_eval_result
+
+
+def evaluate_runs(
+    filenames: str | list[str],
+    selectors: list[str] | None = None,
+    cache: EvalCache | None = None,
+    batched: bool = False,
+) -> dict[str, list[tuple[bool, bool | None]]]:
+    """Evaluates each run in the logs (see evaluate_run) as they are read, grouped by test key. With a cache, runs whose block was evaluated before aren't turned into Logs or evaluated again. With batched, the runs not in the cache are evaluated together, batch.BATCH_SIZE at a time (see evaluate_blocks)."""
+    evaluated_runs = {}
+    # (the results and index to fill in, block, cache key) of each run left to evaluate in the next batch
+    pending = []
+
+    def evaluate_pending():
+        results = evaluate_blocks([block for _, _, block, _ in pending])
+        for (run_results, index, _, cache_key), result in zip(pending, results):
+            run_results[index] = result
+            if cache is not None:
+                cache.put(cache_key, result)
+        pending.clear()
+
+    for block in iter_test_blocks(filenames, selectors):
+        cache_key = cache.key(block.lines) if cache is not None else None
+        result = cache.get(cache_key) if cache is not None else None
+        results = evaluated_runs.setdefault(block.key, [])
+
+        if result is None and batched:
+            pending.append((results, len(results), block, cache_key))
+        elif result is None:
+            result = evaluate_run(block)
+            if cache is not None:
+                cache.put(cache_key, result)
+
+        results.append(result)
+        if len(pending) == batch.BATCH_SIZE:
+            evaluate_pending()
+
+    if pending:
+        evaluate_pending()
+
+    return evaluated_runs
+
+
 # class PassStats:
 #     def __init__(self):
 #         self.pass_count = 0
@@ -626,17 +904,87 @@ if __name__ == "__main__":
     # Identify the right goals and urls to iterate through
     skip_to_evaluate = False
     tests_and_metadatas = []
-    num_times = 1
+    num_times = None
+    target_width = None
+    log_filepaths = []
+    limits_from = "stream"
+    store = None
+    selectors = []
+    num_workers = 1
+    use_workers = False
+    resume = False
+    use_cache = True
+    prewarm = True
+    plan = False
+    coordinate_address = None
+    batched = False
 
     for i, arg in enumerate(sys.argv[1:]):
         if arg == "-evalonly":
             skip_to_evaluate = True
-            break
+            continue
+
+        if arg.startswith("-j="):
+            num_workers = int(arg.split("=")[1])
+            continue
+
+        if arg == "-noprewarm":
+            prewarm = False
+            continue
+
+        if arg == "-plan":
+            plan = True
+            continue
+
+        if arg.startswith("-coordinate="):
+            coordinate_address = parse_address(arg.split("=", 1)[1])
+            continue
+
+        if arg == "-adaptive" or arg.startswith("-adaptive="):
+            target_width = (
+                float(arg.split("=")[1]) if "=" in arg else ADAPTIVE_TARGET_WIDTH
+            )
+            continue
+
+        if arg == "-workers":
+            use_workers = True
+            continue
+
+        if arg == "-resume":
+            resume = True
+            continue
+
+        if arg == "-nocache":
+            use_cache = False
+            continue
+
+        if arg == "-batch":
+            batched = True
+            continue
+
+        if arg == "-store" or arg.startswith("-store="):
+            if arg not in ["-store", "-store=gzip"]:
+                raise Exception(f"ERROR: unknown {arg}, expected -store or -store=gzip")
+            store = TrajectoryStore(STORE_FOLDER, compress=arg == "-store=gzip")
+            continue
 
         if arg.startswith("-n="):
             num_times = int(arg.split("=")[1])
             continue
 
+        if arg.startswith("-log="):
+            log_filepaths.append(arg.split("=", 1)[1])
+            continue
+
+        if arg.startswith("-limits="):
+            limits_from = arg.split("=")[1]
+            if limits_from not in ["stream", "stats"]:
+                raise Exception(
+                    f"ERROR: unknown -limits={limits_from}, expected stream or stats"
+                )
+            continue
+
+        selectors.append(arg)
         parts = arg.split("/", 1)
         if len(parts) == 1:
             new = get_tests_and_metadatas_from_task(parts[0])
@@ -652,39 +1000,123 @@ if __name__ == "__main__":
         if new is not None:
             tests_and_metadatas = new
 
+    destination = store if store is not None else LOG_FILEPATH
+    journal = RunJournal(destination)
+    durations = DurationHistory()
+
+    # Print the expected total time and per-agent load of running the selected tests -n times, without running them
+    if plan:
+        print_plan(
+            get_expected_durations(
+                [
+                    (test, metadata, repetition)
+                    for tests, metadata in tests_and_metadatas
+                    for test in tests
+                    for repetition in range(num_times if num_times is not None else 1)
+                ],
+                durations,
+            ),
+            num_workers,
+        )
+        sys.exit(0)
+
+    coordinator = (
+        Coordinator(coordinate_address, "ind", limits_from)
+        if coordinate_address is not None and not skip_to_evaluate
+        else None
+    )
+
     if not skip_to_evaluate:
-        # Clear the log file
-        with open(LOG_FILEPATH, "w") as file:
-            pass
+        # The hosts of a -coordinate run have their own environments
+        if prewarm and coordinator is None:
+            wait_until_warm(get_prewarm_urls(tests_and_metadatas))
 
-        # Run the tests
-        for tests, metadata in tests_and_metadatas:
-            for test in tests:
-                for _ in range(num_times):
-                    with open(LOG_FILEPATH, "a") as file:
-                        file.write(
-                            f"TEST BEGIN: {metadata[0]}/{metadata[1]} {test.name}\n"
-                        )
+        # Pick up after the trials already finished, or clear the log file (or the trajectory store)
+        if resume:
+            finished = journal.resume("ind")
+        else:
+            finished = set()
+            journal.clear()
+            if store is not None:
+                store.clear()
+            else:
+                with open(LOG_FILEPATH, "w") as file:
+                    pass
 
-                    existing_lines = 0
-                    with open(LOG_FILEPATH, "r") as file:
-                        existing_lines = len(file.readlines())
-                    run_agent_with_limits(
-                        goal=test.goal,
-                        url=get_url(LOCALHOST_PORT, *metadata),
-                        existing_lines=existing_lines,
-                        log_file=LOG_FILEPATH,
-                        timeout=test.max_time,
-                        addl_lines=test.max_lines,
-                        custom_log_break=test.custom_log_break,
-                        custom_log_break_str=test.custom_log_break_str,
+        # Run the tests, each -n times or, with -adaptive, until its pass rate is known well enough
+        if target_width is not None:
+            run_adaptive_trials(
+                tests_and_metadatas,
+                target_width,
+                num_times if num_times is not None else ADAPTIVE_MAX_REPETITIONS,
+                num_workers,
+                destination,
+                limits_from,
+                use_workers,
+                durations,
+                coordinator,
+                (
+                    evaluate_runs(
+                        STORE_FOLDER if store is not None else LOG_FILEPATH, selectors
                     )
+                    if resume
+                    else None
+                ),
+            )
+        else:
+            trials = [
+                (test, metadata, repetition)
+                for tests, metadata in tests_and_metadatas
+                for test in tests
+                for repetition in range(num_times if num_times is not None else 1)
+                if (get_test_key(test, metadata), repetition) not in finished
+            ]
+            run_trials(
+                trials,
+                num_workers,
+                destination,
+                limits_from,
+                use_workers,
+                durations,
+                coordinator,
+            )
 
-                    with open(LOG_FILEPATH, "a") as file:
-                        file.write("TEST FINISH\n")
+        if coordinator is not None:
+            coordinator.close()
+
+    # Evaluate the selected tests from the log file (or store), or from the logs passed with -log= merged in order
+    cache = (
+        EvalCache(
+            fingerprint_files(
+                __file__,
+                evaluators.__file__,
+                trajectory.__file__,
+                batch.__file__,
+                bulk.__file__,
+                utils.__file__,
+            )
+        )
+        if use_cache
+        else None
+    )
+    evaluated_runs = evaluate_runs(
+        (
+            log_filepaths
+            if log_filepaths
+            else STORE_FOLDER if store is not None else LOG_FILEPATH
+        ),
+        selectors,
+        cache,
+        batched,
+    )
+    if cache is not None:
+        cache.close()
+        if cache.describe_hits() is not None:
+            print(cache.describe_hits())
+
+    # Runs with -adaptive record why each test stopped being repeated
+    stop_reasons = journal.read_stop_reasons() if not log_filepaths else {}
 
-    # Evaluate the log file
-    eval_dict = get_evals_dict(LOG_FILEPATH)
     output_csv_rows = [
         [
             "Category",
@@ -697,18 +1129,24 @@ if __name__ == "__main__":
             "Process Total Count",
         ]
     ]
+    if stop_reasons:
+        output_csv_rows[0].append("Stop Reason")
     summary_str = ""
 
-    for key, items in eval_dict.items():
+    # Runs finish out of order with -j or -coordinate, so the tests are listed in suite order
+    suite_keys = [
+        get_test_key(test, metadata)
+        for tests, metadata in get_all_tests_and_metadatas() or []
+        for test in tests
+    ]
+    for key in in_suite_order(evaluated_runs, suite_keys):
+        results = evaluated_runs[key]
         basic_stats = PassStats()
         process_stats = None
 
-        for item in items:
-            logs = [Log(log) for log in item["logs"]]
-            test, metadata = get_specific_test_and_metadata(*re.split(r"[ /]", key))
-
-            if test.submit_eval is None:
-                if test.eval(logs):
+        for eval_result, submit_eval_result in results:
+            if submit_eval_result is None:
+                if eval_result:
                     basic_stats.pass_count += 1
                 else:
                     basic_stats.fail_count += 1
@@ -716,17 +1154,11 @@ if __name__ == "__main__":
                 if process_stats is None:
                     process_stats = PassStats()
 
-                if test.eval(logs):
+                if eval_result:
                     process_stats.pass_count += 1
                 else:
                     process_stats.fail_count += 1
 
-                submit_eval_result = (
-                    test.submit_eval(Log(item["submit"]))
-                    if item["submit"] is not None
-                    else False
-                )
-
                 if submit_eval_result:
                     basic_stats.pass_count += 1
                 else:
@@ -740,8 +1172,10 @@ if __name__ == "__main__":
         test = split_test[0]
         version = split_test[1]
 
+        stop_str = f" (stopped: {stop_reasons[key]})" if key in stop_reasons else ""
+
         if process_stats is not None:
-            summary_str += f"{key}: process: pass {display_pass_stats(process_stats.pass_count, process_stats.fail_count, True)} submit: pass {display_pass_stats(basic_stats.pass_count, basic_stats.fail_count, True)}\n"
+            summary_str += f"{key}: process: pass {display_pass_stats(process_stats.pass_count, process_stats.fail_count, True)} submit: pass {display_pass_stats(basic_stats.pass_count, basic_stats.fail_count, True)}{stop_str}\n"
             output_csv_rows.append(
                 [
                     category,
@@ -755,7 +1189,7 @@ if __name__ == "__main__":
                 ]
             )
         else:
-            summary_str += f"{key}: pass {display_pass_stats(basic_stats.pass_count, basic_stats.fail_count, True)}\n"
+            summary_str += f"{key}: pass {display_pass_stats(basic_stats.pass_count, basic_stats.fail_count, True)}{stop_str}\n"
             output_csv_rows.append(
                 [
                     category,
@@ -767,9 +1201,17 @@ if __name__ == "__main__":
                 ]
             )
 
+        if stop_reasons:
+            output_csv_rows[-1].extend([""] * (8 - len(output_csv_rows[-1])))
+            output_csv_rows[-1].append(stop_reasons.get(key, ""))
+
     with open(OUTPUT_FILEPATH, "w", newline="") as csv_file:
         csv_writer = csv.writer(csv_file)
         csv_writer.writerows(output_csv_rows)
 
     with open(SUMMARY_FILEPATH, "w") as file:
         file.write(summary_str)
+
+    # One row per trial of the run in the log file (or store), with its resources
+    if not log_filepaths:
+        journal.export_trials(TRIALS_OUTPUT_FILEPATH)
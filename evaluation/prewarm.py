@@ -0,0 +1,14 @@
+"""Requests every url the ind and e2e harnesses can visit, so the frontend has compiled (dev) or cached (production build) each page before agents start. start.sh runs this once both servers are up."""
+
+from evaluation import e2e, ind
+from evaluation.utils import wait_until_warm
+
+
+def get_all_urls() -> list[str]:
+    return ind.get_prewarm_urls(ind.get_all_tests_and_metadatas()) + [
+        e2e.get_test_url(path) for path in e2e.get_all_test_paths()
+    ]
+
+
+if __name__ == "__main__":
+    wait_until_warm(get_all_urls())
@@ -0,0 +1,204 @@
+"""A trajectory kept as rolled segments plus a sidecar index, so evaluation can seek straight to the TEST blocks it needs instead of reading the whole log.
+
+The store is a folder holding segment-000001.txt, segment-000002.txt, ... and index.jsonl. Each line of index.jsonl describes one TEST block: its key (from `TEST BEGIN: <key>`), segment, byte offset and length. A new segment is started once the current one passes max_segment_bytes. With compress=True, each block is written as its own gzip member (segment-000001.txt.gz), so blocks can still be read by offset.
+
+Import an existing log with `python -m evaluation.store import <log> [<store folder>] [-gzip]`.
+"""
+
+import json
+import os
+import sys
+import zlib
+from typing import Iterator
+
+from evaluation.trajectory import parse_trajectory_line
+
+try:
+    import fcntl
+except ImportError:  # not available on Windows
+    fcntl = None
+
+STORE_FOLDER = os.path.join(os.path.dirname(__file__), "../trajectories/store/")
+MAX_SEGMENT_BYTES = 64 * 1024 * 1024
+
+
+def key_matches(key: str, selectors: list[str] | None) -> bool:
+    """Whether a TEST key (e.g. `click/button default`) is picked by any selector: a task (`click`), a task/test (`click/button`) or the full key"""
+    if not selectors:
+        return True
+    return any(
+        key == selector
+        or key.startswith(selector + "/")
+        or key.startswith(selector + " ")
+        for selector in selectors
+    )
+
+
+class IndexEntry:
+    def __init__(self, key: str, segment: str, offset: int, length: int):
+        self.key = key
+        self.segment = segment
+        self.offset = offset
+        self.length = length
+
+
+class TrajectoryStore:
+    def __init__(
+        self,
+        folder: str = STORE_FOLDER,
+        compress: bool = False,
+        max_segment_bytes: int = MAX_SEGMENT_BYTES,
+    ):
+        self.folder = folder
+        self.compress = compress
+        self.max_segment_bytes = max_segment_bytes
+        self.index_filepath = os.path.join(folder, "index.jsonl")
+
+    def clear(self):
+        if not os.path.isdir(self.folder):
+            return
+        for filename in os.listdir(self.folder):
+            if filename == "index.jsonl" or filename.startswith("segment-"):
+                os.remove(os.path.join(self.folder, filename))
+
+    def read_index(self) -> list[IndexEntry]:
+        if not os.path.exists(self.index_filepath):
+            return []
+        with open(self.index_filepath, "r") as file:
+            return [IndexEntry(**json.loads(line)) for line in file if line.strip()]
+
+    def read_last_entry(self) -> IndexEntry | None:
+        """Reads only the tail of the index, so appends stay cheap however large it grows"""
+        if not os.path.exists(self.index_filepath):
+            return None
+        with open(self.index_filepath, "rb") as file:
+            file.seek(0, os.SEEK_END)
+            position = file.tell()
+            tail = b""
+            while position > 0 and tail.count(b"\n") < 2:
+                step = min(4096, position)
+                position -= step
+                file.seek(position)
+                tail = file.read(step) + tail
+        lines = tail.strip().split(b"\n")
+        return IndexEntry(**json.loads(lines[-1])) if lines[-1] else None
+
+    def current_segment(self, last_entry: IndexEntry | None) -> str:
+        extension = ".txt.gz" if self.compress else ".txt"
+        if last_entry is not None:
+            last = last_entry.segment
+            size = os.path.getsize(os.path.join(self.folder, last))
+            if last.endswith(extension) and size < self.max_segment_bytes:
+                return last
+            number = int(last.split("-")[1].split(".")[0]) + 1
+        else:
+            number = 1
+        return f"segment-{number:06d}{extension}"
+
+    def append_block(self, block: str) -> IndexEntry:
+        """Appends one complete TEST BEGIN ... TEST FINISH block, indexes it and returns where it went"""
+        kind, key = parse_trajectory_line(block.split("\n", 1)[0].strip())
+        if kind != "begin":
+            raise Exception("ERROR: a trajectory block must start with TEST BEGIN")
+
+        data = block.encode()
+        if self.compress:
+            compressor = zlib.compressobj(wbits=31)  # a gzip member
+            data = compressor.compress(data) + compressor.flush()
+
+        os.makedirs(self.folder, exist_ok=True)
+        with open(self.index_filepath, "a") as index_file:
+            # Serializes appends from concurrent runners
+            if fcntl is not None:
+                fcntl.flock(index_file.fileno(), fcntl.LOCK_EX)
+
+            segment = self.current_segment(self.read_last_entry())
+            with open(os.path.join(self.folder, segment), "ab") as segment_file:
+                offset = segment_file.tell()
+                segment_file.write(data)
+
+            entry = IndexEntry(key, segment, offset, len(data))
+            index_file.write(json.dumps(vars(entry)) + "\n")
+
+        return entry
+
+    def truncate(self, num_blocks: int):
+        """Keeps only the first num_blocks blocks, dropping the rest from the index and segments"""
+        entries = self.read_index()
+        if len(entries) <= num_blocks:
+            return
+
+        kept = entries[:num_blocks]
+        with open(self.index_filepath, "w") as index_file:
+            index_file.writelines(json.dumps(vars(entry)) + "\n" for entry in kept)
+
+        last = kept[-1] if kept else None
+        for segment in sorted(set(entry.segment for entry in entries[num_blocks:])):
+            filepath = os.path.join(self.folder, segment)
+            if last is not None and segment == last.segment:
+                os.truncate(filepath, last.offset + last.length)
+            else:
+                os.remove(filepath)
+
+    def read_lines(self, selectors: list[str] | None = None) -> Iterator[str]:
+        """Yields the lines of the blocks whose key matches the selectors, seeking to each block through the index"""
+        segment_file = None
+        segment = None
+
+        try:
+            for entry in self.read_index():
+                if not key_matches(entry.key, selectors):
+                    continue
+
+                if entry.segment != segment:
+                    if segment_file is not None:
+                        segment_file.close()
+                    segment = entry.segment
+                    segment_file = open(os.path.join(self.folder, segment), "rb")
+
+                segment_file.seek(entry.offset)
+                data = segment_file.read(entry.length)
+                if segment.endswith(".gz"):
+                    data = zlib.decompress(data, wbits=31)
+
+                yield from data.decode().splitlines(keepends=True)
+        finally:
+            if segment_file is not None:
+                segment_file.close()
+
+    def import_log(self, log_filepath: str) -> int:
+        """Splits an existing log into blocks and appends them. Lines outside TEST blocks are dropped. Returns the number of blocks."""
+        count = 0
+        block: list[str] | None = None
+
+        with open(log_filepath, "r") as file:
+            for line in file:
+                kind, _ = parse_trajectory_line(line.strip())
+                if kind == "begin":
+                    block = [line]
+                elif block is not None:
+                    block.append(line)
+                    if kind == "finish":
+                        self.append_block("".join(block))
+                        count += 1
+                        block = None
+
+        return count
+
+
+def is_store(path: str) -> bool:
+    return os.path.isdir(path)
+
+
+if __name__ == "__main__":
+    args = [arg for arg in sys.argv[1:] if not arg.startswith("-")]
+    if len(args) not in (2, 3) or args[0] != "import":
+        raise Exception(
+            "ERROR: usage is python -m evaluation.store import <log> [<store folder>] [-gzip]"
+        )
+
+    store = TrajectoryStore(
+        args[2] if len(args) == 3 else STORE_FOLDER, compress="-gzip" in sys.argv
+    )
+    count = store.import_log(args[1])
+    print(f"Imported {count} blocks into {store.folder}")
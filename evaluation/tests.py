@@ -1,13 +1,21 @@
 import subprocess
 import os
 import csv
+import signal
+import socket
+import time
 from typing import Callable
 
+from evaluation.bulk import MappedLog
+from evaluation.utils import parse_test_blocks, read_log_lines
+
 PARENT_FOLDER = os.path.join(os.path.dirname(__file__), "../")
 LOG_FILEPATH = PARENT_FOLDER + "trajectories/log.txt"
 IND_OUTPUT_FILEPATH = PARENT_FOLDER + "output/ind_output.csv"
 E2E_OUTPUT_FILEPATH = PARENT_FOLDER + "output/e2e_output.csv"
 E2E_TASK_OUTPUT_FILEPATH = PARENT_FOLDER + "output/e2e_task_output.csv"
+IND_SUMMARY_FILEPATH = PARENT_FOLDER + "output/ind_summary.txt"
+RUNS_FOLDER = PARENT_FOLDER + "trajectories/runs/"
 
 
 # SCAFFOLDING TO SET UP THE TEST
@@ -18,18 +26,107 @@ def initialize_log_file(content: str):
         file.write(content)
 
 
-def run_evaluation_e2e_evalonly():
-    command = f"""python -m evaluation.e2e -evalonly"""
+def run_evaluation_e2e_evalonly(args: str = "-nocache"):
+    command = f"""python -m evaluation.e2e -evalonly {args}"""
     process = subprocess.Popen(command, shell=True)
     process.wait()
 
 
-def run_evaluation_ind_evalonly():
-    command = f"""python -m evaluation.ind -evalonly"""
+def run_evaluation_ind_evalonly(args: str = "-nocache"):
+    command = f"""python -m evaluation.ind -evalonly {args}"""
     process = subprocess.Popen(command, shell=True)
     process.wait()
 
 
+def read_ind_outputs() -> tuple[list[list[str]], str]:
+    with open(IND_OUTPUT_FILEPATH, "r") as file:
+        rows = list(csv.reader(file))
+    with open(IND_SUMMARY_FILEPATH, "r") as file:
+        summary = file.read()
+
+    return rows, summary
+
+
+def read_e2e_outputs() -> tuple[list[list[str]], list[list[str]]]:
+    with open(E2E_OUTPUT_FILEPATH, "r") as file:
+        rows = list(csv.reader(file))
+    with open(E2E_TASK_OUTPUT_FILEPATH, "r") as file:
+        task_rows = list(csv.reader(file))
+
+    return rows, task_rows
+
+
+def run_ind_with_mock_agent(args: str) -> tuple[list[list[str]], str]:
+    """Runs the individual tests with the mock agent and returns the output rows and summary"""
+    command = f"""AGENT_MODULE=evaluation.agents.mock.mock python -m evaluation.ind -noprewarm {args}"""
+    process = subprocess.Popen(command, shell=True, stdout=subprocess.DEVNULL)
+    process.wait()
+
+    return read_ind_outputs()
+
+
+def interrupt_ind_with_mock_agent(args: str, seconds: float):
+    """Starts the individual tests with the mock agent and interrupts them with Ctrl-C after the given seconds, while trials are still running"""
+    process = subprocess.Popen(
+        ["python", "-m", "evaluation.ind", "-noprewarm", *args.split()],
+        env={**os.environ, "AGENT_MODULE": "evaluation.agents.mock.mock"},
+        stdout=subprocess.DEVNULL,
+        stderr=subprocess.DEVNULL,
+    )
+    time.sleep(seconds)
+    process.send_signal(signal.SIGINT)
+    process.wait()
+
+
+def run_ind_on_cluster_with_mock_agent(
+    args: str, hosts_args: list[str]
+) -> tuple[list[list[str]], str]:
+    """Runs the individual tests with the mock agent through a coordinator and one host per entry of hosts_args, all on localhost, and returns the output rows and summary"""
+    with socket.socket() as sock:
+        sock.bind(("127.0.0.1", 0))
+        address = f"127.0.0.1:{sock.getsockname()[1]}"
+
+    env = {
+        **os.environ,
+        "AGENT_MODULE": "evaluation.agents.mock.mock",
+        "CLUSTER_KEY": "tests",
+    }
+    coordinator = subprocess.Popen(
+        f"python -m evaluation.ind -coordinate={address} {args}",
+        shell=True,
+        env=env,
+        stdout=subprocess.DEVNULL,
+    )
+    time.sleep(2)
+    hosts = [
+        subprocess.Popen(
+            f"python -m evaluation.cluster {address} -noprewarm {host_args}",
+            shell=True,
+            env=env,
+            stdout=subprocess.DEVNULL,
+        )
+        for host_args in hosts_args
+    ]
+    coordinator.wait()
+    for host in hosts:
+        host.wait()
+
+    return read_ind_outputs()
+
+
+def mapped_log_matches_parser(content: str) -> bool:
+    """Whether the memory-mapped reader finds the same blocks (keys and lines) in a legacy text log as the line-by-line parser"""
+    initialize_log_file(content)
+    with MappedLog(LOG_FILEPATH) as log:
+        mapped = [(block.key, block.lines) for block in log.blocks()]
+    parsed = [
+        (block.key, block.lines)
+        for block in parse_test_blocks(read_log_lines(LOG_FILEPATH))
+    ]
+
+    return mapped == parsed
+
+
 def evaluate_e2e_outputs(eval_rows: Callable[[list[str]], bool]):
     rows = []
 
@@ -188,9 +285,82 @@ IND_TESTS = [
         and rows[1]
         == ["informational", "fill", "complexform", "default", "1", "1", "1", "1"],
     ),
+    Test(
+        name="ind_jsonl_label_with_separator_pass",
+        log_content="""
+                    TEST BEGIN: type/text default
+                    {"seq": 1, "ts": 1715000000.0, "run": "ind-test", "component": "type/text", "label": "Name // first", "new": "John", "old": null}
+                    TEST FINISH
+                    """,
+        evaluate=lambda rows: len(rows) == 2
+        and rows[1] == ["operational", "type", "text", "default", "1", "1"],
+    ),
+    Test(
+        name="ind_jsonl_fill_basicform_pass_process_pass",
+        log_content="""
+                    {"marker": "TEST BEGIN", "test": "fill/basicform default"}
+                    {"seq": 1, "ts": null, "run": null, "component": "type/text", "label": "First name", "new": "John", "old": ""}
+                    {"seq": 2, "ts": null, "run": null, "component": "type/text", "label": "Last name", "new": "Doe", "old": ""}
+                    {"seq": 3, "ts": null, "run": null, "component": "type/text", "label": "Email", "new": "johndoe@gmail.com", "old": ""}
+                    {"seq": 4, "ts": null, "run": null, "component": "click/button", "label": "Submit", "new": null, "old": null}
+                    {"seq": 5, "ts": null, "run": null, "component": "SUBMIT", "label": "{\\"email\\":\\"johndoe@gmail.com\\",\\"firstName\\":\\"John\\",\\"lastName\\":\\"Doe\\"}", "new": null, "old": null}
+                    {"marker": "TEST FINISH"}
+                    """,
+        evaluate=lambda rows: len(rows) == 2
+        and rows[1]
+        == ["informational", "fill", "basicform", "default", "1", "1", "1", "1"],
+    ),
+    Test(
+        name="ind_jsonl_cut_off_record_skipped_pass",
+        log_content="""
+                    TEST BEGIN: click/button default
+                    {"seq": 1, "ts": null, "run": null, "component": "click/button", "label": "Sub
+                    {"seq": 2, "ts": null, "run": null, "component": "click/button", "label": "Submit", "new": null, "old": null}
+                    TEST FINISH
+                    """,
+        evaluate=lambda rows: len(rows) == 2
+        and rows[1] == ["operational", "click", "button", "default", "1", "1"],
+    ),
 ]
 
 E2E_TESTS = [
+    E2ETest(
+        name="e2e_jsonl_add_cart_pass_1_stuck_2",
+        log_content="""
+                    TEST BEGIN: playground/add_custom_to_cart
+                    NAVIGATE // /playground
+                    {"seq": 1, "ts": 1715000000.0, "run": "e2e-test", "component": "type/text", "label": "Search items", "new": "laptop", "old": ""}
+                    {"seq": 2, "ts": 1715000001.0, "run": "e2e-test", "component": "click/iconbutton", "label": "Search", "new": null, "old": null}
+                    {"seq": 3, "ts": 1715000001.5, "run": "e2e-test", "component": "NAVIGATE", "label": "/playground/search?query=laptop", "new": null, "old": null}
+                    TEST FINISH
+                    """,
+        evaluate_output=lambda rows: rows[1:]
+        == [
+            ["add_custom_to_cart", "0", "1"],
+            ["add_custom_to_cart", "", "", "1_search_for_item", "1", "0", "0", "1"],
+            [
+                "add_custom_to_cart",
+                "",
+                "",
+                "2_select_item_from_search",
+                "0",
+                "1",
+                "0",
+                "1",
+            ],
+            [
+                "add_custom_to_cart",
+                "",
+                "",
+                "3_select_customizations",
+                "0",
+                "0",
+                "1",
+                "1",
+            ],
+        ],
+        evaluate_summary=None,
+    ),
     E2ETest(
         name="e2e_order_full_pass",
         log_content="""
@@ -574,3 +744,79 @@ if __name__ == "__main__":
             else None
         )
         print_e2e_test_result(test.name, output_result, summary_result)
+
+    print()
+
+    # Results read from the eval cache (filled by the first cached run) must match evaluating every block again
+    initialize_log_file("".join(test.log_content for test in IND_TESTS))
+    run_evaluation_ind_evalonly()
+    ind_uncached = read_ind_outputs()
+    run_evaluation_ind_evalonly("")
+    run_evaluation_ind_evalonly("")
+    print_ind_test_result(
+        "ind_cached_matches_uncached", ind_uncached == read_ind_outputs()
+    )
+
+    # Evaluating runs together with -batch must give the same results as evaluating them one at a time
+    run_evaluation_ind_evalonly("-nocache -batch")
+    print_ind_test_result(
+        "ind_batch_matches_default", ind_uncached == read_ind_outputs()
+    )
+
+    initialize_log_file("".join(test.log_content for test in E2E_TESTS))
+    run_evaluation_e2e_evalonly()
+    e2e_uncached = read_e2e_outputs()
+    run_evaluation_e2e_evalonly("")
+    run_evaluation_e2e_evalonly("")
+    print_ind_test_result(
+        "e2e_cached_matches_uncached", e2e_uncached == read_e2e_outputs()
+    )
+
+    # Legacy text logs are memory-mapped and scanned for their blocks, which must skip stray lines and cut-off blocks like the parser does
+    print_ind_test_result(
+        "mapped_log_matches_parser",
+        mapped_log_matches_parser(
+            "".join(
+                test.log_content
+                for test in IND_TESTS + E2E_TESTS
+                if '"seq"' not in test.log_content
+            )
+            + "stray line\nTEST BEGIN: click/button cut off\nclick/button // Submit\nTEST BEGIN: click/button default\n"
+        ),
+    )
+
+    print()
+
+    # The parallel scheduler must aggregate exactly like a serial run
+    serial = run_ind_with_mock_agent("-j=1 -n=2 click")
+    parallel = run_ind_with_mock_agent("-j=4 -n=2 click")
+    print_ind_test_result("ind_parallel_matches_serial_mock_agent", serial == parallel)
+    workers = run_ind_with_mock_agent("-j=4 -n=2 -workers click")
+    print_ind_test_result("ind_workers_match_serial_mock_agent", serial == workers)
+    stored = run_ind_with_mock_agent("-j=4 -n=2 -store click")
+    print_ind_test_result("ind_store_matches_serial_mock_agent", serial == stored)
+    gzipped = run_ind_with_mock_agent("-j=4 -n=2 -store=gzip click")
+    print_ind_test_result("ind_gzip_store_matches_serial_mock_agent", serial == gzipped)
+    stats = run_ind_with_mock_agent("-j=4 -n=2 -limits=stats click")
+    print_ind_test_result("ind_stats_limits_match_serial_mock_agent", serial == stats)
+    cluster = run_ind_on_cluster_with_mock_agent("-n=2 click", ["-j=2", "-j=3"])
+    print_ind_test_result("ind_cluster_matches_serial_mock_agent", serial == cluster)
+
+    # Resuming an interrupted parallel run finishes the suite as if it had never stopped, and removes the run logs of the trials that were cut off
+    interrupt_ind_with_mock_agent("-j=4 -n=2 click", 3)
+    resumed = run_ind_with_mock_agent("-j=4 -n=2 -resume click")
+    print_ind_test_result(
+        "ind_resume_after_interrupt_matches_serial_mock_agent",
+        serial == resumed
+        and not any(
+            filename.startswith("ind-") for filename in os.listdir(RUNS_FOLDER)
+        ),
+    )
+
+    # The mock agent always passes or always fails a test, so -adaptive stops each test as soon as its interval is narrow enough
+    adaptive_rows, _ = run_ind_with_mock_agent("-j=4 -n=8 -adaptive click")
+    print_ind_test_result(
+        "ind_adaptive_stops_confident_mock_agent",
+        adaptive_rows[0][-1] == "Stop Reason"
+        and all(row[5] == "6" and row[-1] == "confident" for row in adaptive_rows[1:]),
+    )
@@ -0,0 +1,141 @@
+"""Reading and converting trajectory logs.
+
+A trajectory line is either in the legacy text format (`TEST BEGIN: <key>`, `TEST FINISH` or `component // label // new // old`) or a JSON record, as written by the log server with LOG_FORMAT=jsonl. Both can appear in one file, since the harness writes its TEST BEGIN/FINISH markers as text.
+
+Convert a legacy log to JSONL with `python -m evaluation.trajectory convert <legacy log> <jsonl log>`.
+"""
+
+import json
+import sys
+from functools import cached_property
+from typing import Any, Literal
+
+from evaluation.evaluators import Log
+
+TrajectoryLineKind = Literal["begin", "finish", "event"]
+
+
+def parse_trajectory_line(
+    line: str, location: str | None = None
+) -> tuple[TrajectoryLineKind | None, Any]:
+    """Classifies a stripped line as ("begin", test key), ("finish", None) or ("event", legacy line or JSON record). Blank lines are (None, None), and so are records that aren't valid JSON (e.g. cut off by a crash), which are skipped with a warning naming their location (file and line number) if given."""
+    if line.startswith("{"):
+        try:
+            record = json.loads(line)
+        except json.JSONDecodeError as error:
+            where = f" at {location}" if location is not None else ""
+            print(f"WARNING: skipping a record that isn't valid JSON{where}: {error}")
+            return None, None
+        marker = record.get("marker")
+        if marker == "TEST BEGIN":
+            return "begin", record["test"]
+        if marker == "TEST FINISH":
+            return "finish", None
+        return "event", record
+
+    if line.startswith("TEST BEGIN"):
+        return "begin", line.split(":")[1].strip()
+    if line.startswith("TEST FINISH"):
+        return "finish", None
+    if line == "":
+        return None, None
+    return "event", line
+
+
+def log_from_event(event: str | dict[str, Any]) -> Log:
+    if isinstance(event, str):
+        return Log(event)
+    return Log.from_fields(
+        event["component"], event["label"], event["new"], event["old"]
+    )
+
+
+def event_component(event: str | dict[str, Any]) -> str:
+    if isinstance(event, str):
+        return event.split("//", 1)[0].strip()
+    return event["component"]
+
+
+class TestBlock:
+    """One complete TEST block of a log: its key, its lines (TEST BEGIN through TEST FINISH, e.g. for cache keys) and its parsed events. The logs, submit and checkpoints the evaluators use are built from the events on first use, so a block whose result is cached is never turned into Logs."""
+
+    def __init__(self, key: str, lines: list[str], events: list[str | dict[str, Any]]):
+        self.key = key
+        self.lines = lines
+        self.events = events
+
+    @cached_property
+    def logs(self) -> list[Log]:
+        """Every event but SUBMIT, for the individual tests' evals"""
+        return [
+            log_from_event(event)
+            for event in self.events
+            if event_component(event) != "SUBMIT"
+        ]
+
+    @cached_property
+    def submit(self) -> Log | None:
+        """The last SUBMIT event, for the individual tests' submit_evals"""
+        for event in reversed(self.events):
+            if event_component(event) == "SUBMIT":
+                return log_from_event(event)
+        return None
+
+    @cached_property
+    def checkpoints(self) -> list[dict[str, Any]]:
+        """The trajectory split at each NAVIGATE, for the e2e tests: each checkpoint is a dictionary with the url navigated to and the Logs until the next NAVIGATE. Events before the first NAVIGATE aren't part of any checkpoint."""
+        checkpoints = []
+
+        for event in self.events:
+            if event_component(event) == "NAVIGATE":
+                checkpoints.append({"url": log_from_event(event).label, "logs": []})
+            elif checkpoints:
+                checkpoints[-1]["logs"].append(log_from_event(event))
+
+        return checkpoints
+
+
+def convert_legacy_log(legacy_filepath: str, jsonl_filepath: str) -> int:
+    """Rewrites a legacy text log as JSONL, numbering events in file order. Receive times and run ids aren't in the legacy format, so they are null. Returns the number of events."""
+    seq = 0
+    with open(legacy_filepath, "r") as legacy_file, open(
+        jsonl_filepath, "w"
+    ) as jsonl_file:
+        for line in legacy_file:
+            kind, value = parse_trajectory_line(line.strip())
+
+            if kind == "begin":
+                record = {"marker": "TEST BEGIN", "test": value}
+            elif kind == "finish":
+                record = {"marker": "TEST FINISH"}
+            elif kind == "event" and isinstance(value, str):
+                log = Log(value)
+                seq += 1
+                record = {
+                    "seq": seq,
+                    "ts": None,
+                    "run": None,
+                    "component": log.component,
+                    "label": log.label,
+                    "new": log.newValue,
+                    "old": log.oldValue,
+                }
+            elif kind == "event":
+                seq += 1
+                record = {**value, "seq": seq}
+            else:
+                continue
+
+            jsonl_file.write(json.dumps(record) + "\n")
+
+    return seq
+
+
+if __name__ == "__main__":
+    if len(sys.argv) != 4 or sys.argv[1] != "convert":
+        raise Exception(
+            "ERROR: usage is python -m evaluation.trajectory convert <legacy log> <jsonl log>"
+        )
+
+    count = convert_legacy_log(sys.argv[2], sys.argv[3])
+    print(f"Converted {count} events to {sys.argv[3]}")
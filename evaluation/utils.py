@@ -1,9 +1,54 @@
-from typing import Any, Callable, TypedDict
+from concurrent.futures import ThreadPoolExecutor, as_completed
+from multiprocessing.connection import Client
+from typing import Any, Callable, Generator, Iterable, Iterator, Literal, TypedDict
+import csv
+import json
+import math
+import os
+import queue
+import secrets
+import shutil
+import signal
 import subprocess
+import sys
+import tempfile
 import threading
 import time
+import urllib.error
+import urllib.parse
+import urllib.request
+import uuid
+
+from evaluation.bulk import MappedLog
+from evaluation.durations import DurationHistory, schedule
+from evaluation.evaluators import Log
+from evaluation.store import TrajectoryStore, is_store, key_matches
+from evaluation.trajectory import (
+    TestBlock,
+    event_component,
+    parse_trajectory_line,
+)
 
 LOCALHOST_PORT = 3000  # needs to be in sync with /environment/frontend/package.json
+LOG_SERVER_PORT = 3001  # needs to be in sync with FLASK_RUN_PORT in /.env
+# Module run as `python -m <module> <goal> <url>` for each trial
+AGENT_MODULE = os.getenv("AGENT_MODULE", "evaluation.agent")
+# Seconds an agent worker has to set up (imports, browser) before it is given up on
+WORKER_START_TIMEOUT = 120
+# Seconds a cancelled worker job has to stop before the worker (and its browser) is killed
+WORKER_CANCEL_GRACE = 10
+# Seconds a /log/stream long-poll waits before checking on the agent process again
+STREAM_POLL_TIMEOUT = 0.5
+STATS_POLL_INTERVAL = 0.1
+# Seconds to wait for the environment to come up and serve every url once. On the dev
+# server each route is compiled on its first visit, which can take minutes in total.
+PREWARM_TIMEOUT = 600
+# Seconds to wait for the log server, which starts in moments and compiles nothing, so an
+# environment that isn't running fails fast rather than after PREWARM_TIMEOUT
+LOG_SERVER_READY_TIMEOUT = 15
+RUNS_FOLDER = os.path.join(
+    os.path.dirname(__file__), "../trajectories/runs/"
+)  # needs to be in sync with environment/app.py
 
 TASK_CATEGORY_DICT: dict[str, list[str]] = {
     "operational": ["click", "type", "select"],
@@ -21,110 +66,492 @@ def flatten(input: list[list[Any]]) -> list[Any]:
     return [item for sublist in input for item in sublist]
 
 
-def get_url(localhost_port: str, task: str, test: str):
-    return f"localhost:{localhost_port}/ind/{task}?test={test}"
+def get_url(localhost_port: str, task: str, test: str, run_id: str | None = None):
+    url = f"localhost:{localhost_port}/ind/{task}?test={test}"
+    return url if run_id is None else add_run_to_url(url, run_id)
+
+
+def add_run_to_url(url: str, run_id: str) -> str:
+    """Adds the run query param that the frontend logger forwards to the log server"""
+    return url + ("&" if "?" in url else "?") + f"run={run_id}"
+
+
+# ENVIRONMENT HEALTH
+
+
+def fetch_until_ok(url: str, deadline: float):
+    while True:
+        try:
+            with urllib.request.urlopen(url, timeout=max(1, deadline - time.time())):
+                return
+        except OSError as error:
+            if time.time() > deadline:
+                raise Exception(f"ERROR: environment not ready, {url} failed: {error}")
+            time.sleep(0.5)
+
+
+def wait_until_warm(urls: list[str], timeout: float = PREWARM_TIMEOUT):
+    """Health gate: blocks until the log server answers (failing if it doesn't within LOG_SERVER_READY_TIMEOUT) and each url (without scheme, as from get_url) has been served once, so agents don't spend their time budget on the frontend compiling pages"""
+    start = time.time()
+    deadline = start + timeout
+
+    fetch_until_ok(
+        f"http://127.0.0.1:{LOG_SERVER_PORT}/",
+        min(deadline, start + LOG_SERVER_READY_TIMEOUT),
+    )
+    unique_urls = list(dict.fromkeys(urls))
+    for url in unique_urls:
+        fetch_until_ok("http://" + url, deadline)
+
+    print(f"Prewarmed {len(unique_urls)} urls in {time.time() - start:.1f}s")
+
+
+# RUN-SCOPED LOGS
+
+
+def new_run_id(prefix: str) -> str:
+    return f"{prefix}-{uuid.uuid4().hex[:12]}"
+
+
+def get_run_log_filepath(run_id: str) -> str:
+    return RUNS_FOLDER + run_id + ".txt"
+
+
+def begin_run_log(run_id: str, lines: list[str]) -> int:
+    """Starts the run's own log file with the given header lines (TEST BEGIN, ...) and returns how many lines it now has"""
+    os.makedirs(RUNS_FOLDER, exist_ok=True)
+    with open(get_run_log_filepath(run_id), "w") as file:
+        file.writelines(line + "\n" for line in lines)
+    return len(lines)
+
+
+def close_run_log(run_id: str) -> str:
+    """Closes the run's block with TEST FINISH, removes the run's log file and returns the block"""
+    run_log_filepath = get_run_log_filepath(run_id)
+    with open(run_log_filepath, "a") as file:
+        file.write("TEST FINISH\n")
+
+    with open(run_log_filepath, "r") as file:
+        block = file.read()
+    os.remove(run_log_filepath)
+    return block
+
+
+def append_block(block: str, log_filepath: str | TrajectoryStore) -> dict[str, Any]:
+    """Appends a whole block to the combined log (or trajectory store) in one write, so blocks from concurrent runs never interleave. Returns where the block went (offset and length, plus the segment in a store)."""
+    if isinstance(log_filepath, TrajectoryStore):
+        entry = log_filepath.append_block(block)
+        return {
+            "segment": entry.segment,
+            "offset": entry.offset,
+            "length": entry.length,
+        }
+
+    with open(log_filepath, "ab") as file:
+        return {"offset": file.tell(), "length": file.write(block.encode())}
+
+
+def finish_run_log(
+    run_id: str, log_filepath: str | TrajectoryStore
+) -> tuple[str, dict[str, Any]]:
+    """Closes the run's block and appends it to the combined log (or trajectory store), see close_run_log and append_block. Returns the block and where it went."""
+    block = close_run_log(run_id)
+    return block, append_block(block, log_filepath)
+
+
+# RUN JOURNAL
+
+
+TRIAL_OUTPUT_HEADER = [
+    "Test",
+    "Repetition",
+    "Run",
+    "Seconds",
+    "Peak RSS (MB)",
+    "CPU Seconds",
+    "Leaked Processes",
+    "Host",
+    "Termination",
+    "First Event (s)",
+    "First SUBMIT (s)",
+    "Goal (s)",
+]
+TRIAL_OUTPUT_FIELDS = [
+    "run",
+    "seconds",
+    "peak_rss_mb",
+    "cpu_seconds",
+    "leaked_processes",
+    "host",
+    "termination",
+    "first_event_seconds",
+    "first_submit_seconds",
+    "goal_seconds",
+]
+
+
+class RunJournal:
+    """Records each finished trial (test key, repetition and where its block went) next to the log or store, so an interrupted suite can be resumed with -resume. With -adaptive, it also records why each test stopped being repeated."""
+
+    def __init__(self, destination: str | TrajectoryStore):
+        self.destination = destination
+        self.filepath = (
+            os.path.join(destination.folder, "journal.jsonl")
+            if isinstance(destination, TrajectoryStore)
+            else destination + ".journal"
+        )
+
+    def clear(self):
+        if os.path.exists(self.filepath):
+            os.remove(self.filepath)
+
+    def resume(self, run_prefix: str) -> set[tuple[str, int]]:
+        """Returns the finished (test key, repetition) pairs. Anything written to the log after the last recorded block (e.g. a block whose trial was interrupted before it was recorded) is dropped, so it is rerun rather than counted twice. The run logs the interrupted trials left in RUNS_FOLDER (run ids starting with run_prefix that the journal doesn't know about) are removed too."""
+        if not os.path.exists(self.filepath):
+            raise Exception(f"ERROR: nothing to resume, no journal at {self.filepath}")
+
+        entries = [entry for entry in self.read_entries() if "repetition" in entry]
+        self.remove_orphan_runs(run_prefix, {entry.get("run") for entry in entries})
+
+        if isinstance(self.destination, TrajectoryStore):
+            self.destination.truncate(len(entries))
+        else:
+            os.truncate(
+                self.destination,
+                max(
+                    (entry["offset"] + entry["length"] for entry in entries), default=0
+                ),
+            )
+
+        return {(entry["key"], entry["repetition"]) for entry in entries}
+
+    def remove_orphan_runs(self, run_prefix: str, known_runs: set[str | None]):
+        if not os.path.isdir(RUNS_FOLDER):
+            return
+
+        for filename in os.listdir(RUNS_FOLDER):
+            run_id, extension = os.path.splitext(filename)
+            if (
+                run_id.startswith(run_prefix + "-")
+                and extension == ".txt"
+                and run_id not in known_runs
+            ):
+                os.remove(os.path.join(RUNS_FOLDER, filename))
+
+    def read_entries(self) -> list[dict[str, Any]]:
+        if not os.path.exists(self.filepath):
+            return []
+
+        with open(self.filepath, "r") as file:
+            return [json.loads(line) for line in file if line.strip()]
+
+    def is_current(self, entries: list[dict[str, Any]]) -> bool:
+        """Whether the journal's entries still describe the log (or store), i.e. it hasn't been rewritten since by anything else"""
+        blocks = [entry for entry in entries if "repetition" in entry]
+        if isinstance(self.destination, TrajectoryStore):
+            return len(blocks) == len(self.destination.read_index())
+        return os.path.exists(self.destination) and os.path.getsize(
+            self.destination
+        ) == max((entry["offset"] + entry["length"] for entry in blocks), default=0)
+
+    def read_stop_reasons(self) -> dict[str, str]:
+        """Returns why each test stopped being repeated (see get_stop_reason), for runs with -adaptive. Nothing is returned if the journal is out of date."""
+        entries = self.read_entries()
+        if not self.is_current(entries):
+            return {}
+        return {entry["key"]: entry["stop"] for entry in entries if "stop" in entry}
+
+    def record(
+        self,
+        key: str,
+        repetition: int,
+        location: dict[str, Any],
+        trial: dict[str, Any] | None = None,
+    ):
+        """Records a finished trial, with its run id, duration and resources (see run_agent_with_limits) in trial"""
+        with open(self.filepath, "a") as file:
+            file.write(
+                json.dumps(
+                    {"key": key, "repetition": repetition, **location, **(trial or {})}
+                )
+                + "\n"
+            )
+
+    def export_trials(self, filepath: str):
+        """Writes one row per trial recorded in the journal to a CSV file, with the run id, duration, peak RSS and CPU seconds of the agent's process tree, how many processes it left behind, the host it ran on for -coordinate runs, and why it ended and when its first event, first SUBMIT and goal arrived. Nothing is written if the journal is out of date."""
+        entries = self.read_entries()
+        if not self.is_current(entries):
+            return
+
+        rows = [TRIAL_OUTPUT_HEADER]
+        for entry in entries:
+            if "repetition" in entry:
+                rows.append(
+                    [entry["key"], entry["repetition"]]
+                    + [entry.get(field, "") for field in TRIAL_OUTPUT_FIELDS]
+                )
+
+        with open(filepath, "w", newline="") as csv_file:
+            csv.writer(csv_file).writerows(rows)
+
+    def record_stop(self, key: str, reason: str):
+        with open(self.filepath, "a") as file:
+            file.write(json.dumps({"key": key, "stop": reason}) + "\n")
+
+
+# ADAPTIVE REPETITIONS
+
+# With -adaptive, each test runs at least ADAPTIVE_MIN_REPETITIONS times, and then until the
+# 95% confidence interval of its pass rate is narrower than the target width (-adaptive=<width>)
+# or it has run the max number of times (-n=, or ADAPTIVE_MAX_REPETITIONS)
+ADAPTIVE_MIN_REPETITIONS = 3
+ADAPTIVE_MAX_REPETITIONS = 16
+ADAPTIVE_TARGET_WIDTH = 0.4
+CONFIDENCE_Z = 1.96
+
+
+def wilson_interval(
+    pass_count: int, total_count: int, z: float = CONFIDENCE_Z
+) -> tuple[float, float]:
+    """Returns the Wilson score interval of a pass rate. Unlike the normal approximation used in analyze.ipynb, it doesn't shrink to nothing when every run passes (or fails), so a test still needs enough runs to be confident in a 100% pass rate."""
+    if total_count == 0:
+        return 0.0, 1.0
+
+    p = pass_count / total_count
+    denominator = 1 + z**2 / total_count
+    center = (p + z**2 / (2 * total_count)) / denominator
+    margin = (
+        z
+        * math.sqrt(p * (1 - p) / total_count + z**2 / (4 * total_count**2))
+        / denominator
+    )
+    return max(0.0, center - margin), min(1.0, center + margin)
+
+
+def get_stop_reason(
+    pass_count: int,
+    total_count: int,
+    target_width: float = ADAPTIVE_TARGET_WIDTH,
+    max_repetitions: int = ADAPTIVE_MAX_REPETITIONS,
+) -> Literal["confident", "max_n"] | None:
+    """Returns why a test with these results should stop being repeated, or None if it should run again"""
+    if total_count < min(ADAPTIVE_MIN_REPETITIONS, max_repetitions):
+        return None
+
+    low, high = wilson_interval(pass_count, total_count)
+    if high - low <= target_width:
+        return "confident"
+    if total_count >= max_repetitions:
+        return "max_n"
+    return None
+
+
+# READING LOGS
 
 
 class TestSpecificEvalDict(TypedDict):
-    logs: list[str]
-    submit: str
+    logs: list[Log]
+    submit: Log | None
+
+
+def as_filenames(filenames: str | list[str]) -> list[str]:
+    return [filenames] if isinstance(filenames, str) else filenames
 
 
-def get_evals_dict(filename: str) -> dict[str, list[TestSpecificEvalDict]]:
-    lines = ""
+def read_log_lines(filename: str, selectors: list[str] | None = None) -> Iterator[str]:
+    """Yields the lines of a log file as they are read, or only the selected blocks of a trajectory store folder"""
+    if is_store(filename):
+        yield from TrajectoryStore(filename).read_lines(selectors)
+        return
+
     with open(filename, "r") as file:
-        lines = file.readlines()
+        yield from file
+
+
+def parse_test_blocks(
+    lines: Iterable[str],
+    selectors: list[str] | None = None,
+    filename: str | None = None,
+) -> Iterator[TestBlock]:
+    """Parses lines (legacy text or JSONL records) in one pass, yielding each complete, selected block as soon as its TEST FINISH is read. Lines outside blocks, and blocks cut off by another TEST BEGIN or the end of the lines, are skipped, as are records that aren't valid JSON (reported with their line number in filename, if given)."""
+    key = None
+    block = []
+    events = []
+
+    for number, line in enumerate(lines, 1):
+        kind, value = parse_trajectory_line(
+            line.strip(), f"{filename}:{number}" if filename is not None else None
+        )
+        if kind == "begin":
+            key = value if key_matches(value, selectors) else None
+            block = [line]
+            events = []
+        elif key is not None:
+            block.append(line)
+            if kind == "event":
+                events.append(value)
+            elif kind == "finish":
+                yield TestBlock(key, block, events)
+                key = None
+
+
+def parse_block(block: str) -> TestBlock:
+    """Parses one block, e.g. as returned by close_run_log"""
+    return next(parse_test_blocks(block.splitlines(keepends=True)))
+
+
+def iter_test_blocks(
+    filenames: str | list[str],
+    selectors: list[str] | None = None,
+) -> Iterator[TestBlock]:
+    """Yields each complete, selected block of one log file, or several merged in order (e.g. one per run), reading the files lazily so only one block is held in memory at a time. A folder is read as a trajectory store, seeking to the selected blocks. Legacy logs are memory-mapped and scanned for their blocks (see evaluation/bulk.py)."""
+    for filename in as_filenames(filenames):
+        if not is_store(filename):
+            with MappedLog(filename) as log:
+                if not log.has_records():
+                    yield from log.blocks(selectors)
+                    continue
 
+        yield from parse_test_blocks(
+            read_log_lines(filename, selectors),
+            selectors,
+            # A store's lines come from several segments, so they have no line numbers
+            filename if not is_store(filename) else None,
+        )
+
+
+def in_suite_order(keys: Iterable[str], suite_keys: list[str]) -> list[str]:
+    """Returns the test keys in the order of suite_keys, so results read back from runs that finished out of order (with -j or -coordinate) are listed the way a serial run lists them. Keys that aren't in the suite keep their order, after the rest."""
+    positions = {key: index for index, key in enumerate(suite_keys)}
+    return sorted(keys, key=lambda key: positions.get(key, len(positions)))
+
+
+def get_evals_dict(
+    filenames: str | list[str],
+    selectors: list[str] | None = None,
+) -> dict[str, list[TestSpecificEvalDict]]:
+    """Parses one log file, or several merged in order (e.g. one per run), into a dictionary mapping test keys to the logs and submit log of each run of that test. Lines may be legacy text or JSONL records. A folder is read as a trajectory store, and selectors (`task`, `task/test` or full keys) limit the blocks that are parsed."""
     eval_dict = {}
-    collecting = False
-    current_key = None
-    current_logs = []
-    submit = None
-
-    for line in lines:
-        line = line.strip()
-        if line.startswith("TEST BEGIN:"):
-            collecting = True
-            current_key = line.split(":")[1].strip()
-        elif line.startswith("TEST FINISH"):
-            if current_key:
-                if current_key not in eval_dict:
-                    eval_dict[current_key] = [{"logs": current_logs, "submit": submit}]
-                else:
-                    eval_dict[current_key].append(
-                        {"logs": current_logs, "submit": submit}
-                    )
-            collecting = False
-            current_key = None
-            current_logs = []
-            submit = None
-        elif collecting:
-            if line.startswith("SUBMIT"):
-                submit = line
-            else:
-                current_logs.append(line)
+
+    for block in iter_test_blocks(filenames, selectors):
+        eval_dict.setdefault(block.key, []).append(
+            {"logs": block.logs, "submit": block.submit}
+        )
 
     return eval_dict
 
 
 def generate_checkpoints_from_logs(
-    filename: str,
+    filenames: str | list[str],
+    selectors: list[str] | None = None,
 ) -> dict[str, list[list[dict[str, Any]]]]:
-    """Parses a log file into a dictionary mapping test names to a list of test trajectories, each of which is a list of checkpoints (each checkpoint is a dictionary with a url and logs)"""
-    lines = ""
-    with open(filename, "r") as file:
-        lines = file.readlines()
-
+    """Parses one log file, or several merged in order (e.g. one per run), into a dictionary mapping test names to a list of test trajectories, each of which is a list of checkpoints (each checkpoint is a dictionary with a url and Log objects). Lines may be legacy text or JSONL records. A folder is read as a trajectory store, and selectors (full keys or their prefixes) limit the blocks that are parsed."""
     full = {}
 
-    checkpoints = []
-    collecting = False
-    current_test = None
-    current_checkpoint = None
-    current_logs = []
-
-    for line in lines:
-        line = line.strip()
-        if line.startswith("TEST BEGIN"):
-            collecting = True
-            current_test = line.split(":")[1].strip()
-        elif line.startswith("NAVIGATE"):
-            # if checkpoint already exists, end it
-            if current_checkpoint:
-                checkpoints.append(
-                    {
-                        "url": current_checkpoint.split("//")[1].strip(),
-                        "logs": current_logs,
-                    }
-                )
+    for block in iter_test_blocks(filenames, selectors):
+        full.setdefault(block.key, []).append(block.checkpoints)
 
-            # create new checkpoint
-            current_checkpoint = line
-            current_logs = []
-        elif line.startswith("TEST FINISH"):
-            # if currently logging checkpoint, end it
-            if current_checkpoint:
-                checkpoints.append(
-                    {
-                        "url": current_checkpoint.split("//")[1].strip(),
-                        "logs": current_logs,
-                    }
-                )
+    return full
 
-            if current_test not in full:
-                full[current_test] = [checkpoints]
-            else:
-                full[current_test].append(checkpoints)
 
-            collecting = False
-            current_test = None
-            current_logs = []
-            checkpoints = []
-            current_checkpoint = None
-        elif collecting:
-            current_logs.append(line)
+# Seconds between checks of a followed log file: short right after new lines arrive, and
+# backing off while the file is quiet
+TAIL_POLL_MIN_INTERVAL = 0.05
+TAIL_POLL_MAX_INTERVAL = 1
 
-    return full
+
+class TailFollower:
+    """Follows a growing log file from a byte offset, so each read only costs the bytes appended since the last one. A partial last line is held back until it is complete."""
+
+    def __init__(self, filepath: str, offset: int = 0):
+        self.filepath = filepath
+        self.offset = offset
+        self.partial = b""
+        self.pending: list[str] = []
+
+    def read_new_lines(self) -> list[str]:
+        lines, self.pending = self.pending, []
+        return lines + self.read_appended_lines()
+
+    def read_appended_lines(self) -> list[str]:
+        try:
+            with open(self.filepath, "rb") as file:
+                if os.fstat(file.fileno()).st_size < self.offset:
+                    # The file was truncated or replaced, so start over
+                    self.offset = 0
+                    self.partial = b""
+                file.seek(self.offset)
+                data = file.read()
+        except FileNotFoundError:
+            return []
+
+        self.offset += len(data)
+        *lines, self.partial = (self.partial + data).split(b"\n")
+        return [line.decode() + "\n" for line in lines]
+
+    def skip_lines(self, count: int):
+        """Moves past the first count lines (e.g. a run log's header), reading them once"""
+        while count > 0:
+            new_lines = self.read_new_lines()
+            if not new_lines:
+                return
+            self.pending = new_lines[count:]
+            count -= len(new_lines)
+
+
+# Why a trial ended: the agent exited by itself, or which limit stopped it
+Termination = Literal["exit", "timeout", "line_limit", "custom_break"]
+# The frontend sends the events it has queued within FLUSH_DELAY_MS (50 ms, in
+# environment/frontend/ui/log.ts). A stopped agent gets this long to deliver them first, so
+# the events of its last actions aren't lost with its browser.
+FRONTEND_FLUSH_GRACE = 0.25
+
+
+class TrialTimings:
+    """What the limit checks saw of a trial: why it ended, and how many seconds after the agent started its first event, its first SUBMIT and its goal (the custom break, e.g. reaching the e2e goal path) arrived"""
+
+    def __init__(self):
+        self.start_time = time.time()
+        self.termination: Termination = "exit"
+        self.first_event: float | None = None
+        self.first_submit: float | None = None
+        self.goal: float | None = None
+
+    def since_start(self, timestamp: float | None = None) -> float:
+        return round((timestamp or time.time()) - self.start_time, 3)
+
+    def observe(self, lines: list[str]):
+        """Notes the events that just arrived"""
+        if lines and self.first_event is None:
+            self.first_event = self.since_start()
+        if self.first_submit is None and any(
+            kind == "event" and event_component(value) == "SUBMIT"
+            for kind, value in map(parse_trajectory_line, map(str.strip, lines))
+        ):
+            self.first_submit = self.since_start()
+
+    def observe_stats(self, stats: dict[str, Any]):
+        """Takes the times from the run's /stats, which the log server noted as it received the events"""
+        if stats["first_event_time"] is not None:
+            self.first_event = self.since_start(stats["first_event_time"])
+        if stats["first_submit_time"] is not None:
+            self.first_submit = self.since_start(stats["first_submit_time"])
+
+    def stop(self, process, termination: Termination, message: str):
+        self.termination = termination
+        if termination == "custom_break":
+            self.goal = self.since_start()
+        time.sleep(FRONTEND_FLUSH_GRACE)
+        process.terminate()
+        print(message)
+
+    def to_dict(self) -> dict[str, Any]:
+        return {
+            "termination": self.termination,
+            "first_event_seconds": self.first_event,
+            "first_submit_seconds": self.first_submit,
+            "goal_seconds": self.goal,
+        }
 
 
 def check_limits(
@@ -135,27 +562,588 @@ def check_limits(
     timeout: int | None = None,
     custom_log_break: Callable[[list[str]], bool] | None = None,
     custom_log_break_str: str | None = None,
+    timings: TrialTimings | None = None,
 ):
+    """Checks the limits against the lines appended to log_file after its first existing_lines, following the file rather than rereading it. The custom break is only rechecked when new lines arrive. What happens is recorded in timings."""
+    timings = timings if timings is not None else TrialTimings()
     start_time = time.time()
+    follower = TailFollower(log_file)
+    follower.skip_lines(existing_lines)
+    new_lines: list[str] = []
+    interval = TAIL_POLL_MIN_INTERVAL
+
     while process.poll() is None:
         if timeout is not None and time.time() - start_time > timeout:
-            process.terminate()
-            print("Process terminated due to timeout.")
+            timings.stop(process, "timeout", "Process terminated due to timeout.")
             return
 
-        with open(log_file, "r") as file:
-            lines = file.readlines()
-            if line_threshold is not None and len(lines) >= line_threshold:
-                process.terminate()
-                print("Process terminated due to excess log entries.")
-                return
-            if custom_log_break is not None and custom_log_break(
-                lines[existing_lines:]
+        appended = follower.read_new_lines()
+        if appended:
+            new_lines.extend(appended)
+            timings.observe(appended)
+            interval = TAIL_POLL_MIN_INTERVAL
+
+            if (
+                line_threshold is not None
+                and existing_lines + len(new_lines) >= line_threshold
             ):
-                process.terminate()
-                print(f"Process terminated due to: {custom_log_break_str}")
+                timings.stop(
+                    process,
+                    "line_limit",
+                    "Process terminated due to excess log entries.",
+                )
+                return
+            if custom_log_break is not None and custom_log_break(new_lines):
+                timings.stop(
+                    process,
+                    "custom_break",
+                    f"Process terminated due to: {custom_log_break_str}",
+                )
                 return
-        time.sleep(1)
+        else:
+            interval = min(interval * 2, TAIL_POLL_MAX_INTERVAL)
+
+        time.sleep(interval)
+
+    # The agent exited, possibly before its last events were read
+    timings.observe(follower.read_new_lines())
+
+
+class LogStreamClient:
+    """Follows a run's events through the log server's /log/stream long-poll, so limits can fire as soon as an event is committed"""
+
+    def __init__(self, run_id: str, port: int = LOG_SERVER_PORT):
+        self.run_id = run_id
+        self.port = port
+        self.since = 0
+
+    def poll(self, timeout: float) -> list[str]:
+        """Returns the events committed since the last poll, waiting up to timeout seconds for at least one"""
+        query = urllib.parse.urlencode(
+            {"run": self.run_id, "since": self.since, "timeout": timeout}
+        )
+        with urllib.request.urlopen(
+            f"http://127.0.0.1:{self.port}/log/stream?{query}", timeout=timeout + 5
+        ) as response:
+            data = json.load(response)
+
+        self.since = data["next"]
+        return [event["log"] for event in data["events"]]
+
+
+def check_limits_from_stream(
+    process,
+    run_id: str,
+    log_file: str,
+    existing_lines: int,
+    line_threshold: int | None,
+    timeout: int | None = None,
+    custom_log_break: Callable[[list[str]], bool] | None = None,
+    custom_log_break_str: str | None = None,
+    timings: TrialTimings | None = None,
+):
+    """Same limits as check_limits, but driven by the run's event stream rather than rereading log_file. Falls back to check_limits if the log server can't be reached."""
+    timings = timings if timings is not None else TrialTimings()
+    start_time = time.time()
+    client = LogStreamClient(run_id)
+    new_lines: list[str] = []
+
+    while process.poll() is None:
+        elapsed = time.time() - start_time
+        if timeout is not None and elapsed > timeout:
+            timings.stop(process, "timeout", "Process terminated due to timeout.")
+            return
+
+        poll_timeout = STREAM_POLL_TIMEOUT
+        if timeout is not None:
+            poll_timeout = max(0, min(poll_timeout, timeout - elapsed))
+
+        try:
+            appended = client.poll(poll_timeout)
+        except (urllib.error.URLError, OSError) as e:
+            print(f"    Unable to stream logs ({e}), rereading the log file instead")
+            check_limits(
+                process,
+                log_file,
+                existing_lines,
+                line_threshold,
+                None if timeout is None else max(0, timeout - elapsed),
+                custom_log_break,
+                custom_log_break_str,
+                timings,
+            )
+            return
+
+        new_lines.extend(appended)
+        timings.observe(appended)
+        if (
+            line_threshold is not None
+            and existing_lines + len(new_lines) >= line_threshold
+        ):
+            timings.stop(
+                process, "line_limit", "Process terminated due to excess log entries."
+            )
+            return
+        if custom_log_break is not None and custom_log_break(new_lines):
+            timings.stop(
+                process,
+                "custom_break",
+                f"Process terminated due to: {custom_log_break_str}",
+            )
+            return
+
+    # The agent exited, possibly before its last events were streamed
+    try:
+        timings.observe(client.poll(0))
+    except (urllib.error.URLError, OSError):
+        pass
+
+
+def fetch_run_stats(run_id: str, port: int = LOG_SERVER_PORT) -> dict[str, Any]:
+    """Gets the log server's running aggregates for a run (event_count, component_counts, first_submit, last_navigate and their timestamps, and every navigated page in navigates)"""
+    query = urllib.parse.urlencode({"run": run_id})
+    with urllib.request.urlopen(
+        f"http://127.0.0.1:{port}/stats?{query}", timeout=5
+    ) as response:
+        return json.load(response)
+
+
+def check_limits_from_stats(
+    process,
+    run_id: str,
+    log_file: str,
+    existing_lines: int,
+    line_threshold: int | None,
+    timeout: int | None = None,
+    custom_log_break: Callable[[list[str]], bool] | None = None,
+    custom_log_break_str: str | None = None,
+    custom_stats_break: Callable[[dict[str, Any]], bool] | None = None,
+    timings: TrialTimings | None = None,
+):
+    """Same limits as check_limits, but checked against the run's /stats aggregates, with custom_stats_break standing in for custom_log_break. Falls back to check_limits if the log server can't be reached."""
+    timings = timings if timings is not None else TrialTimings()
+    start_time = time.time()
+
+    while process.poll() is None:
+        elapsed = time.time() - start_time
+        if timeout is not None and elapsed > timeout:
+            timings.stop(process, "timeout", "Process terminated due to timeout.")
+            return
+
+        try:
+            stats = fetch_run_stats(run_id)
+        except (urllib.error.URLError, OSError) as e:
+            print(f"    Unable to fetch stats ({e}), rereading the log file instead")
+            check_limits(
+                process,
+                log_file,
+                existing_lines,
+                line_threshold,
+                None if timeout is None else max(0, timeout - elapsed),
+                custom_log_break,
+                custom_log_break_str,
+                timings,
+            )
+            return
+
+        timings.observe_stats(stats)
+        if (
+            line_threshold is not None
+            and existing_lines + stats["event_count"] >= line_threshold
+        ):
+            timings.stop(
+                process, "line_limit", "Process terminated due to excess log entries."
+            )
+            return
+        if custom_stats_break is not None and custom_stats_break(stats):
+            timings.stop(
+                process,
+                "custom_break",
+                f"Process terminated due to: {custom_log_break_str}",
+            )
+            return
+        time.sleep(STATS_POLL_INTERVAL)
+
+    # The agent exited, possibly after the last poll
+    try:
+        timings.observe_stats(fetch_run_stats(run_id))
+    except (urllib.error.URLError, OSError):
+        pass
+
+
+# AGENT PROCESSES
+
+# Seconds between samples of an agent's process tree (memory and CPU time)
+RESOURCE_SAMPLE_INTERVAL = 0.5
+# Seconds the processes left over from an agent have to exit once signalled, before they are killed
+REAP_GRACE = 5
+
+
+# Whether this kernel lists each thread's children in /proc/<pid>/task/<tid>/children, so a process tree can be read without listing every process
+PROC_CHILDREN = os.path.exists(f"/proc/{os.getpid()}/task/{os.getpid()}/children")
+
+
+def parse_cpu_time(value: str) -> float:
+    """Parses the cumulative CPU time `ps` prints (`[DD-]HH:MM:SS` on Linux, `MM:SS.ss` on macOS) into seconds"""
+    days, _, clock = value.rpartition("-")
+    seconds = 0.0
+    for part in clock.split(":"):
+        seconds = seconds * 60 + float(part)
+    return seconds + (int(days) * 86400 if days else 0)
+
+
+def read_proc_stat(pid: int) -> tuple[int, int, float, str] | None:
+    """Returns a process's ppid, RSS (KB), CPU seconds and command from /proc/<pid>/stat, or None if it has exited or is a zombie"""
+    try:
+        with open(f"/proc/{pid}/stat", "r") as file:
+            stat = file.read()
+    except OSError:
+        return None
+
+    # Fields after the parenthesised command, which may contain spaces: state, ppid, then utime and stime at 11 and 12 and rss (in pages) at 21
+    command, _, rest = stat.partition("(")[2].rpartition(")")
+    fields = rest.split()
+    if len(fields) < 22 or fields[0] == "Z":
+        return None
+    return (
+        int(fields[1]),
+        int(fields[21]) * os.sysconf("SC_PAGE_SIZE") // 1024,
+        (int(fields[11]) + int(fields[12])) / os.sysconf("SC_CLK_TCK"),
+        command,
+    )
+
+
+def read_proc_children(pid: int) -> list[int]:
+    """Returns the children of a process from the children file of each of its threads (see PROC_CHILDREN)"""
+    children = []
+    try:
+        tids = os.listdir(f"/proc/{pid}/task")
+    except OSError:
+        return children
+
+    for tid in tids:
+        try:
+            with open(f"/proc/{pid}/task/{tid}/children", "r") as file:
+                children.extend(map(int, file.read().split()))
+        except OSError:
+            pass
+    return children
+
+
+def list_processes() -> dict[int, tuple[int, int, float, str]]:
+    """Returns the ppid, RSS (KB), CPU seconds and command of every live process, from /proc on Linux, or from `ps` without it (macOS). Zombies are left out, since they have already exited."""
+    if os.path.isdir("/proc/self"):
+        processes = {}
+        for name in os.listdir("/proc"):
+            if name.isdigit():
+                process = read_proc_stat(int(name))
+                if process is not None:
+                    processes[int(name)] = process
+        return processes
+
+    output = subprocess.run(
+        ["ps", "-A", "-o", "pid=", "-o", "ppid=", "-o", "rss=", "-o", "time="]
+        + ["-o", "stat=", "-o", "comm="],
+        capture_output=True,
+        text=True,
+    ).stdout
+
+    processes = {}
+    for line in output.splitlines():
+        fields = line.split(None, 5)
+        if len(fields) < 6 or fields[4].startswith("Z"):
+            continue
+        processes[int(fields[0])] = (
+            int(fields[1]),
+            int(fields[2]),
+            parse_cpu_time(fields[3]),
+            fields[5],
+        )
+    return processes
+
+
+class ProcessTable:
+    """Live processes (ppid, RSS in KB, CPU seconds and command) and their children, as of one sample. With PROC_CHILDREN, only the processes looked up are read from /proc; otherwise every process is listed up front."""
+
+    def __init__(self):
+        self.processes: dict[int, tuple[int, int, float, str] | None] = (
+            {} if PROC_CHILDREN else list_processes()
+        )
+        self.children: dict[int, list[int]] = {}
+        if not PROC_CHILDREN:
+            for pid, (ppid, _, _, _) in self.processes.items():
+                self.children.setdefault(ppid, []).append(pid)
+
+    def get(self, pid: int) -> tuple[int, int, float, str] | None:
+        if PROC_CHILDREN and pid not in self.processes:
+            self.processes[pid] = read_proc_stat(pid)
+        return self.processes.get(pid)
+
+    def get_children(self, pid: int) -> list[int]:
+        return read_proc_children(pid) if PROC_CHILDREN else self.children.get(pid, [])
+
+
+class ProcessTree:
+    """An agent process and all of its descendants, including the ones that start their own session (Chromium does) or outlive their parent. It only measures the tree while the agent runs: sample() records its peak RSS and CPU time (with baseline, CPU time is counted from the first sample, as for a job on a long-lived worker), and the trial's limits are enforced by the limit checks, which stop the whole tree. After the agent exits, reap_leftovers() cleans up whatever it left running."""
+
+    def __init__(self, root_pid: int, baseline: bool = False):
+        self.root_pid = root_pid
+        self.baseline = baseline
+        self.commands: dict[int, str] = {}
+        self.start_cpu_seconds: dict[int, float] | None = None if baseline else {}
+        self.last_cpu_seconds: dict[int, float] = {}
+        self.peak_rss = 0
+
+    def members(self, processes: ProcessTable) -> list[int]:
+        """Returns the live processes of the tree: the root's descendants, plus ones seen before that have since been reparented (pids that now run another command were reused, and aren't members)"""
+        members = []
+        pending = [self.root_pid] + [
+            pid
+            for pid, command in self.commands.items()
+            if (process := processes.get(pid)) is not None and process[3] == command
+        ]
+        while pending:
+            pid = pending.pop()
+            if processes.get(pid) is not None and pid not in members:
+                members.append(pid)
+                pending.extend(processes.get_children(pid))
+        return members
+
+    def sample(self) -> list[int]:
+        processes = ProcessTable()
+        members = self.members(processes)
+
+        for pid in members:
+            self.commands[pid] = processes.get(pid)[3]
+            self.last_cpu_seconds[pid] = processes.get(pid)[2]
+        if self.start_cpu_seconds is None:
+            self.start_cpu_seconds = dict(self.last_cpu_seconds)
+
+        # RSS counts pages shared between processes once per process, so this overestimates a bit
+        self.peak_rss = max(
+            self.peak_rss, sum(processes.get(pid)[1] for pid in members)
+        )
+        return members
+
+    def sample_until(self, stop: threading.Event):
+        self.sample()
+        while not stop.wait(RESOURCE_SAMPLE_INTERVAL):
+            self.sample()
+
+    def cpu_seconds(self) -> float:
+        return sum(
+            seconds - (self.start_cpu_seconds or {}).get(pid, 0)
+            for pid, seconds in self.last_cpu_seconds.items()
+        )
+
+    def signal(self, sig: int) -> list[int]:
+        """Sends sig to every live process of the tree (and the root's process group) and returns them"""
+        members = self.sample()
+        try:
+            os.killpg(self.root_pid, sig)
+        except (ProcessLookupError, PermissionError):
+            pass
+        for pid in members:
+            try:
+                os.kill(pid, sig)
+            except ProcessLookupError:
+                pass
+        return members
+
+    def reap_leftovers(self, grace: float = REAP_GRACE) -> list[str]:
+        """Post-trial cleanup: stops whatever is left of the tree once its root has exited: SIGTERM, then SIGKILL after grace. Returns the leftover processes (pid and command), which are reported as leaked, and warns about any that couldn't be killed."""
+        leftover = {
+            pid: self.commands.get(pid, "") for pid in self.signal(signal.SIGTERM)
+        }
+        deadline = time.time() + grace
+        while self.sample() and time.time() < deadline:
+            time.sleep(0.1)
+
+        if self.signal(signal.SIGKILL):
+            time.sleep(0.1)
+        for pid in self.sample():
+            print(
+                f"WARNING: agent process {pid} {self.commands[pid]} could not be killed"
+            )
+
+        return [f"{pid} {command}" for pid, command in leftover.items()]
+
+    def get_resources(self, leaked: list[str]) -> dict[str, Any]:
+        return {
+            "peak_rss_mb": round(self.peak_rss / 1024, 1),
+            "cpu_seconds": round(self.cpu_seconds(), 2),
+            "leaked_processes": len(leaked),
+        }
+
+
+class AgentProcess:
+    """A `python -m <AGENT_MODULE> <goal> <url>` process in its own session, with the parts of the subprocess.Popen interface that the limit checks use. terminate() and kill() signal its whole process tree, since Chromium starts in a session of its own and would otherwise outlive the agent."""
+
+    def __init__(self, goal: str, url: str):
+        self.popen = subprocess.Popen(
+            [sys.executable, "-m", AGENT_MODULE, goal, url], start_new_session=True
+        )
+        self.tree = ProcessTree(self.popen.pid)
+        with running_agents_lock:
+            running_agents.add(self)
+
+    def poll(self) -> int | None:
+        return self.popen.poll()
+
+    def wait(self) -> int:
+        return self.popen.wait()
+
+    def terminate(self):
+        self.tree.signal(signal.SIGTERM)
+
+    def kill(self):
+        self.tree.signal(signal.SIGKILL)
+
+    def reap_leftovers(self) -> list[str]:
+        """Reaps the agent's leftover processes once it has exited (see ProcessTree.reap_leftovers) and returns them"""
+        with running_agents_lock:
+            running_agents.discard(self)
+        return self.tree.reap_leftovers()
+
+
+# Agents started in their own session don't get the terminal's Ctrl-C, so an interrupted suite kills them itself
+running_agents: set[AgentProcess] = set()
+running_agents_lock = threading.Lock()
+
+
+def kill_running_agents():
+    with running_agents_lock:
+        agents = list(running_agents)
+    for agent in agents:
+        agent.kill()
+
+
+# AGENT WORKERS
+
+
+class AgentWorker:
+    """A long-lived `python -m <module> -worker=<socket>` process (see evaluation/worker.py) that runs jobs one at a time, so the interpreter, imports and browser are reused between trials. It is (re)started on demand."""
+
+    def __init__(self, module: str = AGENT_MODULE):
+        self.module = module
+        self.process: subprocess.Popen | None = None
+        self.connection = None
+        self.folder: str | None = None
+        self.next_job_id = 0
+
+    def start(self):
+        self.folder = tempfile.mkdtemp(prefix="agent-worker-")
+        address = os.path.join(self.folder, "socket")
+        authkey = secrets.token_hex(16)
+        self.process = subprocess.Popen(
+            [sys.executable, "-m", self.module, f"-worker={address}"],
+            env={**os.environ, "AGENT_WORKER_KEY": authkey},
+            start_new_session=True,  # so killing the group also stops its browser
+        )
+
+        deadline = time.time() + WORKER_START_TIMEOUT
+        while self.connection is None:
+            try:
+                self.connection = Client(address, authkey=authkey.encode())
+            except (FileNotFoundError, ConnectionRefusedError):
+                if self.process.poll() is not None or time.time() > deadline:
+                    self.kill()
+                    raise Exception(f"ERROR: agent worker {self.module} did not start")
+                time.sleep(0.05)
+
+        if not self.connection.poll(max(0, deadline - time.time())):
+            self.kill()
+            raise Exception(f"ERROR: agent worker {self.module} did not get ready")
+        self.connection.recv()
+
+    def run(self, goal: str | None, url: str | None) -> "WorkerJob":
+        if self.process is None or self.process.poll() is not None:
+            self.kill()
+            self.start()
+
+        self.next_job_id += 1
+        self.connection.send(
+            {"type": "job", "id": self.next_job_id, "goal": goal, "url": url}
+        )
+        return WorkerJob(self, self.next_job_id)
+
+    def kill(self):
+        if self.process is not None:
+            # The worker's group, and its browser, which runs in a session of its own
+            tree = ProcessTree(self.process.pid)
+            tree.signal(signal.SIGKILL)
+            self.process.wait()
+            tree.reap_leftovers()
+            self.process = None
+        if self.connection is not None:
+            self.connection.close()
+            self.connection = None
+        if self.folder is not None:
+            shutil.rmtree(self.folder, ignore_errors=True)
+            self.folder = None
+
+    def close(self):
+        if self.process is not None and self.process.poll() is None:
+            try:
+                self.connection.send({"type": "close"})
+                self.process.wait(timeout=WORKER_CANCEL_GRACE)
+            except (OSError, subprocess.TimeoutExpired):
+                pass
+        self.kill()
+
+
+class WorkerJob:
+    """One job on an AgentWorker, with the parts of the subprocess.Popen interface that the limit checks use. terminate() cancels the job, and kills the worker if it doesn't stop within WORKER_CANCEL_GRACE."""
+
+    def __init__(self, worker: AgentWorker, job_id: int):
+        self.worker = worker
+        self.job_id = job_id
+        self.returncode: int | None = None
+        self.cancelled_at: float | None = None
+        self.lock = threading.Lock()
+
+    def check(self, timeout: float):
+        try:
+            if self.worker.connection.poll(timeout):
+                message = self.worker.connection.recv()
+                if message["type"] == "done" and message["id"] == self.job_id:
+                    self.returncode = 0
+                    return
+        except (EOFError, OSError):
+            # The worker died mid-job, like a crashed agent process
+            self.worker.kill()
+            self.returncode = 1
+            return
+
+        if (
+            self.cancelled_at is not None
+            and time.time() - self.cancelled_at > WORKER_CANCEL_GRACE
+        ):
+            self.worker.kill()
+            self.returncode = -signal.SIGKILL
+
+    def poll(self) -> int | None:
+        with self.lock:
+            if self.returncode is None:
+                self.check(0)
+            return self.returncode
+
+    def wait(self) -> int:
+        while True:
+            with self.lock:
+                if self.returncode is None:
+                    self.check(0.1)
+                if self.returncode is not None:
+                    return self.returncode
+
+    def terminate(self):
+        with self.lock:
+            if self.returncode is None and self.cancelled_at is None:
+                try:
+                    self.worker.connection.send({"type": "cancel", "id": self.job_id})
+                except OSError:
+                    pass  # the worker died, which check() picks up
+                self.cancelled_at = time.time()
 
 
 def run_agent_with_limits(
@@ -167,8 +1155,12 @@ def run_agent_with_limits(
     addl_lines: int | None = None,
     custom_log_break: Callable[[list[str]], bool] | None = None,
     custom_log_break_str: str | None = None,
-):
-    command = f"""python -m evaluation.agent "{goal}" "{url}" """
+    run_id: str | None = None,
+    custom_stats_break: Callable[[dict[str, Any]], bool] | None = None,
+    limits_from: Literal["stream", "stats"] = "stream",
+    worker: AgentWorker | None = None,
+) -> dict[str, Any]:
+    """Runs the agent until it exits or hits a limit. With a run_id, limits are checked against the run's event stream (or with limits_from="stats", its /stats aggregates) instead of by polling log_file. With a worker, the agent runs as a job on that long-lived process instead of a new one. Returns why it ended and when its first event, first SUBMIT and goal arrived (see TrialTimings), along with the peak RSS and CPU seconds of the agent's whole process tree and how many of its processes were left over once it exited (which are killed)."""
     # if addl_lines is not None:
     if addl_lines:
         print(f"    Running with log line threshold of {addl_lines}")
@@ -177,30 +1169,128 @@ def run_agent_with_limits(
     if custom_log_break:
         print(f"    Running with custom log break: {custom_log_break_str}")
 
-    process = subprocess.Popen(command, shell=True)
-
-    # Start thread to monitor the log file
-    log_thread = threading.Thread(
-        target=check_limits,
-        args=(
-            process,
-            log_file,
-            existing_lines,
-            (addl_lines + existing_lines) if addl_lines is not None else None,
-            timeout,
-            custom_log_break,
-            custom_log_break_str,
-        ),
+    timings = TrialTimings()
+    if worker is not None:
+        process = worker.run(goal, url)
+        tree = ProcessTree(worker.process.pid, baseline=True)
+    else:
+        process = AgentProcess(goal, url)
+        tree = process.tree
+
+    # Sample the agent's memory and CPU time while it runs
+    stop_sampling = threading.Event()
+    sampler_thread = threading.Thread(target=tree.sample_until, args=(stop_sampling,))
+    sampler_thread.start()
+
+    # Start thread to monitor the log file (or the run's event stream or stats)
+    limit_args = (
+        existing_lines,
+        (addl_lines + existing_lines) if addl_lines is not None else None,
+        timeout,
+        custom_log_break,
+        custom_log_break_str,
     )
+    if run_id is None:
+        target, args = check_limits, (process, log_file, *limit_args, timings)
+    elif limits_from == "stats" and (
+        custom_log_break is None or custom_stats_break is not None
+    ):
+        target = check_limits_from_stats
+        args = (process, run_id, log_file, *limit_args, custom_stats_break, timings)
+    else:
+        target = check_limits_from_stream
+        args = (process, run_id, log_file, *limit_args, timings)
+    log_thread = threading.Thread(target=target, args=args)
     log_thread.start()
 
-    process.wait()
-    log_thread.join()
+    try:
+        process.wait()
+        log_thread.join()
+    finally:
+        if process.poll() is None:
+            process.terminate()
+        stop_sampling.set()
+        sampler_thread.join()
+
+    if worker is not None:
+        leaked = []
+        if worker.process is not None:
+            tree.sample()
+    else:
+        leaked = process.reap_leftovers()
+        if leaked:
+            print(f"WARNING: killed {len(leaked)} processes the agent left behind:")
+            for description in leaked:
+                print("    " + description)
+
+    return {**tree.get_resources(leaked), **timings.to_dict()}
     # else:
     #     process = subprocess.Popen(command, shell=True)
     #     process.wait()
 
 
+# RUNNING TRIALS
+
+
+def iter_finished_trials(
+    run_trial: Callable[[int, queue.Queue | None], tuple[str, dict[str, Any]]],
+    expected_durations: list[float],
+    num_workers: int,
+    use_workers: bool = False,
+) -> Iterator[tuple[int, str, dict[str, Any]]]:
+    """Runs the trials on up to num_workers agents at once, longest expected first, and yields each one's index, block and what the RunJournal records about it as soon as it finishes. run_trial(index, workers) runs a trial (on a free worker from workers, with use_workers) and returns its run id and that record."""
+    workers = None
+    if use_workers:
+        workers = queue.Queue()
+        for _ in range(num_workers):
+            workers.put(AgentWorker())
+
+    try:
+        with ThreadPoolExecutor(max_workers=num_workers) as executor:
+            futures = {
+                executor.submit(run_trial, index, workers): index
+                for index in schedule(expected_durations)
+            }
+            try:
+                for future in as_completed(futures):
+                    run_id, trial = future.result()
+                    yield futures[future], close_run_log(run_id), trial
+            except BaseException:
+                # e.g. Ctrl-C, which the agents don't get as they run in their own sessions, so stop them before the executor waits for their trials
+                executor.shutdown(wait=False, cancel_futures=True)
+                while not all(future.done() for future in futures):
+                    kill_running_agents()
+                    time.sleep(0.1)
+                raise
+    finally:
+        while workers is not None and not workers.empty():
+            workers.get().close()
+
+
+def record_trials(
+    trials: list[tuple[str, int]],
+    finished: Generator[tuple[int, str, dict[str, Any]], None, None],
+    destination: str | TrajectoryStore,
+    durations: DurationHistory | None = None,
+) -> list[str]:
+    """Appends the block of each finished trial (index, block and record, as from iter_finished_trials or Coordinator.run) to the destination and records its (test key, repetition) from trials in the RunJournal and durations as soon as it arrives, so an interrupted suite keeps every trial that finished. Blocks are appended in the order they finish; the evaluation puts the tests back in suite order. Returns the blocks in trial order."""
+    journal = RunJournal(destination)
+    blocks = [""] * len(trials)
+
+    try:
+        for index, block, trial in finished:
+            key, repetition = trials[index]
+            journal.record(key, repetition, append_block(block, destination), trial)
+            if durations is not None:
+                durations.record(key.strip(), trial["seconds"])
+            blocks[index] = block
+    finally:
+        # Stops the trials still running if recording one failed (or was interrupted)
+        finished.close()
+
+    return blocks
+
+
 class PassStats:
     def __init__(self):
         self.pass_count = 0
@@ -0,0 +1,63 @@
+"""The agent side of AgentWorker (evaluation/utils.py): a long-lived agent process that takes jobs over a local socket and reuses its interpreter and setup (e.g. the browser) between them.
+
+Messages to the worker are {"type": "job", "id", "goal", "url"}, {"type": "cancel", "id"} and {"type": "close"}. The worker replies {"type": "ready"} once set up and {"type": "done", "id"} after each job. A job with no goal does nothing, which is used to measure dispatch overhead.
+"""
+
+import os
+import queue
+import threading
+import traceback
+from multiprocessing.connection import Listener
+from typing import Any, Callable
+
+
+def serve(
+    address: str,
+    setup: Callable[[], Any],
+    run_job: Callable[[Any, str, str, Callable[[], bool]], None],
+):
+    """Serves jobs on the unix socket at address until told to close. run_job(state, goal, url, should_stop) gets the state from setup() and should return soon after should_stop() turns true."""
+    listener = Listener(address, authkey=os.environ["AGENT_WORKER_KEY"].encode())
+    connection = listener.accept()
+
+    state = setup()
+    connection.send({"type": "ready"})
+
+    jobs = queue.Queue()
+    cancelled = set()
+
+    # Reads messages while a job runs, so cancellation reaches it
+    def read_messages():
+        while True:
+            try:
+                message = connection.recv()
+            except EOFError:
+                message = {"type": "close"}
+
+            if message["type"] == "job":
+                jobs.put(message)
+            elif message["type"] == "cancel":
+                cancelled.add(message["id"])
+            elif message["type"] == "close":
+                jobs.put(None)
+                return
+
+    threading.Thread(target=read_messages, daemon=True).start()
+
+    while (job := jobs.get()) is not None:
+        if job["goal"] is not None:
+            try:
+                run_job(
+                    state,
+                    job["goal"],
+                    job["url"],
+                    lambda job_id=job["id"]: job_id in cancelled,
+                )
+            except Exception:
+                # A failed job ends like a crashed agent process, without taking the worker down
+                traceback.print_exc()
+
+        connection.send({"type": "done", "id": job["id"]})
+
+    connection.close()
+    listener.close()
@@ -10,6 +10,19 @@ cleanup() {
 # Trap the SIGINT signal (Ctrl+C) and call the cleanup function
 trap 'cleanup' SIGINT
 
+# Pass -prod to run the log server with a multi-threaded production server and the
+# frontend from a production build, and -direct to have the frontend post events
+# straight to the log server
+SERVER_ARGS=""
+for arg in "$@"; do
+    if [ "$arg" = "-prod" ]; then
+        SERVER_ARGS="-prod"
+    fi
+    if [ "$arg" = "-direct" ]; then
+        export LOG_DIRECT=1
+    fi
+done
+
 # Store the process group ID
 PGID=$$
 echo "Process Group ID: $PGID"
@@ -17,12 +30,24 @@ echo "Process Group ID: $PGID"
 # Start the Flask backend
 cd environment
 echo "Starting Python server..."
-python app.py &
+python app.py $SERVER_ARGS &
 
-# Start the Next.js frontend
+# Start the Next.js frontend. With -prod, serve a production build so pages aren't
+# compiled on their first visit.
 cd frontend
-echo "Starting NPM server..."
-npm run dev &
+if [ "$SERVER_ARGS" = "-prod" ]; then
+    echo "Building NPM app..."
+    npm run build
+    echo "Starting NPM server..."
+    npm run start &
+else
+    echo "Starting NPM server..."
+    npm run dev &
+fi
+
+# Visit every page the harness uses, so the environment is warm before tests start
+cd ../..
+python -m evaluation.prewarm
 
 # Wait for both processes to exit
 wait
\ No newline at end of file